@@ -1,12 +1,21 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
+from django.db.models import OuterRef
 from django.utils.html import format_html
+from cart.models import CartItem
+from fashion_store.admin_mixins import AnnotatedAdminMixin, annotated_display, subquery_count
+from orders.models import Order
 from .models import User, UserAddress
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(AnnotatedAdminMixin, BaseUserAdmin):
     """Административная панель для пользователей"""
+
+    list_annotations = {
+        'orders_total': subquery_count(Order.objects.filter(user=OuterRef('pk'))),
+        'cart_items_total': subquery_count(CartItem.objects.filter(cart__user=OuterRef('pk'))),
+    }
     
     list_display = (
         'email', 'name', 'phone', 'is_active', 'is_staff', 
@@ -55,10 +64,9 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
     
-    @admin.display(description=_('Количество заказов'))
-    def get_orders_count(self, obj):
+    @annotated_display('orders_total', description=_('Количество заказов'))
+    def get_orders_count(self, obj, count):
         """Возвращает количество заказов пользователя"""
-        count = obj.orders.count()
         if count > 0:
             return format_html(
                 '<a href="{}?user__id__exact={}">{}</a>',
@@ -68,13 +76,10 @@ class UserAdmin(BaseUserAdmin):
             )
         return count
     
-    @admin.display(description=_('Товары в корзине'))
-    def get_cart_items_count(self, obj):
+    @annotated_display('cart_items_total', description=_('Товары в корзине'))
+    def get_cart_items_count(self, obj, count):
         """Возвращает количество товаров в корзине пользователя"""
-        try:
-            return obj.cart.get_items_count()
-        except:
-            return 0
+        return count
 
 @admin.register(UserAddress)
 class UserAddressAdmin(admin.ModelAdmin):
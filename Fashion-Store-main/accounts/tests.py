@@ -1,6 +1,12 @@
+from decimal import Decimal
+
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from cart.models import Cart, CartItem
+from catalog.models import Category, Product, ProductVariant
+from fashion_store.testing import AdminChangelistQueriesMixin
+from orders.models import Order
 from .models import UserAddress
 
 User = get_user_model()
@@ -122,3 +128,29 @@ class AccountViewsTest(TestCase):
         address.refresh_from_db()
         self.assertEqual(address.address_line, 'New Address')
         self.assertEqual(address.city, 'New City')
+
+
+class UserAdminChangelistTest(AdminChangelistQueriesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name='Одежда', slug='clothes')
+        product = Product.objects.create(name='Футболка', category=category, base_price=Decimal('999.00'))
+        self.variants = [
+            ProductVariant.objects.create(product=product, size=size, color='Red', price=Decimal('999.00'))
+            for size in ('S', 'M', 'L')
+        ]
+
+    def add_users(self, count):
+        for i in range(count):
+            user = User.objects.create_user(email=f'user{User.objects.count()}@example.com', password='pass')
+            Order.objects.create(user=user, total_amount=Decimal('999.00'))
+            Order.objects.create(user=user, total_amount=Decimal('999.00'))
+            cart = Cart.objects.create(user=user)
+            for variant in self.variants:
+                CartItem.objects.create(cart=cart, variant=variant)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        response = self.assert_queries_do_not_grow(reverse('admin:accounts_user_changelist'), self.add_users)
+        counts = {(u.orders_total, u.cart_items_total) for u in response.context['cl'].result_list if not u.is_superuser}
+        # Подзапросы не перемножают строки двух связей
+        self.assertEqual(counts, {(2, 3)})
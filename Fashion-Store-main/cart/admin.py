@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
 from django.db.models import Sum, Count
-from .models import Cart, CartItem
+from .models import Cart, CartItem, StockReservation
+from .summary import cart_changed, get_cart_summaries
 
 class CartItemInline(admin.TabularInline):
     """Inline для товаров в корзине"""
@@ -37,6 +38,7 @@ class CartAdmin(admin.ModelAdmin):
     )
     ordering = ('user',)
     list_display_links = ('user',)
+    list_select_related = ('user',)
     
     # Поля только для чтения
     readonly_fields = (
@@ -64,6 +66,14 @@ class CartAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_changelist_instance(self, request):
+        """Итоги корзин страницы — из кэша, промахи одним запросом"""
+        changelist = super().get_changelist_instance(request)
+        summaries = get_cart_summaries([cart.user_id for cart in changelist.result_list])
+        for cart in changelist.result_list:
+            cart.summary = summaries[cart.user_id]
+        return changelist
+    
     @admin.display(description=_('Количество товаров'))
     def get_items_count(self, obj):
         """Возвращает количество товаров в корзине"""
@@ -144,6 +154,13 @@ class CartItemAdmin(admin.ModelAdmin):
         }),
     )
     
+    def delete_queryset(self, request, queryset):
+        """Массовое удаление не сбрасывает итоги корзин сигналом — сбрасываем сами"""
+        user_ids = set(queryset.values_list('cart__user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for user_id in user_ids:
+            cart_changed(user_id)
+    
     @admin.display(description=_('Название товара'))
     def get_product_name(self, obj):
         """Возвращает название товара"""
@@ -163,3 +180,25 @@ class CartItemAdmin(admin.ModelAdmin):
     def get_subtotal_display(self, obj):
         """Возвращает стоимость товара с учетом количества"""
         return obj.subtotal
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    """Административная панель для резервов товаров (только чтение)"""
+
+    list_display = ('variant', 'cart', 'quantity', 'expires_at')
+    list_filter = ('expires_at',)
+    search_fields = ('cart__user__email', 'variant__product__name', 'variant__sku')
+    ordering = ('expires_at',)
+    list_select_related = ('variant__product', 'cart__user')
+    readonly_fields = ('cart', 'variant', 'quantity', 'expires_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # Снятие резерва должно уменьшить счётчик — через cart.reservations
+        return False
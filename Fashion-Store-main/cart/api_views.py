@@ -1,10 +1,43 @@
+from contextlib import ExitStack
+
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from . import reservations
 from .models import Cart, CartItem
+from .store import get_store, user_owner
 from catalog.models import ProductVariant
 from .serializers import CartSerializer, CartItemSerializer
+from fashion_store.dynamic_fields import ShapedQuerysetMixin
+
+
+class CartStoreMixin:
+    """Вьюсеты читают и меняют таблицы корзин напрямую: перед этим
+    несохранённые изменения из хранилища корзин записываются в БД,
+    а после записи копия в хранилище сбрасывается. Изменяющий запрос
+    держит блокировку корзины (store.locked) от записи до сброса"""
+
+    @property
+    def cart_owner(self):
+        return user_owner(self.request.user.pk)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        store = get_store()
+        if request.method not in permissions.SAFE_METHODS:
+            self._cart_lock = ExitStack()
+            self._cart_lock.enter_context(store.locked(self.cart_owner))
+        self._cart_fields = store.persist(self.cart_owner)
 
-class CartViewSet(viewsets.ModelViewSet):
+    def finalize_response(self, request, response, *args, **kwargs):
+        cart_lock = getattr(self, '_cart_lock', None)
+        if cart_lock is not None:
+            with cart_lock:
+                get_store().forget(self.cart_owner, self._cart_fields)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class CartViewSet(CartStoreMixin, ShapedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -14,7 +47,7 @@ class CartViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(CartStoreMixin, ShapedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = CartItemSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -26,7 +59,28 @@ class CartItemViewSet(viewsets.ModelViewSet):
         qty = int(request.data.get('quantity', 1))
         variant = ProductVariant.objects.get(id=variant_id)
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        item, created = CartItem.objects.get_or_create(cart=cart, variant=variant)
-        item.quantity = item.quantity + qty if not created else qty
-        item.save()
+        item = CartItem.objects.filter(cart=cart, variant=variant).first()
+        quantity = (item.quantity if item else 0) + qty
+        if not reservations.hold(cart.pk, variant.id, quantity, variant.stock):
+            return Response(
+                {'detail': 'Недостаточно товара на складе',
+                 'available': reservations.available_quantity(variant.id, variant.stock)},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if item:
+            item.quantity = quantity
+            item.save()
+        else:
+            item = CartItem.objects.create(cart=cart, variant=variant, quantity=quantity)
         return Response(CartItemSerializer(item).data, status=status.HTTP_201_CREATED)
+
+    def perform_update(self, serializer):
+        item = serializer.instance
+        quantity = serializer.validated_data.get('quantity', item.quantity)
+        if not reservations.hold(item.cart_id, item.variant_id, quantity, item.variant.stock):
+            raise ValidationError({'quantity': 'Недостаточно товара на складе'})
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        reservations.release(instance.cart_id, [instance.variant_id])
+        instance.delete()
@@ -0,0 +1,13 @@
+from django.utils.functional import SimpleLazyObject
+
+from .store import get_store, request_owner
+from .summary import EMPTY
+
+
+def cart_summary(request):
+    """Итоги корзины для значка в шапке; считаются, только если шаблон их выводит"""
+    def summary():
+        owner = request_owner(request)
+        return get_store().summary(owner) if owner else EMPTY
+
+    return {'cart_summary': SimpleLazyObject(summary)}
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_alter_cart_options_alter_cartitem_options_and_more'),
+        ('catalog', '0017_export_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(help_text='Сколько единиц удерживается', verbose_name='Количество')),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='После этого времени удержание снимается', verbose_name='Действует до')),
+                ('cart', models.ForeignKey(help_text='Корзина, за которой удерживается товар', on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='cart.cart', verbose_name='Корзина')),
+                ('variant', models.ForeignKey(help_text='Удерживаемый вариант товара', on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='catalog.productvariant', verbose_name='Вариант товара')),
+            ],
+            options={
+                'verbose_name': 'Резерв товара',
+                'verbose_name_plural': 'Резервы товаров',
+                'db_table': 'cart_stockreservation',
+                'unique_together': {('cart', 'variant')},
+            },
+        ),
+    ]
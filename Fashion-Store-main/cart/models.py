@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from accounts.models import User
 from catalog.models import ProductVariant
@@ -29,44 +30,42 @@ class Cart(models.Model):
     def __str__(self):
         return f"Корзина {self.user.get_short_name()}"
 
+    @cached_property
+    def summary(self):
+        """Итоги корзины одним запросом (кэшируются, см. cart.summary)"""
+        from .summary import get_cart_summary
+        return get_cart_summary(self.user_id)
+
     def get_items_count(self):
         """Возвращает количество товаров в корзине"""
-        return self.items.count()
+        return self.summary.items_count
 
     def get_total_quantity(self):
         """Возвращает общее количество товаров"""
-        return sum(item.quantity for item in self.items.all())
+        return self.summary.total_quantity
 
     def get_subtotal(self):
         """Возвращает сумму без скидки"""
-        return sum(item.subtotal for item in self.items.all())
+        return self.summary.subtotal
 
     def get_discount_amount(self):
         """Возвращает сумму скидки"""
-        from orders.models import Coupon
-        if self.coupon_code:
-            try:
-                coupon = Coupon.objects.get(code__iexact=self.coupon_code, active=True)
-                return coupon.apply(self.get_subtotal())
-            except Coupon.DoesNotExist:
-                return 0
-        return 0
+        return self.summary.discount
 
     def get_total(self):
         """Возвращает итоговую сумму с учетом скидки"""
-        subtotal = self.get_subtotal()
-        discount = self.get_discount_amount()
-        return max(0, subtotal - discount)
+        return self.summary.total
 
     def is_empty(self):
         """Проверяет, пуста ли корзина"""
-        return self.items.count() == 0
+        return self.summary.is_empty()
 
     def clear(self):
         """Очищает корзину"""
         self.items.all().delete()
         self.coupon_code = ''
         self.save()
+        self.__dict__.pop('summary', None)
 
 class CartItem(models.Model):
     """Модель товара в корзине"""
@@ -138,3 +137,40 @@ class CartItem(models.Model):
             self.delete()
             return True
         return False
+
+
+class StockReservation(models.Model):
+    """Временное удержание остатка варианта за корзиной"""
+
+    cart = models.ForeignKey(
+        Cart,
+        verbose_name=_("Корзина"),
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        help_text=_("Корзина, за которой удерживается товар")
+    )
+    variant = models.ForeignKey(
+        ProductVariant,
+        verbose_name=_("Вариант товара"),
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        help_text=_("Удерживаемый вариант товара")
+    )
+    quantity = models.PositiveIntegerField(
+        verbose_name=_("Количество"),
+        help_text=_("Сколько единиц удерживается")
+    )
+    expires_at = models.DateTimeField(
+        verbose_name=_("Действует до"),
+        db_index=True,
+        help_text=_("После этого времени удержание снимается")
+    )
+
+    class Meta:
+        verbose_name = _("Резерв товара")
+        verbose_name_plural = _("Резервы товаров")
+        unique_together = ('cart', 'variant')
+        db_table = 'cart_stockreservation'
+
+    def __str__(self):
+        return f"{self.variant} x{self.quantity} до {self.expires_at:%H:%M}"
@@ -0,0 +1,165 @@
+"""Временные резервы остатков за корзинами.
+
+При добавлении в корзину товар удерживается на RESERVATION_TTL: другие
+покупатели видят остаток за вычетом чужих резервов и не могут положить
+в корзину последние единицы, которые уже кто-то держит.
+
+Сумма резервов по варианту хранится счётчиком в кэше (Redis): проверка
+при добавлении в корзину — это один INCR без блокировок строки варианта
+в БД, что важно во время распродаж, когда один вариант берут все сразу.
+Источник истины — строки StockReservation: если счётчик вытеснен или
+истёк, он собирается заново суммой по БД.
+
+Истёкшие резервы снимает задача release_expired_reservations пачками.
+Пока резерв не снят, он продолжает действовать, поэтому при оформлении
+заказа строки, покрытые своим резервом, списываются без проверки чужих
+резервов (orders.services.place_order).
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import StockReservation
+
+RESERVATION_TTL = timedelta(minutes=15)
+HELD_KEY = 'stock_held:{}'
+# Счётчик периодически собирается заново по БД — расхождения не копятся
+COUNTER_TIMEOUT = 60 * 60
+RELEASE_BATCH_SIZE = 1000
+
+
+def _rebuild(variant_ids):
+    """Собирает счётчики заново суммой резервов в БД"""
+    totals = dict(
+        StockReservation.objects.filter(variant_id__in=variant_ids)
+        .values('variant_id').annotate(total=Sum('quantity'))
+        .values_list('variant_id', 'total')
+    )
+    for pk in variant_ids:
+        cache.add(HELD_KEY.format(pk), totals.get(pk, 0), COUNTER_TIMEOUT)
+
+
+def _adjust(variant_id, delta):
+    """Меняет счётчик на delta и возвращает новое значение.
+
+    Если счётчика нет, он собирается по БД. Уменьшения выполняются, когда
+    строки резервов уже удалены или ещё не записаны, поэтому собранная
+    сумма их уже учитывает и delta второй раз не применяется.
+    """
+    key = HELD_KEY.format(variant_id)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        _rebuild([variant_id])
+        if delta < 0:
+            return cache.get(key, 0)
+        return cache.incr(key, delta)
+
+
+def _release_counters(quantities):
+    """Уменьшает счётчики {id варианта: количество} после коммита"""
+    quantities = {pk: quantity for pk, quantity in quantities.items() if quantity}
+
+    def decrement():
+        for pk, quantity in quantities.items():
+            _adjust(pk, -quantity)
+
+    if quantities:
+        transaction.on_commit(decrement)
+
+
+def held_quantities(variant_ids):
+    """{id варианта: сколько единиц удерживается всеми корзинами}"""
+    keys = {pk: HELD_KEY.format(pk) for pk in variant_ids}
+    values = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in values]
+    if missing:
+        _rebuild(missing)
+        values.update(cache.get_many([keys[pk] for pk in missing]))
+    return {pk: values.get(key, 0) for pk, key in keys.items()}
+
+
+def available_quantity(variant_id, stock):
+    """Остаток варианта за вычетом резервов"""
+    return max(0, stock - held_quantities([variant_id])[variant_id])
+
+
+def hold(cart_id, variant_id, quantity, stock):
+    """Удерживает за корзиной quantity единиц варианта (итоговое количество строки).
+
+    stock — текущий остаток варианта. Возвращает False, если свободного
+    остатка не хватает; прежний резерв корзины при этом не меняется.
+    """
+    if quantity <= 0:
+        release(cart_id, [variant_id])
+        return True
+    expires_at = timezone.now() + RESERVATION_TTL
+    with transaction.atomic():
+        # Блокировка строки не даёт задаче очистки снять резерв, пока он меняется
+        current = (
+            StockReservation.objects.select_for_update()
+            .filter(cart_id=cart_id, variant_id=variant_id)
+            .values_list('quantity', flat=True)
+            .first()
+        ) or 0
+        delta = quantity - current
+        if delta > 0 and _adjust(variant_id, delta) > stock:
+            _adjust(variant_id, -delta)
+            return False
+        StockReservation.objects.update_or_create(
+            cart_id=cart_id, variant_id=variant_id,
+            defaults={'quantity': quantity, 'expires_at': expires_at},
+        )
+        if delta < 0:
+            _release_counters({variant_id: -delta})
+    return True
+
+
+def release(cart_id, variant_ids=None):
+    """Снимает резервы корзины (все или по указанным вариантам)"""
+    with transaction.atomic():
+        rows = StockReservation.objects.select_for_update().filter(cart_id=cart_id)
+        if variant_ids is not None:
+            rows = rows.filter(variant_id__in=variant_ids)
+        released = dict(rows.values_list('variant_id', 'quantity'))
+        if released:
+            StockReservation.objects.filter(cart_id=cart_id, variant_id__in=released).delete()
+            _release_counters(released)
+    return released
+
+
+def claim(cart_id):
+    """Забирает резервы корзины при оформлении заказа: {id варианта: количество}.
+
+    Вызывается внутри транзакции заказа: при откате резервы остаются.
+    """
+    return release(cart_id)
+
+
+def release_expired(batch_size=RELEASE_BATCH_SIZE, now=None):
+    """Снимает истёкшие резервы пачками; возвращает число снятых"""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lt=now)
+                .order_by('expires_at')
+                .values_list('pk', 'variant_id', 'quantity')[:batch_size]
+            )
+            if not rows:
+                break
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+            released = Counter()
+            for _, variant_id, quantity in rows:
+                released[variant_id] += quantity
+            _release_counters(released)
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+    return total
@@ -1,17 +1,32 @@
 from rest_framework import serializers
 from .models import Cart, CartItem
 from catalog.serializers import ProductVariantSerializer
+from fashion_store.dynamic_fields import DynamicFieldsMixin
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('variant',)
     variant = ProductVariantSerializer(read_only=True)
     variant_id = serializers.IntegerField(write_only=True)
     class Meta:
         model = CartItem
         fields = ['id','variant','variant_id','quantity','cart']
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('items',)
+    method_field_sources = {'summary': ('user',)}
     items = CartItemSerializer(many=True, read_only=True)
+    summary = serializers.SerializerMethodField()
     class Meta:
         model = Cart
-        fields = ['id','user','coupon_code','items']
+        fields = ['id','user','coupon_code','items','summary']
         read_only_fields = ['user']
+
+    def get_summary(self, obj):
+        summary = obj.summary
+        return {
+            'items_count': summary.items_count,
+            'total_quantity': summary.total_quantity,
+            'subtotal': str(summary.subtotal),
+            'discount': str(summary.discount),
+            'total': str(summary.total),
+        }
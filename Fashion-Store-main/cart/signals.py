@@ -0,0 +1,62 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from catalog.models import ProductVariant
+from . import reservations
+from .models import Cart, CartItem
+from .store import SESSION_KEY, get_store, user_owner
+from .summary import cart_changed, prices_changed
+
+
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    """Переносит гостевую корзину в корзину пользователя и резервирует её товары"""
+    if request is None or not hasattr(request, 'session'):
+        return
+    guest = request.session.pop(SESSION_KEY, None)
+    if not guest:
+        return
+    store = get_store()
+    owner = user_owner(user.pk)
+    merged = store.merge(f'anon:{guest}', owner)
+    if not merged:
+        return
+    # Гостевые корзины товар не держат; удержать не удалось — проверка будет при оформлении
+    cart_id = store.cart_id(owner)
+    lines = store.lines(owner)
+    stocks = dict(ProductVariant.objects.filter(pk__in=merged).values_list('pk', 'stock'))
+    for variant_id, stock in stocks.items():
+        reservations.hold(cart_id, variant_id, lines.get(variant_id, 0), stock)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def cart_summary_changed(sender, instance, **kwargs):
+    """Купон корзины входит в её итоги"""
+    cart_changed(instance.user_id)
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_summary_changed(sender, instance, origin=None, **kwargs):
+    """Сбрасывает итоги корзины при изменении её строки.
+
+    Массовые удаления (queryset.delete(), каскад от корзины) сбрасывают
+    итоги сами — здесь они пропускаются, чтобы не искать корзину на строку.
+    """
+    if origin is not None and origin is not instance:
+        return
+    if CartItem.cart.is_cached(instance):
+        user_id = instance.cart.user_id
+    else:
+        user_id = Cart.objects.filter(pk=instance.cart_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        cart_changed(user_id)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def cart_prices_changed(sender, instance, **kwargs):
+    """Цены вариантов входят в итоги всех корзин"""
+    prices_changed()
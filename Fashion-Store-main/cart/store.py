@@ -0,0 +1,669 @@
+"""Хранилища корзин.
+
+Корзина адресуется владельцем — строкой user:<id> для пользователя или
+anon:<uuid> для гостя (uuid хранится в сессии и переживает смену ключа
+сессии при входе). Хранилище выбирается настройкой CART_STORE:
+
+* DatabaseCartStore — таблицы cart_cart/cart_cartitem, только для
+  пользователей (поведение по умолчанию);
+* RedisCartStore — хэш Redis на корзину: добавление товара с проверкой
+  лимита — один вызов Lua-скрипта без запросов к БД. Изменённые корзины
+  пользователей попадают в множество «грязных» и записываются в
+  cart_cart/cart_cartitem задачей flush_carts (отложенная запись);
+  гостевые корзины живут только в Redis и при входе сливаются с корзиной
+  пользователя;
+* LocalCartStore — то же в памяти процесса, для тестов и разработки.
+
+Таблицы корзин остаются долговременной копией: хэш пользователя при
+первом обращении загружается из них. Код, который читает или меняет
+таблицы напрямую (API корзины, оформление заказа), сначала вызывает
+persist(owner) — сброс несохранённых изменений, а после записи —
+forget(owner, persisted), чтобы хэш загрузился заново. Весь этот отрезок
+выполняется под locked(owner): блокировка на владельца не даёт задаче
+flush_carts прочитать хэш до оформления заказа и записать его в таблицы
+после, вернув в корзину уже купленные строки. Под той же блокировкой
+меняют корзину страницы сайта (cart.web_views), поэтому строка,
+добавленная во время оформления, не пропадёт вместе со сброшенным хэшем.
+Если хэш всё же изменился после persist (блокировка истекла), forget
+переносит эти изменения в заново загруженную корзину. flush_carts
+блокировку не ждёт — занятую корзину он оставляет до следующего запуска,
+а корзины, которые не удалось записать, возвращает в «грязные».
+
+Поля хэша: «_» — признак загруженной корзины, coupon — код купона,
+cart_id — id строки cart_cart, v:<id варианта> — количество.
+"""
+import threading
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from catalog.models import ProductVariant
+from .models import Cart, CartItem
+from .summary import EMPTY, cart_changed, get_cart_summary, summarize_lines
+
+SESSION_KEY = 'cart_owner'
+LINE_PREFIX = 'v:'
+# Гостевые корзины удаляются, если к ним долго не обращались
+CART_TTL = 30 * 24 * 60 * 60
+FLUSH_BATCH_SIZE = 500
+# Сколько держится и сколько ждётся блокировка записи корзины в БД
+LOCK_TIMEOUT = 60
+
+
+class CartLockTimeout(RuntimeError):
+    """Не удалось дождаться блокировки корзины"""
+
+
+def user_owner(user_id):
+    return f'user:{user_id}'
+
+
+def owner_user_id(owner):
+    """id пользователя для user:<id>, иначе None"""
+    kind, _, value = owner.partition(':')
+    return int(value) if kind == 'user' else None
+
+
+def request_owner(request, create=False):
+    """Владелец корзины для запроса; None, если гостевые корзины недоступны"""
+    if request.user.is_authenticated:
+        return user_owner(request.user.pk)
+    if not get_store().supports_anonymous:
+        return None
+    value = request.session.get(SESSION_KEY)
+    if value is None and create:
+        value = request.session[SESSION_KEY] = uuid.uuid4().hex
+    return f'anon:{value}' if value else None
+
+
+class CartLine:
+    """Строка корзины для отображения"""
+
+    def __init__(self, variant, quantity):
+        self.variant = variant
+        self.quantity = quantity
+
+    @property
+    def id(self):
+        # Строки корзины различаются вариантом — по нему их меняют и удаляют
+        return self.variant.pk
+
+    @property
+    def subtotal(self):
+        return self.variant.price * self.quantity
+
+
+def load_lines(lines):
+    """[CartLine] по {id варианта: количество}, варианты с товарами — одним запросом"""
+    variants = ProductVariant.objects.filter(pk__in=lines).select_related('product').order_by('pk')
+    return [CartLine(variant, lines[variant.pk]) for variant in variants]
+
+
+class BaseCartStore:
+    """Интерфейс хранилища корзин"""
+
+    supports_anonymous = False
+
+    def __init__(self, **options):
+        self.options = options
+
+    def lines(self, owner):
+        """{id варианта: количество}"""
+        raise NotImplementedError
+
+    def coupon(self, owner):
+        raise NotImplementedError
+
+    def add(self, owner, variant_id, quantity, limit=None):
+        """Добавляет количество к строке; возвращает новое количество строки или
+        None, если общее количество в корзине превысило бы limit"""
+        raise NotImplementedError
+
+    def set_quantity(self, owner, variant_id, quantity):
+        raise NotImplementedError
+
+    def remove(self, owner, variant_id):
+        raise NotImplementedError
+
+    def set_coupon(self, owner, code):
+        raise NotImplementedError
+
+    def summary(self, owner):
+        """Итоги корзины (cart.summary.CartSummary)"""
+        user_id = owner_user_id(owner)
+        return get_cart_summary(user_id) if user_id is not None else EMPTY
+
+    def cart_id(self, owner):
+        """id строки cart_cart для резервов остатков; None для гостя"""
+        user_id = owner_user_id(owner)
+        if user_id is None:
+            return None
+        return Cart.objects.get_or_create(user_id=user_id)[0].pk
+
+    def merge(self, source, target):
+        """Переносит строки гостевой корзины в корзину пользователя"""
+
+    def persist(self, owner):
+        """Записывает несохранённые изменения корзины в БД; возвращает записанную копию"""
+
+    def forget(self, owner, persisted=None):
+        """Сбрасывает копию корзины после прямой записи в таблицы.
+
+        persisted — результат persist(): изменения копии, сделанные после
+        него, сохраняются.
+        """
+
+    def flush(self, batch_size=FLUSH_BATCH_SIZE):
+        """Записывает в БД изменённые корзины; возвращает их число"""
+        return 0
+
+    def locked(self, owner, blocking=True):
+        """Контекст, в котором корзину не записывает в БД никто другой.
+
+        Внутри — True, если блокировка получена (при blocking=False её
+        может держать другой процесс).
+        """
+        return nullcontext(True)
+
+
+class DatabaseCartStore(BaseCartStore):
+    """Корзины в таблицах cart_cart/cart_cartitem"""
+
+    def _cart(self, owner):
+        return Cart.objects.get_or_create(user_id=owner_user_id(owner))[0]
+
+    def lines(self, owner):
+        return dict(CartItem.objects.filter(cart__user_id=owner_user_id(owner)).values_list('variant_id', 'quantity'))
+
+    def coupon(self, owner):
+        return self._cart(owner).coupon_code
+
+    def add(self, owner, variant_id, quantity, limit=None):
+        cart = self._cart(owner)
+        if limit is not None:
+            current_total = CartItem.objects.filter(cart=cart).aggregate(total_qty=Sum('quantity'))['total_qty'] or 0
+            if current_total + quantity > limit:
+                return None
+        item, created = CartItem.objects.get_or_create(
+            cart=cart, variant_id=variant_id, defaults={'quantity': quantity}
+        )
+        if not created:
+            item.quantity += quantity
+            if item.quantity <= 0:
+                item.delete()
+            else:
+                item.save()
+        return item.quantity
+
+    def set_quantity(self, owner, variant_id, quantity):
+        user_id = owner_user_id(owner)
+        CartItem.objects.filter(cart__user_id=user_id, variant_id=variant_id).update(quantity=quantity)
+        cart_changed(user_id)
+
+    def remove(self, owner, variant_id):
+        user_id = owner_user_id(owner)
+        CartItem.objects.filter(cart__user_id=user_id, variant_id=variant_id).delete()
+        cart_changed(user_id)
+
+    def set_coupon(self, owner, code):
+        cart = self._cart(owner)
+        cart.coupon_code = code
+        cart.save()
+
+
+class HashCartStore(BaseCartStore):
+    """Корзина — хэш полей; хранение полей реализуют наследники"""
+
+    supports_anonymous = True
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        # Владельцы, чьи корзины заблокированы текущим потоком
+        self._held = threading.local()
+
+    # Примитивы хранилища
+
+    def _fields(self, owner):
+        """Все поля хэша корзины ({} — корзина не загружена)"""
+        raise NotImplementedError
+
+    def _load(self, owner, fields):
+        """Создаёт хэш, если его ещё нет"""
+        raise NotImplementedError
+
+    def _increment(self, owner, field, quantity, limit):
+        """Атомарно: None — хэша нет, -1 — превышен лимит, иначе новое значение"""
+        raise NotImplementedError
+
+    def _set(self, owner, field, value):
+        """Атомарно меняет (value=None — удаляет) поле; False — хэша нет"""
+        raise NotImplementedError
+
+    def _delete(self, owner):
+        raise NotImplementedError
+
+    def _pop_dirty(self, count):
+        raise NotImplementedError
+
+    def _clean(self, owner):
+        """Убирает корзину из множества несохранённых; True, если она там была"""
+        raise NotImplementedError
+
+    def _mark_dirty(self, owner):
+        raise NotImplementedError
+
+    def _acquire(self, owner, blocking):
+        """Блокировка записи корзины в БД: функция освобождения или None"""
+        raise NotImplementedError
+
+    # Общая логика
+
+    def _loaded_fields(self, owner):
+        fields = self._fields(owner)
+        if not fields:
+            self._load(owner, self._fields_from_db(owner))
+            fields = self._fields(owner)
+        return fields
+
+    def _fields_from_db(self, owner):
+        fields = {'_': '1'}
+        user_id = owner_user_id(owner)
+        if user_id is not None:
+            cart = Cart.objects.filter(user_id=user_id).first()
+            if cart:
+                fields['cart_id'] = str(cart.pk)
+                fields['coupon'] = cart.coupon_code
+                fields.update(
+                    (f'{LINE_PREFIX}{variant_id}', str(quantity))
+                    for variant_id, quantity in cart.items.values_list('variant_id', 'quantity')
+                )
+        return fields
+
+    def _retry(self, owner, operation):
+        result = operation()
+        if result is None:
+            self._load(owner, self._fields_from_db(owner))
+            result = operation()
+        return result
+
+    @staticmethod
+    def _parse_lines(fields):
+        return {
+            int(field[len(LINE_PREFIX):]): int(value)
+            for field, value in fields.items()
+            if field.startswith(LINE_PREFIX) and int(value) > 0
+        }
+
+    def lines(self, owner):
+        return self._parse_lines(self._loaded_fields(owner))
+
+    def coupon(self, owner):
+        return self._loaded_fields(owner).get('coupon', '')
+
+    def add(self, owner, variant_id, quantity, limit=None):
+        result = self._retry(
+            owner, lambda: self._increment(owner, f'{LINE_PREFIX}{variant_id}', quantity, limit or 0)
+        )
+        if result == -1:
+            return None
+        if result <= 0:
+            self.remove(owner, variant_id)
+        return result
+
+    def set_quantity(self, owner, variant_id, quantity):
+        self._retry(owner, lambda: self._set(owner, f'{LINE_PREFIX}{variant_id}', str(quantity)) or None)
+
+    def remove(self, owner, variant_id):
+        self._retry(owner, lambda: self._set(owner, f'{LINE_PREFIX}{variant_id}', None) or None)
+
+    def set_coupon(self, owner, code):
+        self._retry(owner, lambda: self._set(owner, 'coupon', code) or None)
+
+    def summary(self, owner):
+        fields = self._loaded_fields(owner)
+        return summarize_lines(self._parse_lines(fields), fields.get('coupon', ''))
+
+    def cart_id(self, owner):
+        if owner_user_id(owner) is None:
+            return None
+        value = self._loaded_fields(owner).get('cart_id')
+        if value is None:
+            value = super().cart_id(owner)
+            self._set(owner, 'cart_id', str(value))
+        return int(value)
+
+    def merge(self, source, target):
+        fields = self._fields(source)
+        if not fields:
+            return {}
+        lines = self._parse_lines(fields)
+        with self.locked(target):
+            for variant_id, quantity in lines.items():
+                self.add(target, variant_id, quantity)
+            if fields.get('coupon') and not self.coupon(target):
+                self.set_coupon(target, fields['coupon'])
+        self._delete(source)
+        return lines
+
+    def _write(self, owner, fields):
+        try:
+            write_cart(owner_user_id(owner), self._parse_lines(fields), fields.get('coupon', ''))
+        except Exception:
+            # Изменения не записаны — корзина остаётся среди несохранённых
+            self._mark_dirty(owner)
+            raise
+
+    def persist(self, owner):
+        if owner_user_id(owner) is None:
+            return None
+        with self.locked(owner):
+            # Пишем, даже если корзины нет среди несохранённых: её мог уже
+            # забрать flush, который ещё не дошёл до записи
+            self._clean(owner)
+            fields = self._fields(owner)
+            if fields:
+                self._write(owner, fields)
+            return fields
+
+    def forget(self, owner, persisted=None):
+        with self.locked(owner):
+            fields = self._fields(owner)
+            self._delete(owner)
+            if not persisted or not fields or fields == persisted:
+                return
+            # Корзину меняли после persist: переносим эти изменения в корзину из таблиц
+            for field, value in fields.items():
+                if field.startswith(LINE_PREFIX) and persisted.get(field) != value:
+                    self._retry(owner, lambda: self._set(owner, field, value) or None)
+            for field in persisted.keys() - fields.keys():
+                if field.startswith(LINE_PREFIX):
+                    self._retry(owner, lambda: self._set(owner, field, None) or None)
+            if fields.get('coupon', '') != persisted.get('coupon', ''):
+                self.set_coupon(owner, fields.get('coupon', ''))
+
+    def _flush_owner(self, owner):
+        """Записывает корзину в БД: True — записана, False — нечего писать, None — занята"""
+        with self.locked(owner, blocking=False) as acquired:
+            if not acquired:
+                return None
+            fields = self._fields(owner)
+            if not fields:
+                return False
+            self._write(owner, fields)
+            return True
+
+    def flush(self, batch_size=FLUSH_BATCH_SIZE):
+        count, pending = 0, []
+        try:
+            while True:
+                popped = self._pop_dirty(batch_size)
+                owners = [owner for owner in popped if owner_user_id(owner) is not None]
+                for position, owner in enumerate(owners):
+                    try:
+                        written = self._flush_owner(owner)
+                    except Exception:
+                        # Ещё не записанные корзины пачки остаются несохранёнными
+                        pending.extend(owners[position + 1:])
+                        raise
+                    if written is None:
+                        # Корзину сейчас пишет оформление заказа или API — запишем в следующий раз
+                        pending.append(owner)
+                    count += bool(written)
+                if len(popped) < batch_size:
+                    break
+        finally:
+            for owner in pending:
+                self._mark_dirty(owner)
+        return count
+
+    @contextmanager
+    def locked(self, owner, blocking=True):
+        held = self._held.__dict__.setdefault('owners', set())
+        if owner in held:
+            # Повторный вход в том же потоке (persist внутри place_order)
+            yield True
+            return
+        release = self._acquire(owner, blocking)
+        if release is None:
+            if blocking:
+                raise CartLockTimeout(owner)
+            yield False
+            return
+        held.add(owner)
+        try:
+            yield True
+        finally:
+            held.discard(owner)
+            release()
+
+
+class LocalCartStore(HashCartStore):
+    """Корзины в памяти процесса (тесты, разработка без Redis)"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._carts = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._owner_locks = {}
+
+    def _fields(self, owner):
+        with self._lock:
+            return dict(self._carts.get(owner, {}))
+
+    def _load(self, owner, fields):
+        with self._lock:
+            self._carts.setdefault(owner, dict(fields))
+
+    def _increment(self, owner, field, quantity, limit):
+        with self._lock:
+            cart = self._carts.get(owner)
+            if cart is None:
+                return None
+            total = sum(int(v) for f, v in cart.items() if f.startswith(LINE_PREFIX))
+            if limit and total + quantity > limit:
+                return -1
+            value = int(cart.get(field, 0)) + quantity
+            cart[field] = str(value)
+            self._dirty.add(owner)
+            return value
+
+    def _set(self, owner, field, value):
+        with self._lock:
+            cart = self._carts.get(owner)
+            if cart is None:
+                return False
+            if value is None:
+                cart.pop(field, None)
+            else:
+                cart[field] = value
+            self._dirty.add(owner)
+            return True
+
+    def _delete(self, owner):
+        with self._lock:
+            self._carts.pop(owner, None)
+            self._dirty.discard(owner)
+
+    def _pop_dirty(self, count):
+        with self._lock:
+            owners = [self._dirty.pop() for _ in range(min(count, len(self._dirty)))]
+        return owners
+
+    def _clean(self, owner):
+        with self._lock:
+            dirty = owner in self._dirty
+            self._dirty.discard(owner)
+            return dirty
+
+    def _mark_dirty(self, owner):
+        with self._lock:
+            self._dirty.add(owner)
+
+    def _acquire(self, owner, blocking):
+        with self._lock:
+            lock = self._owner_locks.setdefault(owner, threading.Lock())
+        if not lock.acquire(blocking, LOCK_TIMEOUT if blocking else -1):
+            return None
+        return lock.release
+
+
+# KEYS[1] — хэш корзины, KEYS[2] — множество несохранённых корзин
+# ARGV: поле, приращение, лимит (0 — без лимита), TTL, владелец
+INCREMENT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return nil end
+local limit = tonumber(ARGV[3])
+if limit > 0 then
+  local fields = redis.call('HGETALL', KEYS[1])
+  local total = 0
+  for i = 1, #fields, 2 do
+    if string.sub(fields[i], 1, 2) == 'v:' then total = total + tonumber(fields[i + 1]) end
+  end
+  if total + tonumber(ARGV[2]) > limit then return -1 end
+end
+local value = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('SADD', KEYS[2], ARGV[5])
+return value
+"""
+
+# ARGV: поле, значение ('' вместе с ARGV[4] = '1' — удалить поле), TTL, удаление, владелец
+SET_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+if ARGV[4] == '1' then
+  redis.call('HDEL', KEYS[1], ARGV[1])
+else
+  redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[5])
+return 1
+"""
+
+# ARGV: TTL, затем пары поле/значение
+LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class RedisCartStore(HashCartStore):
+    """Корзины в хэшах Redis с отложенной записью в БД"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        import redis
+
+        self.client = redis.Redis.from_url(options.get('LOCATION', 'redis://localhost:6379/0'), decode_responses=True)
+        self.prefix = options.get('KEY_PREFIX', 'cart')
+        self.ttl = options.get('TIMEOUT', CART_TTL)
+        self.dirty_key = f'{self.prefix}:dirty'
+        self._increment_script = self.client.register_script(INCREMENT_SCRIPT)
+        self._set_script = self.client.register_script(SET_SCRIPT)
+        self._load_script = self.client.register_script(LOAD_SCRIPT)
+
+    def _key(self, owner):
+        return f'{self.prefix}:{owner}'
+
+    def _fields(self, owner):
+        return self.client.hgetall(self._key(owner))
+
+    def _load(self, owner, fields):
+        args = [self.ttl]
+        for field, value in fields.items():
+            args += [field, value]
+        self._load_script(keys=[self._key(owner)], args=args)
+
+    def _increment(self, owner, field, quantity, limit):
+        return self._increment_script(
+            keys=[self._key(owner), self.dirty_key], args=[field, quantity, limit, self.ttl, owner]
+        )
+
+    def _set(self, owner, field, value):
+        return bool(self._set_script(
+            keys=[self._key(owner), self.dirty_key],
+            args=[field, value or '', self.ttl, '1' if value is None else '0', owner],
+        ))
+
+    def _delete(self, owner):
+        with self.client.pipeline() as pipe:
+            pipe.delete(self._key(owner))
+            pipe.srem(self.dirty_key, owner)
+            pipe.execute()
+
+    def _pop_dirty(self, count):
+        return self.client.spop(self.dirty_key, count) or []
+
+    def _clean(self, owner):
+        return bool(self.client.srem(self.dirty_key, owner))
+
+    def _mark_dirty(self, owner):
+        self.client.sadd(self.dirty_key, owner)
+
+    def _acquire(self, owner, blocking):
+        from redis.exceptions import LockError
+
+        # Блокировка истекает сама, если процесс упал, не освободив её
+        lock = self.client.lock(
+            f'{self.prefix}:lock:{owner}', timeout=LOCK_TIMEOUT, blocking=blocking, blocking_timeout=LOCK_TIMEOUT,
+        )
+        if not lock.acquire():
+            return None
+
+        def release():
+            try:
+                lock.release()
+            except LockError:
+                pass  # истекла — её уже мог взять другой процесс
+
+        return release
+
+
+def write_cart(user_id, lines, coupon=''):
+    """Записывает корзину пользователя в cart_cart/cart_cartitem"""
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user_id=user_id)
+        if cart.coupon_code != coupon:
+            Cart.objects.filter(pk=cart.pk).update(coupon_code=coupon)
+        # Вариант могли удалить, пока корзина ждала записи
+        existing = set(ProductVariant.objects.filter(pk__in=lines).values_list('pk', flat=True))
+        lines = {pk: quantity for pk, quantity in lines.items() if pk in existing}
+        CartItem.objects.filter(cart=cart).exclude(variant_id__in=lines).delete()
+        unique_fields = ('cart', 'variant')
+        if not connection.features.supports_update_conflicts_with_target:
+            unique_fields = None
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, variant_id=pk, quantity=quantity) for pk, quantity in lines.items()],
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=('quantity',),
+        )
+        cart_changed(user_id)
+    return cart
+
+
+_stores = {}
+
+
+def get_store():
+    """Хранилище корзин из настройки CART_STORE"""
+    config = getattr(settings, 'CART_STORE', {'BACKEND': 'cart.store.DatabaseCartStore'})
+    key = repr(sorted(config.items()))
+    if key not in _stores:
+        options = {name: value for name, value in config.items() if name != 'BACKEND'}
+        _stores[key] = import_string(config['BACKEND'])(**options)
+    return _stores[key]
+
+
+@receiver(setting_changed)
+def reset_stores(setting, **kwargs):
+    if setting == 'CART_STORE':
+        _stores.clear()
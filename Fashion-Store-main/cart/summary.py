@@ -0,0 +1,141 @@
+"""Итоги корзины: количество строк и товаров, суммы и скидка.
+
+Итоги корзины пользователя считаются одним агрегатным запросом по
+cart_cart с join строк и цен вариантов и кэшируются на пользователя
+(корзина у пользователя одна). Изменения строк и купона корзины
+сбрасывают запись сигналами (cart.signals), массовые записи в таблицы
+корзин — явно через cart_changed(). Цены вариантов входят в поколение
+'cart:prices': их изменение делает устаревшими все записи сразу. Сигналы
+вариантов увеличивают его сами; код, который меняет цены массово
+(bulk_create, update — например, catalog.importer), вызывает
+prices_changed() явно.
+
+Итоги корзины в хэш-хранилище (cart.store) считаются по её строкам и
+кэшируются по содержимому, поэтому сбрасывать их не нужно.
+
+В кэше лежат только суммы по строкам. Скидка применяется при каждом
+чтении по купону из orders.coupons (купоны в памяти процесса), поэтому
+срок действия и отключение купона учитываются сразу.
+"""
+import hashlib
+from collections import namedtuple
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+
+from catalog.models import ProductVariant
+from fashion_store.cache import get_generation, invalidate
+from orders.coupons import normalize_code, resolve_coupons
+from .models import Cart
+
+PRICES_GENERATION = 'cart:prices'
+CACHE_KEY = 'cart_summary:{}:{}'
+LINES_CACHE_KEY = 'cart_summary:{}:lines:{}'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+ZERO = Decimal('0.00')
+
+
+class CartSummary(namedtuple('CartSummary', 'items_count total_quantity subtotal coupon_code discount total')):
+    """Итоги корзины; coupon_code — применённый купон ('' — купона нет или он недействителен)"""
+
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, items_count, total_quantity, subtotal, coupon_code='', coupons=None):
+        """Итоги по суммам строк; coupons — действующие купоны по нормализованному коду"""
+        subtotal = subtotal or ZERO
+        discount = ZERO
+        if coupon_code:
+            if coupons is None:
+                coupons = resolve_coupons([coupon_code])
+            coupon = coupons.get(normalize_code(coupon_code))
+            if coupon:
+                discount = coupon.apply(subtotal)
+            else:
+                coupon_code = ''
+        return cls(
+            items_count or 0, total_quantity or 0, subtotal, coupon_code,
+            discount, max(ZERO, subtotal - discount),
+        )
+
+    def is_empty(self):
+        return self.items_count == 0
+
+
+EMPTY = CartSummary(0, 0, ZERO, '', ZERO, ZERO)
+EMPTY_TOTALS = (0, 0, ZERO, '')
+
+
+def _totals(carts):
+    """Агрегаты корзин одним запросом: {id пользователя: (строк, товаров, сумма, купон)}"""
+    rows = (
+        carts.values('user_id', 'coupon_code')
+        .annotate(
+            items_count=Count('items'),
+            total_quantity=Coalesce(Sum('items__quantity'), 0),
+            subtotal=Coalesce(
+                Sum(F('items__quantity') * F('items__variant__price'), output_field=DecimalField()),
+                ZERO, output_field=DecimalField(),
+            ),
+        )
+        .order_by()
+    )
+    return {
+        row['user_id']: (row['items_count'], row['total_quantity'], row['subtotal'], row['coupon_code'])
+        for row in rows
+    }
+
+
+def get_cart_summaries(user_ids):
+    """{id пользователя: CartSummary}; суммы из кэша, промахи — одним запросом"""
+    generation = get_generation(PRICES_GENERATION)
+    keys = {user_id: CACHE_KEY.format(generation, user_id) for user_id in user_ids}
+    cached = cache.get_many(keys.values())
+    totals = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+    missing = [user_id for user_id in keys if user_id not in totals]
+    if missing:
+        fresh = _totals(Cart.objects.filter(user_id__in=missing))
+        fresh.update((user_id, EMPTY_TOTALS) for user_id in missing if user_id not in fresh)
+        cache.set_many({keys[user_id]: row for user_id, row in fresh.items()}, CACHE_TIMEOUT)
+        totals.update(fresh)
+    coupons = resolve_coupons(coupon_code for *_, coupon_code in totals.values())
+    return {user_id: CartSummary.build(*row, coupons=coupons) for user_id, row in totals.items()}
+
+
+def get_cart_summary(user_id):
+    """Итоги корзины пользователя"""
+    return get_cart_summaries([user_id])[user_id]
+
+
+def summarize_lines(lines, coupon_code=''):
+    """Итоги по строкам {id варианта: количество}; суммы кэшируются по содержимому"""
+    if not lines:
+        return EMPTY
+    content = repr(sorted(lines.items())).encode()
+    key = LINES_CACHE_KEY.format(get_generation(PRICES_GENERATION), hashlib.md5(content).hexdigest())
+    totals = cache.get(key)
+    if totals is None:
+        prices = dict(ProductVariant.objects.filter(pk__in=lines).values_list('pk', 'price'))
+        totals = (
+            sum(1 for pk in lines if pk in prices),
+            sum(quantity for pk, quantity in lines.items() if pk in prices),
+            sum((prices[pk] * quantity for pk, quantity in lines.items() if pk in prices), ZERO),
+        )
+        cache.set(key, totals, CACHE_TIMEOUT)
+    return CartSummary.build(*totals, coupon_code)
+
+
+def cart_changed(user_id):
+    """Сбрасывает итоги корзины пользователя сразу и после коммита"""
+    key = CACHE_KEY.format(get_generation(PRICES_GENERATION), user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def prices_changed():
+    """Цены вариантов изменились — итоги всех корзин устарели"""
+    invalidate(PRICES_GENERATION)
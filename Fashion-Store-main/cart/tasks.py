@@ -0,0 +1,16 @@
+from celery import shared_task
+
+from .reservations import release_expired
+from .store import get_store
+
+
+@shared_task
+def release_expired_reservations():
+    """Снимает истёкшие резервы остатков"""
+    return release_expired()
+
+
+@shared_task
+def flush_carts():
+    """Записывает изменённые корзины из хранилища в таблицы корзин"""
+    return get_store().flush()
@@ -0,0 +1,277 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from catalog.models import Category, Product, ProductVariant
+from catalog.variants import get_variant_matrix
+from orders.models import Coupon
+from orders.services import OutOfStockError, place_order
+from . import reservations
+from .models import Cart, CartItem, StockReservation
+from .store import get_store, user_owner
+from .summary import get_cart_summary
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Одежда", slug="clothes")
+        self.product = Product.objects.create(name="Футболка", category=category, base_price=Decimal("100.00"))
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size="M", color="Red", price=Decimal("100.00"), stock=3
+        )
+        self.first = User.objects.create_user(email="first@example.com", password="pass")
+        self.second = User.objects.create_user(email="second@example.com", password="pass")
+
+    def add(self, user, qty):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/cart/add/{self.product.id}/", {"size": "M", "color": "Red", "qty": qty})
+        return Cart.objects.get(user=user)
+
+    def test_hold_blocks_other_carts(self):
+        first_cart = self.add(self.first, 2)
+        self.assertEqual(reservations.available_quantity(self.variant.id, 3), 1)
+        second_cart = self.add(self.second, 2)
+        self.assertFalse(second_cart.items.exists())
+
+        self.client.force_login(self.second)
+        response = self.client.post("/api/cart/items/", {"variant_id": self.variant.id, "quantity": 2})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["available"], 1)
+
+        item = first_cart.items.get()
+        self.client.force_login(self.first)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/cart/remove/{item.variant_id}/")
+        self.assertEqual(reservations.available_quantity(self.variant.id, 3), 3)
+
+    def test_counter_is_rebuilt_from_database(self):
+        self.add(self.first, 2)
+        cache.clear()
+        self.assertEqual(reservations.held_quantities([self.variant.id]), {self.variant.id: 2})
+
+    def test_release_does_not_count_twice_after_counter_expired(self):
+        first_cart = self.add(self.first, 3)
+        cache.delete(reservations.HELD_KEY.format(self.variant.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.release(first_cart.pk)
+        self.assertEqual(reservations.held_quantities([self.variant.id]), {self.variant.id: 0})
+
+        self.add(self.second, 2)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        cache.delete(reservations.HELD_KEY.format(self.variant.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            reservations.release_expired()
+        self.assertEqual(reservations.held_quantities([self.variant.id]), {self.variant.id: 0})
+        self.assertEqual(reservations.available_quantity(self.variant.id, 3), 3)
+
+    def test_sweeper_releases_expired_holds_in_batches(self):
+        for user in (self.first, self.second):
+            self.add(user, 1)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            released = reservations.release_expired(batch_size=1)
+        self.assertEqual(released, 2)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(reservations.available_quantity(self.variant.id, 3), 3)
+
+    def test_checkout_converts_own_hold_and_respects_others(self):
+        self.add(self.first, 2)
+        # Корзина без резерва (например, истёкшего и уже снятого)
+        CartItem.objects.create(cart=Cart.objects.create(user=self.second), variant=self.variant, quantity=2)
+        with self.assertRaises(OutOfStockError):
+            place_order(self.second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.first)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 1)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(reservations.held_quantities([self.variant.id]), {self.variant.id: 0})
+
+    def test_line_short_because_of_other_holds_is_reported(self):
+        self.add(self.first, 2)
+        CartItem.objects.create(cart=Cart.objects.create(user=self.second), variant=self.variant, quantity=2)
+        with self.assertRaises(OutOfStockError) as error:
+            place_order(self.second)
+        self.assertEqual([(v.pk, q, a) for v, q, a in error.exception.variants], [(self.variant.pk, 2, 1)])
+        self.assertIn("доступно 1, в корзине 2", str(error.exception))
+
+        self.client.force_login(self.second)
+        response = self.client.post("/api/orders/create_from_cart/")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["variants"], [self.variant.pk])
+
+
+class CartStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Своё хранилище на каждый тест: корзины в памяти не переходят между тестами
+        self.enterContext(override_settings(CART_STORE={"BACKEND": "cart.store.LocalCartStore"}))
+        category = Category.objects.create(name="Одежда", slug="clothes")
+        self.product = Product.objects.create(name="Футболка", category=category, base_price=Decimal("100.00"))
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size="M", color="Red", price=Decimal("100.00"), stock=5
+        )
+        self.user = User.objects.create_user(email="buyer@example.com", password="pass")
+
+    def add(self, qty=1):
+        return self.client.post(f"/cart/add/{self.product.id}/", {"size": "M", "color": "Red", "qty": qty})
+
+    def test_guest_cart_is_kept_in_store(self):
+        get_variant_matrix(self.product.id)  # матрица вариантов берётся из кэша
+        with CaptureQueriesContext(connection) as queries:
+            self.add()
+        self.assertFalse([q for q in queries if "cart_" in q["sql"]])
+        self.assertContains(self.client.get("/cart/"), "Футболка")
+        # Лимит на количество товаров проверяется хранилищем
+        self.add(2)
+        owner = f"anon:{self.client.session['cart_owner']}"
+        self.assertEqual(get_store().lines(owner), {self.variant.id: 1})
+
+    def test_login_merges_guest_cart_and_flush_writes_tables(self):
+        self.add()
+        self.assertFalse(Cart.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(email="buyer@example.com", password="pass")
+        owner = user_owner(self.user.pk)
+        self.assertEqual(get_store().lines(owner), {self.variant.id: 1})
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+
+        self.assertEqual(get_store().flush(), 1)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(list(cart.items.values_list("variant_id", "quantity")), [(self.variant.id, 1)])
+        self.assertEqual(get_store().flush(), 0)
+
+    def test_api_and_checkout_see_unflushed_changes(self):
+        self.client.force_login(self.user)
+        self.add(2)
+        response = self.client.get("/api/cart/items/")
+        self.assertEqual([item["quantity"] for item in response.json()["results"]], [2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.user)
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertEqual(get_store().lines(user_owner(self.user.pk)), {})
+
+    def test_checkout_persists_cart_taken_by_running_flush(self):
+        self.client.force_login(self.user)
+        self.add(2)
+        store, owner = get_store(), user_owner(self.user.pk)
+        # flush_carts уже забрал корзину из несохранённых, но ещё не записал её
+        self.assertEqual(store._pop_dirty(10), [owner])
+        with self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.user)
+        self.assertEqual(order.items.get().quantity, 2)
+
+    def test_flush_skips_cart_locked_by_checkout(self):
+        self.client.force_login(self.user)
+        self.add(1)
+        store, owner = get_store(), user_owner(self.user.pk)
+        flushed = []
+        with store.locked(owner):
+            worker = threading.Thread(target=lambda: flushed.append(store.flush()))
+            worker.start()
+            worker.join()
+        self.assertEqual(flushed, [0])
+        self.assertFalse(CartItem.objects.exists())
+        # Занятая корзина осталась среди несохранённых
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+    def test_changes_after_persist_survive_forget(self):
+        other = ProductVariant.objects.create(
+            product=self.product, size="L", color="Red", price=Decimal("100.00"), stock=5
+        )
+        self.client.force_login(self.user)
+        self.add(1)
+        store, owner = get_store(), user_owner(self.user.pk)
+        persisted = store.persist(owner)
+        # Строка добавлена после persist (например, блокировка истекла), а купленная удалена из таблиц
+        store.add(owner, other.id, 1)
+        CartItem.objects.filter(variant=self.variant).delete()
+        store.forget(owner, persisted)
+        self.assertEqual(store.lines(owner), {other.id: 1})
+        store.flush()
+        self.assertEqual(list(CartItem.objects.values_list("variant_id", "quantity")), [(other.id, 1)])
+
+    def test_failed_flush_keeps_carts_dirty(self):
+        self.client.force_login(self.user)
+        self.add(1)
+        store = get_store()
+        with patch("cart.store.write_cart", side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            store.flush()
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+
+class CartSummaryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Одежда", slug="clothes")
+        self.variants = [
+            ProductVariant.objects.create(
+                product=Product.objects.create(name=f"Товар {i}", category=category, base_price=Decimal("100.00")),
+                size="M", color="Red", price=Decimal("100.00"), stock=5,
+            )
+            for i in range(3)
+        ]
+        Coupon.objects.create(code="SALE10", name="Скидка", discount_percent=10)
+
+    def make_cart(self, lines=3, coupon_code="sale10"):
+        user = User.objects.create_user(email=f"buyer{User.objects.count()}@example.com", password="pass")
+        cart = Cart.objects.create(user=user, coupon_code=coupon_code)
+        for variant in self.variants[:lines]:
+            CartItem.objects.create(cart=cart, variant=variant, quantity=2)
+        return cart
+
+    def test_summary_is_one_query_and_cached(self):
+        cart = self.make_cart()
+        with self.assertNumQueries(2):  # агрегаты корзины и купон
+            summary = get_cart_summary(cart.user_id)
+        self.assertEqual(
+            (summary.items_count, summary.total_quantity, summary.subtotal, summary.discount, summary.total),
+            (3, 6, Decimal("600.00"), Decimal("60.00"), Decimal("540.00")),
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_summary(cart.user_id), summary)
+
+    def test_item_and_price_changes_reset_summary(self):
+        cart = self.make_cart(lines=1, coupon_code="")
+        self.assertEqual(get_cart_summary(cart.user_id).subtotal, Decimal("200.00"))
+        CartItem.objects.create(cart=cart, variant=self.variants[1], quantity=1)
+        self.assertEqual(get_cart_summary(cart.user_id).total_quantity, 3)
+        self.variants[0].price = Decimal("150.00")
+        self.variants[0].save()
+        self.assertEqual(get_cart_summary(cart.user_id).subtotal, Decimal("400.00"))
+
+    def test_admin_changelist_and_api_read_summary(self):
+        admin_user = User.objects.create_superuser(email="admin@example.com", password="pass")
+        self.client.force_login(admin_user)
+        url = reverse("admin:cart_cart_changelist")
+        self.make_cart()
+        cache.clear()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for _ in range(5):
+            self.make_cart()
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(few), len(many))
+        self.assertContains(response, "540")
+
+        cart = self.make_cart(lines=2, coupon_code="")
+        self.client.force_login(cart.user)
+        response = self.client.get(f"/api/cart/{cart.pk}/")
+        self.assertEqual(response.json()["summary"]["total"], "400.00")
@@ -1,104 +1,113 @@
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib import messages
-from django.shortcuts import redirect, render, get_object_or_404
-from catalog.models import Product, ProductVariant
-from .models import Cart, CartItem
-from orders.models import Coupon
-from decimal import Decimal
-from django.db.models import Sum
+from django.shortcuts import redirect, render
+from functools import wraps
+from catalog.models import ProductVariant
+from catalog.variants import get_variant_matrix
+from . import reservations
+from .store import get_store, load_lines, request_owner
+from .summary import EMPTY
 
 MAX_ITEMS_IN_CART = 2
 
-def _get_cart(user):
-    cart, _ = Cart.objects.get_or_create(user=user)
-    return cart
 
-@login_required
-def view_cart(request):
-    cart = _get_cart(request.user)
-    items = cart.items.select_related('variant','variant__product')
-    subtotal = sum([i.subtotal for i in items], Decimal('0.00'))
-    discount = Decimal('0.00')
-    if cart.coupon_code:
-        try:
-            c = Coupon.objects.get(code__iexact=cart.coupon_code, active=True)
-            discount = c.apply(subtotal)
-        except Coupon.DoesNotExist:
-            messages.error(request, "Invalid coupon")
-    total = max(Decimal('0.00'), subtotal - discount)
+def cart_owner_required(view):
+    """Передаёт во view владельца корзины; гостей без гостевых корзин отправляет на вход"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        owner = request_owner(request, create=request.method == 'POST')
+        if owner is None and not get_store().supports_anonymous:
+            return redirect_to_login(request.get_full_path())
+        return view(request, owner, *args, **kwargs)
+    return wrapper
+
+
+@cart_owner_required
+def view_cart(request, owner):
+    store = get_store()
+    items = load_lines(store.lines(owner)) if owner else []
+    totals = store.summary(owner) if owner else EMPTY
+    coupon_code = store.coupon(owner) if owner else ''
+    if coupon_code and not totals.coupon_code:
+        messages.error(request, "Invalid coupon")
 
     # fetch all addresses of logged-in user
-    addresses = request.user.addresses.all()
+    addresses = request.user.addresses.all() if request.user.is_authenticated else []
 
     return render(
         request,
         'cart/cart.html',
         {
             'items': items,
-            'totals': {'subtotal': subtotal, 'discount': discount, 'total': total},
+            'totals': totals,
             'addresses': addresses
         }
     )
 
-@login_required
-def add_to_cart(request, product_id):
+@cart_owner_required
+def add_to_cart(request, owner, product_id):
     if request.method == 'POST':
         size = request.POST.get('size')
         color = request.POST.get('color')
         qty = int(request.POST.get('qty', '1'))
-        
-        # Находим вариант товара по размеру и цвету
-        try:
-            variant = ProductVariant.objects.get(
-                product_id=product_id,
-                size=size,
-                color=color
-            )
-        except ProductVariant.DoesNotExist:
+
+        # Находим вариант товара по размеру и цвету в матрице вариантов (кэш)
+        cell = get_variant_matrix(product_id).get(size, color)
+        if cell is None:
             messages.error(request, "Selected variant not available")
             return redirect(f'/product/{product_id}/')
-        
-        cart = _get_cart(request.user)
-        
-        # Считаем текущее общее количество товаров в корзине
-        current_total = CartItem.objects.filter(cart=cart).aggregate(
-            total_qty=Sum('quantity')
-        )['total_qty'] or 0
-        
-        if current_total + qty > MAX_ITEMS_IN_CART:
-            messages.error(request, f"Вы не можете добавить больше {MAX_ITEMS_IN_CART} товаров в корзину")
-            return redirect(f'/product/{product_id}/')
-        
-        item, created = CartItem.objects.get_or_create(cart=cart, variant=variant)
-        if not created:
-            item.quantity += qty
-        else:
-            item.quantity = qty
-        item.save()
+
+        # Лимит на общее количество проверяется хранилищем вместе с добавлением;
+        # корзина меняется под её блокировкой — см. cart.store
+        store = get_store()
+        with store.locked(owner):
+            quantity = store.add(owner, cell.id, qty, limit=MAX_ITEMS_IN_CART)
+            if quantity is None:
+                messages.error(request, f"Вы не можете добавить больше {MAX_ITEMS_IN_CART} товаров в корзину")
+                return redirect(f'/product/{product_id}/')
+
+            # Удерживаем товар за корзиной, пока покупатель не оформил заказ
+            cart_id = store.cart_id(owner)
+            if cart_id and not reservations.hold(cart_id, cell.id, quantity, cell.stock):
+                store.add(owner, cell.id, -qty)
+                messages.error(request, "Недостаточно товара на складе")
+                return redirect(f'/product/{product_id}/')
         messages.success(request, "Added to cart")
     return redirect(f'/product/{product_id}/')
 
-@login_required
-def update_item(request, item_id):
+@cart_owner_required
+def update_item(request, owner, item_id):
     if request.method == 'POST':
         qty = int(request.POST.get('qty', '1'))
-        item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        item.quantity = qty
-        item.save()
+        store = get_store()
+        with store.locked(owner):
+            if item_id not in store.lines(owner):
+                return redirect('/cart/')
+            cart_id = store.cart_id(owner)
+            if cart_id:
+                stock = ProductVariant.objects.values_list('stock', flat=True).get(pk=item_id)
+                if not reservations.hold(cart_id, item_id, qty, stock):
+                    messages.error(request, "Недостаточно товара на складе")
+                    return redirect('/cart/')
+            store.set_quantity(owner, item_id, qty)
     return redirect('/cart/')
 
-@login_required
-def remove_item(request, item_id):
+@cart_owner_required
+def remove_item(request, owner, item_id):
     if request.method == 'POST':
-        item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        item.delete()
+        store = get_store()
+        with store.locked(owner):
+            cart_id = store.cart_id(owner)
+            if cart_id:
+                reservations.release(cart_id, [item_id])
+            store.remove(owner, item_id)
     return redirect('/cart/')
 
-@login_required
-def apply_coupon(request):
+@cart_owner_required
+def apply_coupon(request, owner):
     if request.method == 'POST':
         code = request.POST.get('code','').strip()
-        cart = _get_cart(request.user)
-        cart.coupon_code = code
-        cart.save()
+        store = get_store()
+        with store.locked(owner):
+            store.set_coupon(owner, code)
     return redirect('/cart/')
@@ -1,12 +1,20 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
-from django.urls import reverse
-from django.db.models import Count, Sum
-from .models import Category, Product, ProductVariant, Review, OtherCategory, ReviewImage, Collection, ProductCollection
-import io
-from reportlab.pdfgen import canvas
-from django.http import FileResponse
+from django.urls import path, reverse
+from django.db import transaction
+from django.db.models import Count, OuterRef, Sum
+from .models import Category, Product, ProductVariant, Review, OtherCategory, ReviewImage, Collection, ProductCollection, ProductSalesStats, ExportJob
+from . import fragments, tasks
+from .exports import export_products
+from .pdf_export import save_selection
+from .cache import product_details_changed
+from .ratings import refresh_product_ratings
+from fashion_store.admin_mixins import AnnotatedAdminMixin, annotated_display, subquery_count, subquery_sum
+from django.contrib import messages
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 class ProductVariantInline(admin.TabularInline):
     """Inline для вариантов товара"""
@@ -31,8 +39,12 @@ class ProductCollectionInline(admin.TabularInline):
 
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(AnnotatedAdminMixin, admin.ModelAdmin):
     """Административная панель для категорий"""
+
+    list_annotations = {
+        'products_total': subquery_count(Product.objects.filter(category=OuterRef('pk'))),
+    }
     
     list_display = (
         'name', 'slug', 'get_products_count', 'is_active', 
@@ -64,10 +76,9 @@ class CategoryAdmin(admin.ModelAdmin):
         }),
     )
     
-    @admin.display(description=_('Количество товаров'))
-    def get_products_count(self, obj):
+    @annotated_display('products_total', fallback='get_products_count', description=_('Количество товаров'))
+    def get_products_count(self, obj, count):
         """Возвращает количество товаров в категории"""
-        count = obj.get_products_count()
         if count > 0:
             return format_html(
                 '<a href="{}?category__id__exact={}">{}</a>',
@@ -106,8 +117,13 @@ class OtherCategoryAdmin(admin.ModelAdmin):
     )
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(AnnotatedAdminMixin, admin.ModelAdmin):
     """Административная панель для товаров"""
+
+    list_annotations = {
+        'variants_total': subquery_count(ProductVariant.objects.filter(product=OuterRef('pk'))),
+        'stock_total': subquery_sum(ProductVariant.objects.filter(product=OuterRef('pk')), 'stock'),
+    }
     
     list_display = (
         'name', 'category', 'get_current_price_display', 'get_discount_display',
@@ -193,10 +209,9 @@ class ProductAdmin(admin.ModelAdmin):
             )
         return '-'
     
-    @admin.display(description=_('Варианты'))
-    def get_variants_count(self, obj):
+    @annotated_display('variants_total', fallback='get_variants_count', description=_('Варианты'))
+    def get_variants_count(self, obj, count):
         """Возвращает количество вариантов товара"""
-        count = obj.get_variants_count()
         if count > 0:
             return format_html(
                 '<a href="{}?product__id__exact={}">{}</a>',
@@ -206,10 +221,9 @@ class ProductAdmin(admin.ModelAdmin):
             )
         return count
     
-    @admin.display(description=_('Остаток'))
-    def get_total_stock(self, obj):
+    @annotated_display('stock_total', fallback='get_total_stock', description=_('Остаток'))
+    def get_total_stock(self, obj, stock):
         """Возвращает общий остаток на складе"""
-        stock = obj.get_total_stock()
         if stock == 0:
             return format_html('<span style="color: red;">{}</span>', stock)
         elif stock <= 10:
@@ -220,33 +234,45 @@ class ProductAdmin(admin.ModelAdmin):
     def get_rating_display(self, obj):
         """Возвращает рейтинг товара"""
         rating = obj.get_average_rating()
-        reviews_count = str(obj.get_reviews_count())
-        if rating > 0:
-            rating = f"{int(rating)}"
+        reviews_count = obj.get_reviews_count()
+        if reviews_count:
             full_stars = max(0, min(5, int(rating)))  # целая часть, обрезаем до 0..5
-            stars = "★" * full_stars + "☆" * (5 - int(rating))
+            stars = "★" * full_stars + "☆" * (5 - full_stars)
             return format_html(
                 '{} ({})<br><small>{} отзывов</small>',
-                stars, rating, reviews_count
+                stars, f"{rating:.1f}", reviews_count
             )
         return 'Нет отзывов'
     @admin.action(description='Скачать PDF по выбранным товарам')
     def export_products_pdf(self, request, queryset):
-        buf = io.BytesIO()
-        p = canvas.Canvas(buf)
-        y = 800
-        for obj in queryset:
-            line = f'{obj.name} — цена: {obj.get_current_price()}'
-            p.drawString(40, y, line)
-            y -= 20
-            if y < 60:
-                p.showPage()
-                y = 800
-        p.showPage()
-        p.save()
-        buf.seek(0)
-        return FileResponse(buf, as_attachment=True, filename='products.pdf')
-    actions = ['export_products_pdf']
+        """Ставит сборку PDF в очередь; ссылка появится, когда файл будет готов"""
+        # В задачу уходит сохранённый запрос, а не список id выбранных товаров
+        total = queryset.count()
+        job = ExportJob.objects.create(
+            user=request.user, kind='products_pdf', total=total, query=save_selection(queryset)
+        )
+        transaction.on_commit(lambda: tasks.export_products_pdf.delay(job.pk))
+        self.message_user(
+            request,
+            format_html(
+                'PDF по {} товарам собирается в фоне. Ход выгрузки — в разделе <a href="{}">{}</a>.',
+                total, reverse('admin:catalog_exportjob_changelist'), _('Выгрузки')
+            )
+        )
+
+    def changelist_view(self, request, extra_context=None):
+        notify_finished_exports(request)
+        return super().changelist_view(request, extra_context)
+
+    @admin.action(description=_('Выгрузить в CSV (с вариантами)'))
+    def export_products_csv(self, request, queryset):
+        return export_products(queryset, 'csv')
+
+    @admin.action(description=_('Выгрузить в JSONL (с вариантами)'))
+    def export_products_jsonl(self, request, queryset):
+        return export_products(queryset, 'jsonl')
+
+    actions = ['export_products_pdf', 'export_products_csv', 'export_products_jsonl']
 
 @admin.register(ProductVariant)
 class ProductVariantAdmin(admin.ModelAdmin):
@@ -349,11 +375,30 @@ class ReviewAdmin(admin.ModelAdmin):
         }),
     )
     
+    actions = ['approve_reviews', 'unapprove_reviews']
+
     @admin.display(description=_('Оценка'))
     def get_rating_display(self, obj):
         """Возвращает отображаемую оценку"""
         return obj.get_rating_display()
 
+    @admin.action(description=_('Одобрить выбранные отзывы'))
+    def approve_reviews(self, request, queryset):
+        self._set_approved(queryset, True)
+
+    @admin.action(description=_('Снять одобрение с выбранных отзывов'))
+    def unapprove_reviews(self, request, queryset):
+        self._set_approved(queryset, False)
+
+    def _set_approved(self, queryset, approved):
+        # update() не вызывает сигналы — пересчитываем оценки товаров сами
+        with transaction.atomic():
+            product_ids = set(queryset.values_list('product_id', flat=True))
+            queryset.update(is_approved=approved)
+            refresh_product_ratings(product_ids)
+            fragments.invalidate_products(product_ids)
+            product_details_changed()
+
 @admin.register(ReviewImage)
 class ReviewImageAdmin(admin.ModelAdmin):
     """Административная панель для изображений отзывов"""
@@ -398,3 +443,97 @@ class ReviewImageAdmin(admin.ModelAdmin):
         return 'Нет изображения'
 
 
+@admin.register(ProductSalesStats)
+class ProductSalesStatsAdmin(admin.ModelAdmin):
+    """Административная панель для статистики продаж (только чтение)"""
+
+    list_display = (
+        'product', 'units_sold', 'units_sold_7d', 'units_sold_30d',
+        'revenue', 'last_sold_at', 'updated_at'
+    )
+    search_fields = ('product__name',)
+    ordering = ('-units_sold',)
+    list_select_related = ('product',)
+    readonly_fields = (
+        'product', 'units_sold', 'revenue', 'last_sold_at',
+        'units_sold_7d', 'units_sold_30d', 'updated_at'
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+
+def notify_finished_exports(request):
+    """Показывает пользователю завершённые с прошлого раза выгрузки"""
+    jobs = list(ExportJob.objects.filter(
+        user=request.user, status__in=('done', 'failed'), notified_at__isnull=True
+    ))
+    for job in jobs:
+        if job.status == 'done':
+            messages.success(request, format_html(
+                '{} готова: <a href="{}">скачать</a>',
+                job, reverse('admin:catalog_exportjob_download', args=[job.pk])
+            ))
+        else:
+            messages.error(request, f'{job} завершилась с ошибкой: {job.error}')
+    ExportJob.objects.filter(pk__in=[job.pk for job in jobs]).update(notified_at=timezone.now())
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """Административная панель для фоновых выгрузок (только чтение)"""
+
+    list_display = (
+        '__str__', 'user', 'status', 'get_progress_display', 'get_download_link', 'created_at', 'finished_at'
+    )
+    list_filter = ('kind', 'status', 'created_at')
+    ordering = ('-created_at',)
+    list_select_related = ('user',)
+    readonly_fields = (
+        'user', 'kind', 'status', 'total', 'processed', 'file', 'error',
+        'created_at', 'finished_at', 'notified_at'
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.user.is_superuser:
+            return queryset
+        return queryset.filter(user=request.user)
+
+    def changelist_view(self, request, extra_context=None):
+        notify_finished_exports(request)
+        return super().changelist_view(request, extra_context)
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='catalog_exportjob_download'
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        """Отдаёт готовый файл выгрузки её автору или суперпользователю"""
+        job = get_object_or_404(self.get_queryset(request), pk=pk, status='done')
+        if not job.file:
+            raise Http404
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=f'{job.kind}-{job.pk}.pdf')
+
+    @admin.display(description=_('Прогресс'))
+    def get_progress_display(self, obj):
+        """Возвращает прогресс выгрузки"""
+        return f'{obj.progress_percent}% ({obj.processed}/{obj.total})'
+
+    @admin.display(description=_('Файл'))
+    def get_download_link(self, obj):
+        """Возвращает ссылку на готовый файл"""
+        if obj.status == 'done' and obj.file:
+            return format_html(
+                '<a href="{}">скачать</a>',
+                reverse('admin:catalog_exportjob_download', args=[obj.pk])
+            )
+        return '—'
@@ -1,7 +1,17 @@
 from rest_framework import viewsets, permissions, filters
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Category, Product, ProductVariant, Review
 from .serializers import CategorySerializer, ProductSerializer, ProductVariantSerializer, ReviewSerializer
+from .filters import ProductSearchFilter
+from .pagination import ProductPagination
+from .exports import export_products
+from .cache import CATALOG_GENERATION, PRODUCT_DETAILS_GENERATION
+from .fragments import SHARED_GENERATION, version_namespace
+from fashion_store.conditional import ConditionalGetMixin
+from fashion_store.dynamic_fields import ShapedQuerysetMixin
+from fashion_store.exports import FORMATS as EXPORT_FORMATS
 
 class IsAdminOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -9,30 +19,45 @@ class IsAdminOrReadOnly(permissions.BasePermission):
             return True
         return request.user and request.user.is_staff
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalGetMixin, ShapedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
+    conditional_namespaces = (CATALOG_GENERATION,)
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name']
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, ShapedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all().select_related('category').prefetch_related('variants')
+    conditional_namespaces = (CATALOG_GENERATION, PRODUCT_DETAILS_GENERATION)
     serializer_class = ProductSerializer
     permission_classes = [IsAdminOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_fields = {'category':['exact'],'variants__size':['exact'],'variants__color':['exact'],'base_price':['gte','lte']}
     search_fields = ['name','description']
-    ordering_fields = ['base_price','created_at']
+    ordering_fields = ['name','base_price','sale_price','created_at']
+    pagination_class = ProductPagination
 
-class ProductVariantViewSet(viewsets.ModelViewSet):
+    def get_object_namespaces(self, lookup):
+        # Версия товара растёт при правке товара, вариантов, отзывов и подборок
+        return (SHARED_GENERATION, version_namespace(lookup))
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """Потоковая выгрузка отфильтрованных товаров с вариантами (?output=csv|jsonl)"""
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'detail': f'output: {", ".join(EXPORT_FORMATS)}'}, status=400)
+        return export_products(self.filter_queryset(self.get_queryset()), output)
+
+class ProductVariantViewSet(ShapedQuerysetMixin, viewsets.ModelViewSet):
     queryset = ProductVariant.objects.all()
     serializer_class = ProductVariantSerializer
     permission_classes = [IsAdminOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['size','color','product']
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ShapedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Review.objects.select_related('product','user').all()
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
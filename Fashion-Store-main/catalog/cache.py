@@ -0,0 +1,83 @@
+"""Кэш JSON-ответов каталога.
+
+Ключ строится по нормализованному набору параметров (фильтры,
+сортировка, страница), а не по сырому URL: порядок и дубли параметров,
+метки трекинга и неизвестные параметры на ключ не влияют. В ключ входит
+поколение «catalog», которое увеличивают записи в каталог, поэтому
+записи живут долго и не отдают устаревшие цены.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+
+from fashion_store.cache import get_generation, invalidate
+
+CATALOG_GENERATION = 'catalog'
+# Данные товара вне строки Product: варианты и оценки (для ETag API товаров)
+PRODUCT_DETAILS_GENERATION = 'catalog:details'
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+CATALOG_ORDERING = ("name", "created_at", "base_price", "sale_price")
+DEFAULT_ORDERING = "-created_at"
+DEFAULT_PER_PAGE = 12
+MAX_PER_PAGE = 100
+
+
+def _positive_int(value, default, maximum=None):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    if value < 1:
+        return default
+    return min(value, maximum) if maximum else value
+
+
+def normalize_list_params(params):
+    """Приводит GET-параметры catalog_list к каноническому виду"""
+    ordering = params.get("ordering", DEFAULT_ORDERING)
+    if ordering.lstrip("-") not in CATALOG_ORDERING:
+        ordering = DEFAULT_ORDERING
+    featured = params.get("featured")
+    cursor = params.get("cursor")
+    keyset = cursor is not None or params.get("pagination") == "cursor"
+    count = params.get("count")
+    return {
+        "q": " ".join((params.get("q") or "").lower().split()) or None,
+        "category": params.get("category") or None,
+        "other_category": params.get("other_category") or None,
+        "active": params.get("active", "1") == "1",
+        "featured": featured if featured in ("0", "1") else None,
+        "ordering": ordering,
+        "per_page": _positive_int(params.get("per_page"), DEFAULT_PER_PAGE, MAX_PER_PAGE),
+        "keyset": keyset,
+        "cursor": (cursor or None) if keyset else None,
+        "page": None if keyset else _positive_int(params.get("page"), 1),
+        "count": count if keyset and count in ("exact", "approx") else None,
+    }
+
+
+def cache_key(prefix, params):
+    raw = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"{prefix}:{get_generation(CATALOG_GENERATION)}:{digest}"
+
+
+def get_or_set(prefix, params, build):
+    """Возвращает закэшированное значение или строит его через build()"""
+    key = cache_key(prefix, params)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def catalog_changed():
+    """Делает недействительными все закэшированные ответы каталога"""
+    invalidate(CATALOG_GENERATION)
+
+
+def product_details_changed():
+    """Изменились варианты или отзывы товаров"""
+    invalidate(PRODUCT_DETAILS_GENERATION)
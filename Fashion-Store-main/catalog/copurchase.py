@@ -0,0 +1,119 @@
+"""Расчёт «часто покупают вместе» по истории заказов.
+
+Позиции заказов читаются порциями (заказ никогда не разрывается между
+порциями); по каждой порции строится разреженная матрица «заказ × товар»
+B, и совместные покупки накапливаются как Bᵀ·B. Для каждого товара
+сохраняются top-K соседей в ProductCoPurchase, откуда product_detail
+читает их одним запросом по индексу (product, rank).
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from scipy import sparse
+
+from orders.models import OrderItem
+from .models import Product, ProductCoPurchase
+
+TOP_K = 10
+CHUNK_SIZE = 200_000
+EXCLUDED_STATUSES = ('cancelled', 'refunded')
+_BATCH_SIZE = 1000
+
+
+def _order_lines():
+    return (
+        OrderItem.objects.exclude(order__status__in=EXCLUDED_STATUSES)
+        .order_by('order_id')
+        .values_list('order_id', 'variant__product_id')
+    )
+
+
+def order_line_chunks(chunk_size=CHUNK_SIZE):
+    """Порции позиций заказов как массивы (order_ids, product_ids).
+
+    Выборка идёт по ключу order_id, последний (возможно, неполный)
+    заказ порции переносится в следующую.
+    """
+    last_order = 0
+    while True:
+        rows = list(_order_lines().filter(order_id__gt=last_order)[:chunk_size])
+        if not rows:
+            return
+        if len(rows) == chunk_size:
+            boundary = rows[-1][0]
+            complete = [row for row in rows if row[0] != boundary]
+            # Заказ больше целой порции — читаем его отдельно
+            rows = complete or list(_order_lines().filter(order_id=boundary))
+        lines = np.array(rows, dtype=np.int64)
+        yield lines[:, 0], lines[:, 1]
+        last_order = int(lines[-1, 0])
+
+
+def co_occurrence_matrix(chunks, n_products):
+    """Матрица совместных покупок C[i, j] — число заказов с товарами i и j"""
+    total = sparse.csr_matrix((n_products, n_products), dtype=np.int64)
+    for order_ids, product_ids in chunks:
+        _, rows = np.unique(order_ids, return_inverse=True)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, product_ids)),
+            shape=(rows.max() + 1, n_products),
+        )
+        incidence.sum_duplicates()
+        incidence.data[:] = 1  # несколько вариантов одного товара в заказе считаются один раз
+        total = total + (incidence.T @ incidence).tocsr()
+    total.setdiag(0)
+    total.eliminate_zeros()
+    return total
+
+
+def top_k(matrix, k=TOP_K, allowed=None):
+    """Для каждой строки — до k столбцов с наибольшими значениями.
+
+    Возвращает {товар: [(связанный товар, счёт), ...]}; при равенстве
+    счёта выше идёт товар с меньшим id. allowed — булев массив допустимых столбцов.
+    """
+    result = {}
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        if start == end:
+            continue
+        columns, scores = matrix.indices[start:end], matrix.data[start:end]
+        if allowed is not None:
+            keep = allowed[columns]
+            columns, scores = columns[keep], scores[keep]
+        if not len(columns):
+            continue
+        order = np.lexsort((columns, -scores))[:k]
+        result[row] = [(int(columns[i]), int(scores[i])) for i in order]
+    return result
+
+
+def compute_co_purchases(k=TOP_K, chunk_size=CHUNK_SIZE):
+    """Пересчитывает таблицу ProductCoPurchase; возвращает число товаров с рекомендациями"""
+    max_id = Product.objects.aggregate(max_id=Max('id'))['max_id']
+    if max_id is None:
+        return 0
+    n_products = max_id + 1
+    matrix = co_occurrence_matrix(order_line_chunks(chunk_size), n_products)
+    allowed = np.zeros(n_products, dtype=bool)
+    allowed[list(Product.objects.filter(is_active=True).values_list('id', flat=True))] = True
+    neighbours = top_k(matrix, k, allowed)
+
+    rows = [
+        ProductCoPurchase(product_id=product_id, related_id=related_id, rank=rank, score=score)
+        for product_id, related in neighbours.items()
+        for rank, (related_id, score) in enumerate(related, start=1)
+    ]
+    with transaction.atomic():
+        ProductCoPurchase.objects.all().delete()
+        ProductCoPurchase.objects.bulk_create(rows, batch_size=_BATCH_SIZE)
+    return len(neighbours)
+
+
+def frequently_bought_together(product, limit=5):
+    """Рекомендации для карточки товара — один запрос по индексу (product, rank)"""
+    return [
+        row.related for row in
+        ProductCoPurchase.objects.filter(product=product, related__is_active=True)
+        .select_related('related').order_by('rank')[:limit]
+    ]
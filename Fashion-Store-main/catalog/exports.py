@@ -0,0 +1,36 @@
+"""Выгрузка каталога: строка на вариант товара (товар без вариантов — одна строка).
+
+Колонки совпадают с форматом import_catalog, так что выгрузку можно
+поправить и загрузить обратно.
+"""
+from fashion_store.exports import export_response
+
+PRODUCT_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('external_id', 'external_id'),
+    ('name', 'name'),
+    ('category', 'category__slug'),
+    ('other_category', 'other_category__slug'),
+    ('base_price', 'base_price'),
+    ('sale_price', 'sale_price'),
+    ('short_description', 'short_description'),
+    ('description', 'description'),
+    ('is_active', 'is_active'),
+    ('is_featured', 'is_featured'),
+    ('is_new', 'is_new'),
+    ('rating_avg', 'rating_avg'),
+    ('rating_count', 'rating_count'),
+    ('created_at', 'created_at'),
+    ('size', 'variants__size'),
+    ('color', 'variants__color'),
+    ('price', 'variants__price'),
+    ('stock', 'variants__stock'),
+    ('sku', 'variants__sku'),
+    ('variant_is_active', 'variants__is_active'),
+)
+
+
+def export_products(queryset, fmt):
+    """Потоковая выгрузка товаров с вариантами"""
+    queryset = queryset.order_by('id', 'variants__id')
+    return export_response(queryset, PRODUCT_EXPORT_COLUMNS, fmt, 'products')
@@ -0,0 +1,302 @@
+"""Фасетные счётчики для фильтров каталога.
+
+Для каждого значения фасета индекс хранит битовое множество id товаров
+(целое число Python: бит N установлен, если товар с id=N обладает этим
+значением). Пересечение фильтров — побитовое «и», количество —
+bit_count(), поэтому все счётчики для текущего набора фильтров
+считаются за один проход в памяти, без COUNT-запроса на каждое значение.
+
+Индекс строится один раз на процесс и дальше обновляется по товарам:
+сигналы после коммита увеличивают поколение «facets» и записывают в кэш
+список изменённых товаров, а каждый процесс при следующем обращении
+догоняет изменения, перечитывая только эти товары.
+
+Опубликованный индекс не меняется: изменения применяются к копии,
+которая затем подменяет его целиком, поэтому запросы читают индекс
+без блокировки и никогда не видят его наполовину обновлённым.
+"""
+import threading
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from fashion_store.cache import bump_generation, get_generation
+from .models import Product, ProductVariant
+from .search import search_products
+
+FACETS = ('category', 'other_category', 'size', 'color', 'price', 'in_stock')
+
+# Диапазоны цен [от, до) по базовой цене товара
+PRICE_BUCKETS = (
+    ('0-1000', Decimal('0'), Decimal('1000')),
+    ('1000-2500', Decimal('1000'), Decimal('2500')),
+    ('2500-5000', Decimal('2500'), Decimal('5000')),
+    ('5000-10000', Decimal('5000'), Decimal('10000')),
+    ('10000+', Decimal('10000'), None),
+)
+
+GENERATION = 'facets'
+CHANGELOG_KEY = 'facets:changes:{}'
+CHANGELOG_TIMEOUT = 60 * 60
+# Если процесс отстал сильнее, дешевле перестроить индекс целиком
+MAX_REPLAY = 200
+FULL_REBUILD = '*'
+
+
+def _bitset(ids):
+    """Собирает битовое множество из списка id за O(n)"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buf = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        buf[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def _price_bucket(price):
+    for key, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return key
+    return None
+
+
+class FacetIndex:
+    """Инвертированный индекс «значение фасета → множество товаров»"""
+
+    def __init__(self):
+        self.postings = {facet: {} for facet in FACETS}
+        self.labels = {'category': {}, 'other_category': {}}
+        self.memberships = {}
+        self.prices = {}
+        self.active = 0
+        self.all = 0
+
+    @classmethod
+    def build(cls):
+        """Строит индекс по всему каталогу двумя запросами"""
+        index = cls()
+        index._load(Product.objects.all(), ProductVariant.objects.all())
+        return index
+
+    def copy(self):
+        """Копия для обновления; битовые множества — неизменяемые int, их не копируем"""
+        index = FacetIndex.__new__(FacetIndex)
+        index.postings = {facet: dict(postings) for facet, postings in self.postings.items()}
+        index.labels = {facet: dict(labels) for facet, labels in self.labels.items()}
+        index.memberships = dict(self.memberships)
+        index.prices = dict(self.prices)
+        index.active = self.active
+        index.all = self.all
+        return index
+
+    def update_products(self, product_ids):
+        """Перечитывает из БД указанные товары и обновляет их биты"""
+        product_ids = list(product_ids)
+        for pk in product_ids:
+            self._remove(pk)
+        self._load(
+            Product.objects.filter(pk__in=product_ids),
+            ProductVariant.objects.filter(product_id__in=product_ids),
+        )
+
+    def _remove(self, pk):
+        mask = ~(1 << pk)
+        for facet, value in self.memberships.pop(pk, ()):
+            self.postings[facet][value] &= mask
+        self.prices.pop(pk, None)
+        self.active &= mask
+        self.all &= mask
+
+    def _load(self, products, variants):
+        variant_values = defaultdict(lambda: (set(), set(), [False]))
+        for product_id, size, color, stock in variants.values_list('product_id', 'size', 'color', 'stock'):
+            sizes, colors, in_stock = variant_values[product_id]
+            sizes.add(size)
+            colors.add(color)
+            if stock > 0:
+                in_stock[0] = True
+
+        groups = defaultdict(list)
+        active_ids = []
+        product_ids = []
+        rows = products.values_list(
+            'id', 'is_active', 'base_price',
+            'category__slug', 'category__name', 'other_category__slug', 'other_category__name',
+        )
+        for pk, is_active, base_price, cat_slug, cat_name, other_slug, other_name in rows:
+            sizes, colors, in_stock = variant_values.get(pk, ((), (), [False]))
+            memberships = [('category', cat_slug), ('in_stock', '1' if in_stock[0] else '0')]
+            self.labels['category'][cat_slug] = cat_name
+            if other_slug:
+                memberships.append(('other_category', other_slug))
+                self.labels['other_category'][other_slug] = other_name
+            memberships.extend(('size', size) for size in sizes)
+            memberships.extend(('color', color) for color in colors)
+            bucket = _price_bucket(base_price)
+            if bucket:
+                memberships.append(('price', bucket))
+            for membership in memberships:
+                groups[membership].append(pk)
+            self.memberships[pk] = memberships
+            self.prices[pk] = base_price
+            product_ids.append(pk)
+            if is_active:
+                active_ids.append(pk)
+
+        for (facet, value), ids in groups.items():
+            postings = self.postings[facet]
+            postings[value] = postings.get(value, 0) | _bitset(ids)
+        self.active |= _bitset(active_ids)
+        self.all |= _bitset(product_ids)
+
+    def price_range(self, min_price=None, max_price=None):
+        """Множество товаров с базовой ценой в заданных границах (включительно)"""
+        return _bitset(
+            pk for pk, price in self.prices.items()
+            if (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
+        )
+
+    def count(self, selected, base=None):
+        """Считает количества для всех фасетов при выбранных фильтрах.
+
+        Внутри одного фасета значения объединяются по «или», между
+        фасетами — по «и»; счётчики фасета учитывают все фильтры,
+        кроме его собственного.
+        """
+        universe = self.all if base is None else self.all & base
+        masks = {}
+        for facet, values in selected.items():
+            if facet in self.postings and values:
+                mask = 0
+                for value in values:
+                    mask |= self.postings[facet].get(value, 0)
+                masks[facet] = mask
+
+        total = universe
+        for mask in masks.values():
+            total &= mask
+
+        facets = {}
+        for facet in FACETS:
+            scope = universe
+            for other, mask in masks.items():
+                if other != facet:
+                    scope &= mask
+            chosen = selected.get(facet) or ()
+            facets[facet] = [
+                {
+                    'value': value,
+                    'label': self.labels.get(facet, {}).get(value, value),
+                    'count': (bits & scope).bit_count(),
+                    'selected': value in chosen,
+                }
+                for value, bits in self._ordered(facet)
+                if bits
+            ]
+        return {'total': total.bit_count(), 'facets': facets}
+
+    def _ordered(self, facet):
+        postings = self.postings[facet]
+        if facet == 'price':
+            return [(key, postings.get(key, 0)) for key, _, _ in PRICE_BUCKETS]
+        labels = self.labels.get(facet, {})
+        return sorted(postings.items(), key=lambda item: str(labels.get(item[0], item[0])).lower())
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'generation': None}
+
+
+def get_index():
+    """Возвращает актуальный индекс текущего процесса"""
+    generation = get_generation(GENERATION)
+    with _lock:
+        index = _state['index']
+        if index is not None and _state['generation'] != generation:
+            changed = _pending_changes(_state['generation'], generation)
+            if changed is None:
+                index = None
+            elif changed:
+                index = index.copy()
+                index.update_products(changed)
+        if index is None:
+            index = FacetIndex.build()
+        _state.update(index=index, generation=generation)
+        return index
+
+
+def _pending_changes(current, generation):
+    if generation < current or generation - current > MAX_REPLAY:
+        return None
+    keys = [CHANGELOG_KEY.format(g) for g in range(current + 1, generation + 1)]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return None
+    changed = set()
+    for entry in entries.values():
+        if entry == FULL_REBUILD:
+            return None
+        changed.update(entry)
+    return changed
+
+
+def products_changed(product_ids=None):
+    """Сообщает всем процессам об изменении товаров.
+
+    Без аргументов — индекс будет перестроен целиком (например, после
+    переименования категории). Вызывать после коммита транзакции.
+    """
+    generation = bump_generation(GENERATION)
+    entry = FULL_REBUILD if product_ids is None else list(product_ids)
+    cache.set(CHANGELOG_KEY.format(generation), entry, timeout=CHANGELOG_TIMEOUT)
+
+
+def parse_selection(params):
+    """Извлекает выбранные фильтры из GET-параметров"""
+    return {facet: params.getlist(facet) for facet in FACETS if params.getlist(facet)}
+
+
+def filter_by_variant_facets(queryset, params):
+    """Применяет к queryset товаров фильтры по размеру, цвету, наличию и ценовым диапазонам"""
+    sizes, colors = params.getlist('size'), params.getlist('color')
+    if sizes:
+        queryset = queryset.filter(pk__in=ProductVariant.objects.filter(size__in=sizes).values('product_id'))
+    if colors:
+        queryset = queryset.filter(pk__in=ProductVariant.objects.filter(color__in=colors).values('product_id'))
+    in_stock = set(params.getlist('in_stock'))
+    if len(in_stock) == 1:
+        available = ProductVariant.objects.filter(stock__gt=0).values('product_id')
+        queryset = queryset.filter(pk__in=available) if '1' in in_stock else queryset.exclude(pk__in=available)
+    buckets = [bucket for bucket in PRICE_BUCKETS if bucket[0] in params.getlist('price')]
+    if buckets:
+        condition = Q()
+        for _, low, high in buckets:
+            condition |= Q(base_price__gte=low, base_price__lt=high) if high is not None else Q(base_price__gte=low)
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def _decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+
+
+def facet_counts(params):
+    """Считает фасеты для GET-параметров списка товаров"""
+    index = get_index()
+    base = None
+    q = params.get('q')
+    if q:
+        base = _bitset(search_products(Product.objects.all(), q).values_list('id', flat=True))
+    min_price, max_price = _decimal(params.get('min_price')), _decimal(params.get('max_price'))
+    if min_price is not None or max_price is not None:
+        prices = index.price_range(min_price, max_price)
+        base = prices if base is None else base & prices
+    if params.get('active') == '1':
+        base = index.active if base is None else base & index.active
+    return index.count(parse_selection(params), base)
@@ -0,0 +1,13 @@
+from rest_framework import filters
+
+from .search import search_products
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """SearchFilter, работающий через полнотекстовый индекс товаров"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+        return search_products(queryset, terms)
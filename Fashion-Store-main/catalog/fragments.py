@@ -0,0 +1,166 @@
+"""Кэш HTML-фрагментов товаров (карточки, блоки страницы товара).
+
+Ключ фрагмента содержит версию товара и общее поколение каталога,
+поэтому устаревших записей не бывает: сигналы увеличивают версию
+товара после коммита, и следующий рендер просто не находит старый ключ.
+Срок жизни записей нужен только, чтобы освобождать память.
+
+Списки карточек читают фрагменты всей страницы заранее, двумя запросами
+к кэшу ({% prefetch_productcache %} или fetch_fragments во view), а
+{% productcache %} берёт готовое и обращается к кэшу только при промахе.
+
+Попадания и промахи считаются в процессе и периодически сбрасываются
+в общий кэш — сводку показывает команда fragment_cache_stats.
+"""
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+from fashion_store.cache import bump_generation, get_generations, invalidate
+
+FRAGMENT_TIMEOUT = 7 * 24 * 60 * 60
+# Поколение для данных, общих для многих товаров (названия категорий)
+SHARED_GENERATION = 'fragments'
+STATS_KEY = 'fragment_stats:{}:{}'
+STATS_NAMES_KEY = 'fragment_stats:names'
+STATS_FLUSH_EVERY = 50
+# Переменная контекста шаблона с фрагментами, прочитанными заранее:
+# {(имя, доп. значения ключа): {id товара: (ключ, html или None)}}
+PREFETCHED = 'prefetched_fragments'
+
+
+def version_namespace(product_id):
+    return f'product:{product_id}'
+
+
+def _fragment_key(name, product_id, version, shared, vary):
+    suffix = ':'.join(str(value) for value in vary)
+    return f'fragment:{name}:{product_id}:{version}:{shared}:{get_language()}:{suffix}'
+
+
+def fetch_fragments(name, product_ids, vary=()):
+    """{id товара: (ключ, html или None при промахе)}; версии и фрагменты — двумя запросами к кэшу"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    shared, *versions = get_generations(SHARED_GENERATION, *map(version_namespace, product_ids))
+    keys = {
+        pk: _fragment_key(name, pk, version, shared, vary)
+        for pk, version in zip(product_ids, versions)
+    }
+    found = cache.get_many(list(keys.values()))
+    return {pk: (key, found.get(key)) for pk, key in keys.items()}
+
+
+def get_fragments(name, product_ids, render, vary=()):
+    """Возвращает {id товара: html} для нескольких товаров.
+
+    render(product_id) вызывается только для промахов.
+    """
+    result, missing = {}, {}
+    for pk, (key, html) in fetch_fragments(name, product_ids, vary).items():
+        if html is None:
+            html = missing[key] = render(pk)
+        result[pk] = html
+    if missing:
+        cache.set_many(missing, FRAGMENT_TIMEOUT)
+    stats.record(name, hits=len(result) - len(missing), misses=len(missing))
+    return result
+
+
+def prefetch_fragments(name, products, vary=(), prefetched=None):
+    """Значение для PREFETCHED: фрагменты products, прочитанные из кэша одним обращением"""
+    prefetched = dict(prefetched or {})
+    ids = [getattr(product, 'pk', product) for product in products]
+    prefetched[(name, tuple(str(value) for value in vary))] = fetch_fragments(name, ids, vary)
+    return prefetched
+
+
+def fill_fragment(name, key, html, render):
+    """html, прочитанный fetch_fragments, или при промахе render() с записью в кэш"""
+    if html is not None:
+        stats.record(name, hits=1)
+        return html
+    html = render()
+    cache.set(key, html, FRAGMENT_TIMEOUT)
+    stats.record(name, misses=1)
+    return html
+
+
+def get_fragment(name, product_id, render, vary=()):
+    """Возвращает html одного фрагмента; render() вызывается при промахе"""
+    return get_fragments(name, [product_id], lambda pk: render(), vary)[product_id]
+
+
+def bump_product_versions(product_ids):
+    """Делает недействительными все фрагменты указанных товаров"""
+    for pk in set(product_ids):
+        bump_generation(version_namespace(pk))
+
+
+def invalidate_products(product_ids):
+    """Сбрасывает фрагменты товаров (сразу и после коммита транзакции)"""
+    for pk in set(product_ids):
+        invalidate(version_namespace(pk))
+
+
+def invalidate_shared():
+    """Сбрасывает фрагменты всех товаров (например, после переименования категории)"""
+    invalidate(SHARED_GENERATION)
+
+
+class FragmentStats:
+    """Счётчики попаданий и промахов кэша фрагментов"""
+
+    def __init__(self, flush_every=STATS_FLUSH_EVERY):
+        self.flush_every = flush_every
+        self.pending = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, name, hits=0, misses=0):
+        with self.lock:
+            self.pending[(name, 'hits')] += hits
+            self.pending[(name, 'misses')] += misses
+            if sum(self.pending.values()) < self.flush_every:
+                return
+            pending, self.pending = self.pending, Counter()
+        self._flush(pending)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+        self._flush(pending)
+
+    def _flush(self, pending):
+        names = {name for name, _ in pending}
+        if names - set(cache.get(STATS_NAMES_KEY) or ()):
+            cache.set(STATS_NAMES_KEY, sorted(names | set(cache.get(STATS_NAMES_KEY) or ())), timeout=None)
+        for (name, kind), value in pending.items():
+            if not value:
+                continue
+            key = STATS_KEY.format(name, kind)
+            if not cache.add(key, value, timeout=None):
+                cache.incr(key, value)
+
+    def summary(self):
+        """{фрагмент: {'hits', 'misses', 'hit_rate'}} по всем процессам"""
+        self.flush()
+        result = {}
+        for name in cache.get(STATS_NAMES_KEY) or ():
+            hits = cache.get(STATS_KEY.format(name, 'hits')) or 0
+            misses = cache.get(STATS_KEY.format(name, 'misses')) or 0
+            total = hits + misses
+            result[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
+        return result
+
+    def reset(self):
+        with self.lock:
+            self.pending = Counter()
+        names = cache.get(STATS_NAMES_KEY) or ()
+        cache.delete_many([STATS_KEY.format(name, kind) for name in names for kind in ('hits', 'misses')])
+        cache.delete(STATS_NAMES_KEY)
+
+
+stats = FragmentStats()
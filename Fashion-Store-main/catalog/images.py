@@ -0,0 +1,172 @@
+"""Производные изображения (AVIF/WebP нескольких ширин) для srcset.
+
+Оригинал остаётся как есть, рядом с ним сохраняются уменьшенные копии
+вида products/shirt.w640.webp. Копии больше оригинала не делаются.
+Список готовых копий хранится в ImageDerivative и кэшируется по имени
+оригинала, поэтому шаблон и сериализатор не обращаются к хранилищу.
+
+render_derivatives() работает только с файлами (без БД) — её можно
+запускать в отдельных процессах; record_derivatives() сохраняет результат.
+"""
+import io
+import os
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image, ImageOps, features
+
+from .models import Category, ImageDerivative, Product, ProductVariant, ReviewImage
+
+DERIVATIVE_WIDTHS = (320, 640, 960, 1280)
+# (расширение, формат Pillow, MIME-тип, параметры кодека); порядок — приоритет в <picture>
+DERIVATIVE_FORMATS = (
+    ('avif', 'AVIF', 'image/avif', {'quality': 50}),
+    ('webp', 'WEBP', 'image/webp', {'quality': 80, 'method': 6}),
+)
+IMAGE_FIELDS = (
+    (Product, 'image'),
+    (ProductVariant, 'image'),
+    (Category, 'image'),
+    (ReviewImage, 'image'),
+)
+SOURCES_KEY = 'image_sources:{}'
+SOURCES_TIMEOUT = 30 * 24 * 60 * 60
+
+
+def derivative_name(name, width, extension):
+    """Имя копии рядом с оригиналом: products/a.jpg → products/a.w640.webp"""
+    root, _ = os.path.splitext(name)
+    return f'{root}.w{width}.{extension}'
+
+
+def target_widths(width):
+    """Ширины копий для оригинала заданной ширины (без увеличения)"""
+    widths = [w for w in DERIVATIVE_WIDTHS if w < width]
+    if width <= DERIVATIVE_WIDTHS[-1]:
+        widths.append(width)
+    return widths
+
+
+def available_formats():
+    """Форматы, которые умеет кодировать установленный Pillow"""
+    return [spec for spec in DERIVATIVE_FORMATS if features.check(spec[0])]
+
+
+def _encode(image, pillow_format, options):
+    if pillow_format == 'AVIF' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return buffer.getvalue()
+
+
+def render_derivatives(name, force=False, storage=None):
+    """Создаёт копии изображения и возвращает [(формат, ширина, имя файла)].
+
+    Уже существующие копии не перекодируются, если не передан force.
+    """
+    storage = storage or default_storage
+    with storage.open(name, 'rb') as fh, Image.open(fh) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    # Имена копий выводятся из имени оригинала — хэшировать их не нужно
+    save = getattr(storage, 'save_derived', storage.save)
+    rows = []
+    for width in target_widths(image.width):
+        resized = None
+        for extension, pillow_format, _, options in available_formats():
+            target = derivative_name(name, width, extension)
+            if storage.exists(target):
+                if not force:
+                    rows.append((extension, width, target))
+                    continue
+                storage.delete(target)
+            if resized is None:
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            saved = save(target, ContentFile(_encode(resized, pillow_format, options)))
+            rows.append((extension, width, saved))
+    return rows
+
+
+def render_safely(name, force=False):
+    """Вариант render_derivatives для пула процессов: ошибки возвращаются, а не выбрасываются"""
+    try:
+        return name, render_derivatives(name, force), None
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        return name, [], str(exc)
+
+
+def record_derivatives(name, rows):
+    """Сохраняет список копий изображения и сбрасывает закэшированные srcset"""
+    with transaction.atomic():
+        ImageDerivative.objects.filter(source=name).delete()
+        ImageDerivative.objects.bulk_create(
+            ImageDerivative(source=name, format=extension, width=width, name=target)
+            for extension, width, target in rows
+        )
+    cache.delete(SOURCES_KEY.format(name))
+    transaction.on_commit(lambda: images_changed(name))
+
+
+def generate_derivatives(name, force=False):
+    """Создаёт и записывает копии одного изображения"""
+    rows = render_derivatives(name, force)
+    record_derivatives(name, rows)
+    return rows
+
+
+def images_changed(name):
+    """Копии появились — сбрасываем кэш карточек и ответов API с этим изображением"""
+    from .cache import product_details_changed
+    from .fragments import invalidate_products
+
+    product_ids = set(Product.objects.filter(
+        Q(image=name) | Q(variants__image=name) | Q(reviews__reviews_image__image=name)
+    ).values_list('id', flat=True))
+    if product_ids:
+        invalidate_products(product_ids)
+    product_details_changed()
+
+
+def image_names():
+    """Все изображения каталога, для которых нужны копии"""
+    names = set()
+    for model, field in IMAGE_FIELDS:
+        names.update(
+            model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+            .values_list(field, flat=True)
+        )
+    return sorted(names)
+
+
+def get_sources(name, storage=None):
+    """Возвращает [(MIME-тип, [(ширина, URL), ...])] для изображения; пусто, если копий ещё нет"""
+    if not name:
+        return []
+    key = SOURCES_KEY.format(name)
+    sources = cache.get(key)
+    if sources is None:
+        storage = storage or default_storage
+        by_format = {}
+        for extension, width, target in (
+            ImageDerivative.objects.filter(source=name).values_list('format', 'width', 'name')
+        ):
+            by_format.setdefault(extension, []).append((width, storage.url(target)))
+        sources = [
+            (mime, sorted(by_format[extension]))
+            for extension, _, mime, _ in DERIVATIVE_FORMATS
+            if extension in by_format
+        ]
+        cache.set(key, sources, SOURCES_TIMEOUT)
+    return sources
+
+
+def srcset(candidates, absolute=None):
+    """Строка srcset: "url 320w, url 640w" """
+    absolute = absolute or (lambda url: url)
+    return ', '.join(f'{absolute(url)} {width}w' for width, url in candidates)
@@ -0,0 +1,338 @@
+"""Потоковый импорт товаров и вариантов из CSV или JSONL.
+
+JSONL — товар в строке, варианты вложены:
+    {"external_id": "A-1", "name": "Футболка", "category": "clothes", "base_price": "999",
+     "variants": [{"size": "M", "color": "Red", "price": "999", "stock": 5, "sku": "A-1-M"}]}
+
+CSV — вариант в строке, поля товара повторяются в каждой строке;
+колонки варианта: size, color, price, stock, sku, variant_is_active.
+Строка без size — товар без вариантов.
+
+Категории указываются slug'ом и ищутся в словарях, загруженных один
+раз. Строки с ошибками (неизвестная категория, отрицательный остаток,
+цена вне диапазона поля, SKU, повторяющийся в выгрузке или занятый
+другим вариантом) пропускаются и попадают в отчёт с номером строки.
+SKU, который в той же пачке переходит к другому варианту (например,
+два варианта обмениваются артикулами), занятым не считается.
+
+Товары (по external_id) и варианты (по товару, размеру и цвету)
+записываются пачками через bulk_create(update_conflicts=True): новые
+строки вставляются, существующие обновляются, поэтому повторный запуск
+на свежей выгрузке работает как дельта-синхронизация. Поля товара из
+выгрузки считаются полными: отсутствующее поле сбрасывается к значению
+по умолчанию.
+
+bulk_create не вызывает сигналы, поэтому поисковый индекс, фасеты и
+кэши обновляются явно после каждой пачки, а итоги корзин
+(cart.summary.prices_changed) — в конце импорта.
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+
+from cart.summary import prices_changed
+from . import facets, fragments, search
+from .cache import catalog_changed, product_details_changed
+from .models import Category, OtherCategory, Product, ProductSalesStats, ProductVariant
+from .variants import invalidate_variant_matrices
+
+FORMATS = ('csv', 'jsonl')
+CSV_VARIANT_COLUMNS = ('size', 'color', 'price', 'stock', 'sku', 'variant_is_active')
+PRODUCT_FIELDS = (
+    'name', 'description', 'short_description', 'base_price', 'sale_price',
+    'category', 'other_category', 'is_active', 'is_featured', 'is_new',
+)
+VARIANT_FIELDS = ('price', 'stock', 'sku', 'is_active')
+DEFAULT_BATCH_SIZE = 5000
+# Больше изменённых товаров — фасеты дешевле перестроить целиком
+FACET_REPLAY_LIMIT = 5000
+# Верхняя граница PositiveIntegerField на всех поддерживаемых СУБД
+MAX_POSITIVE_INT = 2147483647
+
+
+class ImportRowError(ValueError):
+    """Строка выгрузки не может быть импортирована"""
+
+
+def read_records(stream, fmt):
+    """Разбирает выгрузку в поток (номер строки, поля товара, [варианты])"""
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as exc:
+                yield line_no, ImportRowError(f'некорректный JSON: {exc}'), []
+                continue
+            if not isinstance(data, dict):
+                yield line_no, ImportRowError('ожидается объект'), []
+                continue
+            yield line_no, data, data.pop('variants', None) or []
+    elif fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            variant = {column: row.pop(column) for column in CSV_VARIANT_COLUMNS if column in row}
+            if 'variant_is_active' in variant:
+                variant['is_active'] = variant.pop('variant_is_active')
+            yield reader.line_num, row, [variant] if variant.get('size') else []
+    else:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+def _text(data, field, default=''):
+    value = data.get(field)
+    return default if value is None else str(value).strip()
+
+
+def _decimal(data, field, required=False, max_digits=10, decimal_places=2):
+    """Неотрицательная сумма, которая помещается в DecimalField(max_digits, decimal_places)"""
+    value = _text(data, field)
+    if not value:
+        if required:
+            raise ImportRowError(f'не заполнено поле {field}')
+        return None
+    try:
+        number = Decimal(value)
+        if not number.is_finite():
+            raise InvalidOperation
+        # Как и СУБД, округляем до decimal_places знаков после запятой
+        number = number.quantize(Decimal(1).scaleb(-decimal_places))
+    except InvalidOperation:
+        raise ImportRowError(f'{field}: не число «{value}»') from None
+    if number < 0:
+        raise ImportRowError(f'{field}: отрицательное значение «{value}»')
+    if number.adjusted() >= max_digits - decimal_places:
+        raise ImportRowError(f'{field}: слишком большое значение «{value}»')
+    return number
+
+
+def _int(data, field, default=0, minimum=0, maximum=MAX_POSITIVE_INT):
+    value = _text(data, field)
+    try:
+        number = int(value) if value else default
+    except ValueError:
+        raise ImportRowError(f'{field}: не целое число «{value}»') from None
+    if not minimum <= number <= maximum:
+        raise ImportRowError(f'{field}: значение «{value}» вне диапазона {minimum}…{maximum}')
+    return number
+
+
+def _bool(data, field, default):
+    value = data.get(field)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'да')
+
+
+class ImportStats:
+    """Счётчики импорта и скорость обработки"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rows = self.products = self.variants = 0
+        self.errors = []
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f'строк {self.rows}, товаров {self.products}, вариантов {self.variants}, '
+            f'ошибок {len(self.errors)} — {self.rows_per_second:.0f} строк/с'
+        )
+
+
+class CatalogImporter:
+    """Импорт пачками: товары и варианты upsert'ом, затем обновление индексов и кэшей"""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.other_categories = dict(OtherCategory.objects.values_list('slug', 'id'))
+        self.stats = ImportStats()
+        self.changed_ids = set()
+        self.facets_overflow = False
+
+    def run(self, records, progress=None):
+        """Импортирует записи; progress(stats) вызывается после каждой пачки"""
+        products, variants, lines, skus, pending = {}, {}, {}, {}, 0
+        for line_no, data, variant_rows in records:
+            self.stats.rows += max(1, len(variant_rows))
+            try:
+                if isinstance(data, ImportRowError):
+                    raise data
+                product = self._product(data)
+                rows = [self._variant(row) for row in variant_rows]
+                record_skus = self._check_skus(product.external_id, rows, skus, lines)
+            except ImportRowError as exc:
+                self.stats.errors.append((line_no, str(exc)))
+                continue
+            skus.update(record_skus)
+            products[product.external_id] = product
+            for variant in rows:
+                key = (product.external_id, variant.size, variant.color)
+                variants[key] = variant
+                lines[key] = line_no
+            pending += 1 + len(rows)
+            if pending >= self.batch_size:
+                self._flush(products, variants, lines)
+                products, variants, lines, skus, pending = {}, {}, {}, {}, 0
+                if progress:
+                    progress(self.stats)
+        if products:
+            self._flush(products, variants, lines)
+            if progress:
+                progress(self.stats)
+        self._finish()
+        return self.stats
+
+    @staticmethod
+    def _check_skus(external_id, rows, skus, lines):
+        """SKU уникален: другой вариант пачки с тем же SKU — ошибка строки.
+
+        Возвращает {sku: ключ варианта} для вариантов записи.
+        """
+        record_skus = {}
+        for variant in rows:
+            if not variant.sku:
+                continue
+            key = (external_id, variant.size, variant.color)
+            owner = record_skus.get(variant.sku) or skus.get(variant.sku)
+            if owner is not None and owner != key:
+                where = f' (строка {lines[owner]})' if owner in lines else ''
+                raise ImportRowError(f'sku «{variant.sku}» повторяется в выгрузке{where}')
+            record_skus[variant.sku] = key
+        return record_skus
+
+    def _product(self, data):
+        external_id = _text(data, 'external_id')
+        if not external_id:
+            raise ImportRowError('не заполнено поле external_id')
+        name = _text(data, 'name')
+        if not name:
+            raise ImportRowError('не заполнено поле name')
+        category = _text(data, 'category')
+        if category not in self.categories:
+            raise ImportRowError(f'неизвестная категория «{category}»')
+        other_category = _text(data, 'other_category')
+        if other_category and other_category not in self.other_categories:
+            raise ImportRowError(f'неизвестная дополнительная категория «{other_category}»')
+        return Product(
+            external_id=external_id,
+            name=name,
+            description=_text(data, 'description'),
+            short_description=_text(data, 'short_description'),
+            base_price=_decimal(data, 'base_price', required=True),
+            sale_price=_decimal(data, 'sale_price'),
+            category_id=self.categories[category],
+            other_category_id=self.other_categories.get(other_category),
+            is_active=_bool(data, 'is_active', True),
+            is_featured=_bool(data, 'is_featured', False),
+            is_new=_bool(data, 'is_new', False),
+        )
+
+    def _variant(self, data):
+        size, color = _text(data, 'size'), _text(data, 'color')
+        if not size or not color:
+            raise ImportRowError('у варианта должны быть size и color')
+        return ProductVariant(
+            size=size,
+            color=color,
+            price=_decimal(data, 'price', required=True),
+            stock=_int(data, 'stock'),
+            sku=_text(data, 'sku') or None,
+            is_active=_bool(data, 'is_active', True),
+        )
+
+    @staticmethod
+    def _upsert(model, objs, unique_fields, update_fields):
+        # MySQL не поддерживает указание ключа конфликта (ON DUPLICATE KEY UPDATE)
+        if not connection.features.supports_update_conflicts_with_target:
+            unique_fields = None
+        model.objects.bulk_create(
+            objs,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields + ('updated_at',),
+        )
+
+    def _skip_taken_skus(self, variants, lines):
+        """Убирает из пачки варианты, чей SKU занят другим вариантом в БД.
+
+        SKU не занят, если его владелец в той же пачке получает другой SKU.
+        Возвращает такие SKU: перед записью пачки их нужно освободить.
+        """
+        while True:
+            skus = {variant.sku: key for key, variant in variants.items() if variant.sku}
+            taken = (
+                ProductVariant.objects.filter(sku__in=skus)
+                .values_list('sku', 'product__external_id', 'size', 'color')
+            )
+            released, rejected = set(), False
+            for sku, *owner in taken:
+                key, owner = skus[sku], tuple(owner)
+                if owner == key:
+                    continue
+                if owner in variants and variants[owner].sku != sku:
+                    released.add(sku)
+                    continue
+                del variants[key]
+                self.stats.errors.append((lines[key], f'sku «{sku}» уже занят другим вариантом'))
+                rejected = True
+            # Отклонённый вариант мог освобождать SKU для другого — проверяем заново
+            if not rejected:
+                return released
+
+    def _flush(self, products, variants, lines):
+        released = self._skip_taken_skus(variants, lines)
+        with transaction.atomic():
+            if released:
+                # Артикулы переходят между вариантами пачки: освобождаем их до записи
+                ProductVariant.objects.filter(sku__in=released).update(sku=None)
+            self._upsert(Product, list(products.values()), ('external_id',), PRODUCT_FIELDS)
+            # bulk_create возвращает id не на всех СУБД — читаем их явно
+            ids = dict(
+                Product.objects.filter(external_id__in=products.keys()).values_list('external_id', 'id')
+            )
+            rows = []
+            for (external_id, _, _), variant in variants.items():
+                variant.product_id = ids[external_id]
+                rows.append(variant)
+            if rows:
+                self._upsert(ProductVariant, rows, ('product', 'size', 'color'), VARIANT_FIELDS)
+            product_ids = list(ids.values())
+            ProductSalesStats.objects.bulk_create(
+                [ProductSalesStats(product_id=pk) for pk in product_ids], ignore_conflicts=True,
+            )
+            search.index_products(product_ids)
+            fragments.invalidate_products(product_ids)
+        invalidate_variant_matrices(product_ids)
+        self.stats.products += len(products)
+        self.stats.variants += len(rows)
+        if not self.facets_overflow:
+            self.changed_ids.update(product_ids)
+            self.facets_overflow = len(self.changed_ids) > FACET_REPLAY_LIMIT
+
+    def _finish(self):
+        if self.facets_overflow:
+            facets.products_changed()
+        elif self.changed_ids:
+            facets.products_changed(self.changed_ids)
+        if self.stats.products:
+            catalog_changed()
+            product_details_changed()
+        if self.stats.variants:
+            # Цены вариантов входят в кэшированные итоги корзин
+            prices_changed()
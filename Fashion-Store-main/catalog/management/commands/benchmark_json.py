@@ -0,0 +1,82 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from catalog.models import Product
+from catalog.serializers import ProductSerializer
+from fashion_store.renderers import FastJSONRenderer, orjson
+from orders.models import Order
+from orders.serializers import OrderSerializer
+
+
+def _sample_products(rows):
+    """Синтетический ответ списка товаров (если в БД мало данных)"""
+    now = timezone.now().isoformat()
+    return [
+        {
+            "id": i, "name": f"Product {i}", "description": "Cotton t-shirt " * 5,
+            "base_price": str(Decimal("1999.00") + i), "image": None,
+            "category": {"id": 1, "name": "Men", "slug": "men"},
+            "variants": [
+                {"id": i * 10 + j, "size": size, "color": "Black", "price": str(Decimal("1999.00") + j), "stock": j}
+                for j, size in enumerate(("S", "M", "L", "XL"))
+            ],
+            "rating_avg": "4.50", "rating_count": 12,
+            "rating_histogram": {"5": 8, "4": 2, "3": 1, "2": 1, "1": 0},
+            "created_at": now,
+        }
+        for i in range(rows)
+    ]
+
+
+def _sample_orders(rows):
+    now = timezone.now().isoformat()
+    return [
+        {
+            "id": i, "user": 1, "status": "paid", "tracking_number": f"TRK{i}", "coupon": None,
+            "total_amount": str(Decimal("4598.00")), "created_at": now,
+            "items": [
+                {"id": i * 10 + j, "variant": {"id": j, "size": "M", "color": "Red", "price": "2299.00", "stock": 3},
+                 "quantity": 1, "price": "2299.00"}
+                for j in range(2)
+            ],
+        }
+        for i in range(rows)
+    ]
+
+
+class Command(BaseCommand):
+    help = "Сравнивает стандартный JSONRenderer DRF с быстрым (orjson) на ответах товаров и заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=500, help="Объектов в одном ответе")
+        parser.add_argument("--repeat", type=int, default=50, help="Повторов рендера")
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson не установлен — быстрый рендерер работает через json"))
+
+        products = Product.objects.select_related("category").prefetch_related("variants")[:rows]
+        orders = Order.objects.prefetch_related("items__variant")[:rows]
+        payloads = {
+            "products": ProductSerializer(products, many=True).data if len(products) >= rows else _sample_products(rows),
+            "orders": OrderSerializer(orders, many=True).data if len(orders) >= rows else _sample_orders(rows),
+        }
+        renderers = {"drf json": JSONRenderer(), "fast json": FastJSONRenderer()}
+
+        for name, payload in payloads.items():
+            timings = {}
+            for label, renderer in renderers.items():
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    body = renderer.render(payload)
+                timings[label] = (time.perf_counter() - started) / repeat
+                self.stdout.write(
+                    f"{name:<9} {label:<10} {timings[label] * 1000:8.2f} мс/ответ  {len(body) / 1024:8.1f} КБ"
+                )
+            speedup = timings["drf json"] / timings["fast json"] if timings["fast json"] else 0
+            self.stdout.write(self.style.SUCCESS(f"{name}: ускорение x{speedup:.1f}"))
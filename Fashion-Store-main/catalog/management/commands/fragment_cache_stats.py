@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from catalog.fragments import stats
+
+
+class Command(BaseCommand):
+    help = "Показывает попадания и промахи кэша фрагментов товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Обнулить счётчики после вывода")
+
+    def handle(self, *args, **options):
+        summary = stats.summary()
+        if not summary:
+            self.stdout.write("Статистики пока нет")
+        for name, row in sorted(summary.items()):
+            self.stdout.write(
+                f"{name}: попаданий {row['hits']}, промахов {row['misses']}, "
+                f"доля попаданий {row['hit_rate']:.1%}"
+            )
+        if options["reset"]:
+            stats.reset()
+            self.stdout.write(self.style.SUCCESS("Счётчики обнулены"))
@@ -0,0 +1,38 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand
+
+from catalog.images import image_names, record_derivatives, render_safely
+
+
+class Command(BaseCommand):
+    help = "Создаёт AVIF/WebP-копии для уже загруженных изображений каталога"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Число процессов для перекодирования")
+        parser.add_argument("--force", action="store_true", help="Перекодировать и существующие копии")
+
+    def handle(self, *args, **options):
+        names = image_names()
+        if not names:
+            self.stdout.write("Изображений нет")
+            return
+
+        # Рабочие процессы только перекодируют файлы, записи в БД делает этот процесс
+        render = partial(render_safely, force=options["force"])
+        created = failed = 0
+        with ProcessPoolExecutor(max_workers=max(1, options["workers"]), initializer=django.setup) as pool:
+            for name, rows, error in pool.map(render, names, chunksize=4):
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                record_derivatives(name, rows)
+                created += len(rows)
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано изображений: {len(names) - failed}, копий: {created}, ошибок: {failed}"
+        ))
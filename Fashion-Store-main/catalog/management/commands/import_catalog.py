@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.importer import DEFAULT_BATCH_SIZE, FORMATS, CatalogImporter, read_records
+
+MAX_REPORTED_ERRORS = 50
+
+
+class Command(BaseCommand):
+    help = "Импортирует товары и варианты из CSV или JSONL (вставка и обновление пачками)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл выгрузки или '-' для stdin")
+        parser.add_argument("--format", choices=FORMATS, help="По умолчанию — по расширению файла")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Строк (товаров и вариантов) в одной транзакции")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        importer = CatalogImporter(batch_size=max(1, options["batch_size"]))
+        try:
+            stream = sys.stdin if path == "-" else open(path, encoding="utf-8-sig", newline="")
+        except OSError as exc:
+            raise CommandError(f"Не удалось открыть {path}: {exc}")
+        with stream:
+            stats = importer.run(read_records(stream, fmt), progress=lambda s: self.stdout.write(str(s)))
+
+        for line_no, message in stats.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f"строка {line_no}: {message}")
+        if len(stats.errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f"… и ещё {len(stats.errors) - MAX_REPORTED_ERRORS} ошибок")
+        self.stdout.write(self.style.SUCCESS(f"Готово за {stats.elapsed:.1f} с: {stats}"))
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import media
+
+
+class Command(BaseCommand):
+    help = "Удаляет медиафайлы, на которые не ссылается ни один объект"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace-hours", type=float, default=media.GC_GRACE.total_seconds() / 3600,
+                            help="Не трогать файлы, потерявшие ссылки позже этого срока")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет удалено")
+        parser.add_argument("--recount", action="store_true",
+                            help="Пересчитать ссылки по БД и учесть файлы в каталогах загрузки")
+        parser.add_argument("--rehash", action="store_true",
+                            help="Перенести файлы со старыми именами на адреса по содержимому")
+
+    def handle(self, *args, **options):
+        if options["rehash"]:
+            if not hasattr(default_storage, "is_content_name"):
+                raise CommandError("--rehash требует ContentAddressedStorage в STORAGES['default']")
+            renamed = media.rehash_legacy_files()
+            self.stdout.write(f"Перенесено файлов: {len(renamed)}, уникальных: {len(set(renamed.values()))}")
+        if options["recount"]:
+            self.stdout.write(f"Исправлено счётчиков: {media.recount(scan=True)}")
+
+        removed = media.collect_garbage(timedelta(hours=options["grace_hours"]), dry_run=options["dry_run"])
+        for name in removed:
+            self.stdout.write(name)
+        verb = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(self.style.SUCCESS(f"{verb} файлов: {len(removed)}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from catalog import search
+
+
+class Command(BaseCommand):
+    help = "Полностью перестраивает полнотекстовый индекс товаров"
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            self.stdout.write(self.style.WARNING("FTS-индекс поддерживается только для SQLite"))
+            return
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Поисковый индекс перестроен"))
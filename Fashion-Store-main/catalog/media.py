@@ -0,0 +1,163 @@
+"""Учёт ссылок на медиафайлы и сборка мусора.
+
+При адресации по содержимому (fashion_store.storage) один файл может
+принадлежать нескольким товарам, вариантам или отзывам, поэтому файл
+нельзя удалять вместе с объектом. Сигналы ведут счётчик ссылок в
+MediaFile; файлы, на которые давно никто не ссылается, удаляет
+collect_garbage() вместе с их AVIF/WebP-копиями.
+
+Массовые update() и загрузка фикстур сигналов не вызывают — recount()
+пересчитывает счётчики по полям-изображениям целиком.
+"""
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .images import IMAGE_FIELDS, SOURCES_KEY
+from .models import ImageDerivative, MediaFile
+
+GC_GRACE = timedelta(hours=24)
+
+
+def _adjust(names, delta):
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    now = timezone.now()
+    MediaFile.objects.bulk_create([MediaFile(name=name) for name in counts], ignore_conflicts=True)
+    for name, count in counts.items():
+        MediaFile.objects.filter(name=name).update(
+            refcount=Greatest(F('refcount') + delta * count, Value(0)),
+            updated_at=now,
+        )
+
+
+def add_references(names):
+    _adjust(names, 1)
+
+
+def remove_references(names):
+    _adjust(names, -1)
+
+
+def image_replaced(previous, current):
+    """Объект сменил изображение: ссылка переходит со старого файла на новый"""
+    if previous != current:
+        add_references([current])
+        remove_references([previous])
+
+
+def referenced_names():
+    """Counter {имя файла: число ссылок} по всем полям-изображениям"""
+    counts = Counter()
+    for model, field in IMAGE_FIELDS:
+        counts.update(model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                      .values_list(field, flat=True).iterator())
+    return counts
+
+
+def _walk(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from _walk(storage, posixpath.join(path, directory))
+
+
+def upload_directories():
+    return sorted({model._meta.get_field(field).upload_to.rstrip('/') for model, field in IMAGE_FIELDS})
+
+
+def recount(scan=False, storage=None):
+    """Пересчитывает ссылки по БД; с scan=True регистрирует и файлы, о которых не знает учёт.
+
+    Возвращает число исправленных записей.
+    """
+    storage = storage or default_storage
+    counts = referenced_names()
+    if scan:
+        derived = set(ImageDerivative.objects.values_list('name', flat=True))
+        for directory in upload_directories():
+            if storage.exists(directory):
+                counts.update({name: 0 for name in _walk(storage, directory) if name not in derived})
+
+    now = timezone.now()
+    rows = {row.name: row for row in MediaFile.objects.all()}
+    changed = []
+    for name, row in rows.items():
+        refcount = counts.get(name, 0)
+        if row.refcount != refcount:
+            row.refcount, row.updated_at = refcount, now
+            changed.append(row)
+    MediaFile.objects.bulk_update(changed, ['refcount', 'updated_at'], batch_size=500)
+    missing = [MediaFile(name=name, refcount=count) for name, count in counts.items() if name not in rows]
+    MediaFile.objects.bulk_create(missing, batch_size=500, ignore_conflicts=True)
+    return len(changed) + len(missing)
+
+
+def collect_garbage(grace=GC_GRACE, dry_run=False, storage=None):
+    """Удаляет файлы без ссылок старше grace и их копии; возвращает список удалённых"""
+    storage = storage or default_storage
+    cutoff = timezone.now() - grace
+    candidates = list(
+        MediaFile.objects.filter(refcount=0, updated_at__lt=cutoff).values_list('name', flat=True)
+    )
+    removed = []
+    for name in candidates:
+        # Файл могли только что загрузить повторно — ссылка на него ещё не записана
+        if storage.exists(name) and storage.get_modified_time(name) >= cutoff:
+            continue
+        if dry_run:
+            removed.append(name)
+            continue
+        with transaction.atomic():
+            if not MediaFile.objects.filter(name=name, refcount=0).delete()[0]:
+                continue
+            derived = list(ImageDerivative.objects.filter(source=name).values_list('name', flat=True))
+            ImageDerivative.objects.filter(source=name).delete()
+        for target in derived + [name]:
+            storage.delete(target)
+        cache.delete(SOURCES_KEY.format(name))
+        removed.append(name)
+    return removed
+
+
+def rehash_legacy_files(storage=None):
+    """Переносит файлы со старыми именами на адреса по содержимому.
+
+    Одинаковые файлы сливаются в один; старые остаются без ссылок и
+    удаляются следующим collect_garbage(). Возвращает {старое имя: новое}.
+    """
+    from .cache import catalog_changed, product_details_changed
+    from .fragments import invalidate_shared
+
+    storage = storage or default_storage
+    renamed = {}
+    for name in referenced_names():
+        if storage.is_content_name(name) or not storage.exists(name):
+            continue
+        with storage.open(name, 'rb') as fh:
+            new_name = storage.save(name, fh)
+        with transaction.atomic():
+            for model, field in IMAGE_FIELDS:
+                model.objects.filter(**{field: name}).update(**{field: new_name})
+            derivatives = ImageDerivative.objects.filter(source=name)
+            if ImageDerivative.objects.filter(source=new_name).exists():
+                derivatives.delete()
+            else:
+                derivatives.update(source=new_name)
+        cache.delete_many([SOURCES_KEY.format(name), SOURCES_KEY.format(new_name)])
+        renamed[name] = new_name
+    if renamed:
+        recount(storage=storage)
+        invalidate_shared()
+        catalog_changed()
+        product_details_changed()
+    return renamed
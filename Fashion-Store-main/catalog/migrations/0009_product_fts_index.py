@@ -0,0 +1,41 @@
+from django.db import migrations
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_product_fts USING fts5("
+    "name, short_description, description, category, other_category, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+POPULATE_SQL = (
+    "INSERT INTO catalog_product_fts "
+    "(rowid, name, short_description, description, category, other_category) "
+    "SELECT p.id, p.name, p.short_description, p.description, "
+    "COALESCE(c.name, ''), COALESCE(o.name, '') "
+    "FROM catalog_product p "
+    "LEFT JOIN catalog_category c ON c.id = p.category_id "
+    "LEFT JOIN catalog_othercategory o ON o.id = p.other_category_id"
+)
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(POPULATE_SQL)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS catalog_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_collection_productcollection_product_collections'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
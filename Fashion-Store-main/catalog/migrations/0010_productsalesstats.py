@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, Max, Sum
+
+
+def backfill_sales_stats(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    ProductSalesStats = apps.get_model('catalog', 'ProductSalesStats')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    totals = {
+        row['variant__product_id']: row
+        for row in OrderItem.objects.values('variant__product_id').annotate(
+            units=Sum('quantity'),
+            amount=Sum(F('quantity') * F('price')),
+            last=Max('created_at'),
+        )
+    }
+    ProductSalesStats.objects.bulk_create(
+        [
+            ProductSalesStats(
+                product_id=product_id,
+                units_sold=totals.get(product_id, {}).get('units') or 0,
+                revenue=totals.get(product_id, {}).get('amount') or 0,
+                last_sold_at=totals.get(product_id, {}).get('last'),
+            )
+            for product_id in Product.objects.values_list('id', flat=True)
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_product_fts_index'),
+        ('orders', '0004_alter_coupon_options_alter_order_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesStats',
+            fields=[
+                ('product', models.OneToOneField(help_text='Товар, к которому относится статистика', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales_stats', serialize=False, to='catalog.product', verbose_name='Товар')),
+                ('units_sold', models.PositiveIntegerField(db_index=True, default=0, help_text='Количество проданных единиц за всё время', verbose_name='Продано единиц')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Выручка за всё время', max_digits=14, verbose_name='Выручка')),
+                ('last_sold_at', models.DateTimeField(blank=True, help_text='Дата последней продажи', null=True, verbose_name='Последняя продажа')),
+                ('units_sold_7d', models.PositiveIntegerField(default=0, help_text='Количество проданных единиц за последние 7 дней', verbose_name='Продано за 7 дней')),
+                ('units_sold_30d', models.PositiveIntegerField(default=0, help_text='Количество проданных единиц за последние 30 дней', verbose_name='Продано за 30 дней')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Статистика продаж',
+                'verbose_name_plural': 'Статистика продаж',
+                'db_table': 'catalog_productsalesstats',
+            },
+        ),
+        migrations.RunPython(backfill_sales_stats, migrations.RunPython.noop),
+    ]
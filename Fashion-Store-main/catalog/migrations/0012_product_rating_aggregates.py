@@ -0,0 +1,75 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:29
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_ratings(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    Review = apps.get_model('catalog', 'Review')
+    histograms = defaultdict(dict)
+    rows = (
+        Review.objects.filter(is_approved=True)
+        .values_list('product_id', 'rating')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for product_id, rating, n in rows:
+        histograms[product_id][rating] = n
+    for product_id, histogram in histograms.items():
+        count = sum(histogram.values())
+        total = sum(stars * n for stars, n in histogram.items())
+        Product.objects.filter(pk=product_id).update(
+            rating_count=count,
+            rating_avg=(Decimal(total) / count).quantize(Decimal('0.01')),
+            **{f'rating_{stars}': histogram.get(stars, 0) for stars in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок «1»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок «2»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок «3»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок «4»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, verbose_name='Оценок «5»'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Средняя оценка по одобренным отзывам', max_digits=3, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, help_text='Количество одобренных отзывов', verbose_name='Количество оценок'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
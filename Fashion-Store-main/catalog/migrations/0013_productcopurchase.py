@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(help_text='Место в списке рекомендаций, начиная с 1', verbose_name='Позиция')),
+                ('score', models.PositiveIntegerField(help_text='В скольких заказах товары встретились вместе', verbose_name='Совместных заказов')),
+                ('product', models.ForeignKey(help_text='Товар, для которого посчитаны рекомендации', on_delete=django.db.models.deletion.CASCADE, related_name='co_purchases', to='catalog.product', verbose_name='Товар')),
+                ('related', models.ForeignKey(help_text='Товар, который покупают вместе с данным', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product', verbose_name='Связанный товар')),
+            ],
+            options={
+                'verbose_name': 'Совместная покупка',
+                'verbose_name_plural': 'Совместные покупки',
+                'db_table': 'catalog_productcopurchase',
+                'ordering': ['product', 'rank'],
+                'unique_together': {('product', 'rank')},
+            },
+        ),
+    ]
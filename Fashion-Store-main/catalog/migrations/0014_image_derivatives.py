@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_productcopurchase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(db_index=True, help_text='Путь к исходному изображению в хранилище', max_length=255, verbose_name='Оригинал')),
+                ('format', models.CharField(help_text='Формат копии: avif или webp', max_length=10, verbose_name='Формат')),
+                ('width', models.PositiveIntegerField(help_text='Ширина копии в пикселях', verbose_name='Ширина')),
+                ('name', models.CharField(help_text='Путь к копии в хранилище', max_length=255, verbose_name='Файл')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Копия изображения',
+                'verbose_name_plural': 'Копии изображений',
+                'db_table': 'catalog_imagederivative',
+                'ordering': ['source', 'format', 'width'],
+                'unique_together': {('source', 'format', 'width')},
+            },
+        ),
+    ]
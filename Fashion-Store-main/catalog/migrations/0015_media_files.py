@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:47
+
+from collections import Counter
+
+import django.utils.timezone
+from django.db import migrations, models
+
+IMAGE_MODELS = ('Product', 'ProductVariant', 'Category', 'ReviewImage')
+
+
+def count_references(apps, schema_editor):
+    MediaFile = apps.get_model('catalog', 'MediaFile')
+    counts = Counter()
+    for model_name in IMAGE_MODELS:
+        model = apps.get_model('catalog', model_name)
+        counts.update(model.objects.exclude(image__isnull=True).exclude(image='').values_list('image', flat=True))
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, refcount=count) for name, count in counts.items()], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Путь к файлу в хранилище', max_length=255, unique=True, verbose_name='Файл')),
+                ('refcount', models.PositiveIntegerField(default=0, help_text='Сколько записей ссылаются на файл; файлы без ссылок удаляет media_gc', verbose_name='Ссылок')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Когда в последний раз менялось число ссылок', verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+                'db_table': 'catalog_mediafile',
+                'indexes': [models.Index(fields=['refcount', 'updated_at'], name='catalog_med_refcoun_062941_idx')],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
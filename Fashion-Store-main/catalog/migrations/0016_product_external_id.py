@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 01:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_media_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='Идентификатор товара во внешней системе (ключ для import_catalog)', max_length=64, null=True, unique=True, verbose_name='Внешний идентификатор'),
+        ),
+    ]
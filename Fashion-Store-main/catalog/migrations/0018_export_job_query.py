@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0017_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='query',
+            field=models.BinaryField(blank=True, help_text='Что выгружать: сохранённый запрос выбранных строк', verbose_name='Запрос'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from accounts.models import User
 
@@ -178,6 +179,14 @@ class Product(models.Model):
         null=True,
         help_text=_("Дополнительная категория товара")
     )
+    external_id = models.CharField(
+        verbose_name=_("Внешний идентификатор"),
+        max_length=64,
+        unique=True,
+        blank=True,
+        null=True,
+        help_text=_("Идентификатор товара во внешней системе (ключ для import_catalog)")
+    )
     is_active = models.BooleanField(
         verbose_name=_("Активен"),
         default=True,
@@ -207,6 +216,24 @@ class Product(models.Model):
         blank=True,
         help_text=_("Размеры товара (ДxШxВ)")
     )
+    # Агрегаты по одобренным отзывам, пересчитываются сигналами Review
+    rating_avg = models.DecimalField(
+        verbose_name=_("Средняя оценка"),
+        max_digits=3,
+        decimal_places=2,
+        default=0,
+        help_text=_("Средняя оценка по одобренным отзывам")
+    )
+    rating_count = models.PositiveIntegerField(
+        verbose_name=_("Количество оценок"),
+        default=0,
+        help_text=_("Количество одобренных отзывов")
+    )
+    rating_1 = models.PositiveIntegerField(verbose_name=_("Оценок «1»"), default=0)
+    rating_2 = models.PositiveIntegerField(verbose_name=_("Оценок «2»"), default=0)
+    rating_3 = models.PositiveIntegerField(verbose_name=_("Оценок «3»"), default=0)
+    rating_4 = models.PositiveIntegerField(verbose_name=_("Оценок «4»"), default=0)
+    rating_5 = models.PositiveIntegerField(verbose_name=_("Оценок «5»"), default=0)
     created_at = models.DateTimeField(
         verbose_name=_("Дата создания"),
         auto_now_add=True
@@ -228,6 +255,13 @@ class Product(models.Model):
         verbose_name_plural = _("Товары")
         ordering = ['-created_at']
         db_table = 'catalog_product'
+        # Составные индексы под keyset-пагинацию по каждой допустимой сортировке
+        indexes = [
+            models.Index(fields=['name', 'id'], name='catalog_product_name_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='catalog_product_created_id_idx'),
+            models.Index(fields=['base_price', 'id'], name='catalog_product_base_id_idx'),
+            models.Index(fields=['sale_price', 'id'], name='catalog_product_sale_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.category.name}"
@@ -255,14 +289,19 @@ class Product(models.Model):
 
     def get_average_rating(self):
         """Возвращает средний рейтинг товара"""
-        reviews = self.reviews.all()
-        if reviews:
-            return sum(review.rating for review in reviews) / len(reviews)
-        return 0
+        return self.rating_avg
 
     def get_reviews_count(self):
         """Возвращает количество отзывов"""
-        return self.reviews.count()
+        return self.rating_count
+
+    def get_rating_histogram(self):
+        """Возвращает распределение оценок: [(звёзды, количество, процент)] от 5 до 1"""
+        return [
+            (stars, count, round(count * 100 / self.rating_count) if self.rating_count else 0)
+            for stars in range(5, 0, -1)
+            for count in [getattr(self, f'rating_{stars}')]
+        ]
 
 class ProductVariant(models.Model):
     """Модель варианта товара"""
@@ -351,6 +390,95 @@ class ProductVariant(models.Model):
         else:
             return "В наличии"
 
+class ProductSalesStats(models.Model):
+    """Агрегированная статистика продаж товара"""
+
+    product = models.OneToOneField(
+        Product,
+        verbose_name=_("Товар"),
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='sales_stats',
+        help_text=_("Товар, к которому относится статистика")
+    )
+    units_sold = models.PositiveIntegerField(
+        verbose_name=_("Продано единиц"),
+        default=0,
+        db_index=True,
+        help_text=_("Количество проданных единиц за всё время")
+    )
+    revenue = models.DecimalField(
+        verbose_name=_("Выручка"),
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text=_("Выручка за всё время")
+    )
+    last_sold_at = models.DateTimeField(
+        verbose_name=_("Последняя продажа"),
+        blank=True,
+        null=True,
+        help_text=_("Дата последней продажи")
+    )
+    units_sold_7d = models.PositiveIntegerField(
+        verbose_name=_("Продано за 7 дней"),
+        default=0,
+        help_text=_("Количество проданных единиц за последние 7 дней")
+    )
+    units_sold_30d = models.PositiveIntegerField(
+        verbose_name=_("Продано за 30 дней"),
+        default=0,
+        help_text=_("Количество проданных единиц за последние 30 дней")
+    )
+    updated_at = models.DateTimeField(
+        verbose_name=_("Дата обновления"),
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = _("Статистика продаж")
+        verbose_name_plural = _("Статистика продаж")
+        db_table = 'catalog_productsalesstats'
+
+    def __str__(self):
+        return f"{self.product.name}: {self.units_sold}"
+
+class ProductCoPurchase(models.Model):
+    """Товары, которые чаще всего покупают вместе с данным (top-K по заказам)"""
+
+    product = models.ForeignKey(
+        Product,
+        verbose_name=_("Товар"),
+        on_delete=models.CASCADE,
+        related_name='co_purchases',
+        help_text=_("Товар, для которого посчитаны рекомендации")
+    )
+    related = models.ForeignKey(
+        Product,
+        verbose_name=_("Связанный товар"),
+        on_delete=models.CASCADE,
+        related_name='+',
+        help_text=_("Товар, который покупают вместе с данным")
+    )
+    rank = models.PositiveSmallIntegerField(
+        verbose_name=_("Позиция"),
+        help_text=_("Место в списке рекомендаций, начиная с 1")
+    )
+    score = models.PositiveIntegerField(
+        verbose_name=_("Совместных заказов"),
+        help_text=_("В скольких заказах товары встретились вместе")
+    )
+
+    class Meta:
+        verbose_name = _("Совместная покупка")
+        verbose_name_plural = _("Совместные покупки")
+        unique_together = ('product', 'rank')
+        ordering = ['product', 'rank']
+        db_table = 'catalog_productcopurchase'
+
+    def __str__(self):
+        return f"{self.product_id} → {self.related_id} ({self.score})"
+
 class Review(models.Model):
     """Модель отзыва о товаре"""
     
@@ -461,4 +589,167 @@ class ReviewImage(models.Model):
         return f"Изображение {self.id}"
 
 
+class ImageDerivative(models.Model):
+    """Уменьшенная копия изображения в современном формате (для srcset)"""
 
+    source = models.CharField(
+        verbose_name=_("Оригинал"),
+        max_length=255,
+        db_index=True,
+        help_text=_("Путь к исходному изображению в хранилище")
+    )
+    format = models.CharField(
+        verbose_name=_("Формат"),
+        max_length=10,
+        help_text=_("Формат копии: avif или webp")
+    )
+    width = models.PositiveIntegerField(
+        verbose_name=_("Ширина"),
+        help_text=_("Ширина копии в пикселях")
+    )
+    name = models.CharField(
+        verbose_name=_("Файл"),
+        max_length=255,
+        help_text=_("Путь к копии в хранилище")
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("Дата создания"),
+        auto_now_add=True
+    )
+
+    class Meta:
+        verbose_name = _("Копия изображения")
+        verbose_name_plural = _("Копии изображений")
+        unique_together = ('source', 'format', 'width')
+        ordering = ['source', 'format', 'width']
+        db_table = 'catalog_imagederivative'
+
+    def __str__(self):
+        return f"{self.source} → {self.width}w {self.format}"
+
+
+class MediaFile(models.Model):
+    """Файл в медиахранилище и число ссылок на него из полей-изображений"""
+
+    name = models.CharField(
+        verbose_name=_("Файл"),
+        max_length=255,
+        unique=True,
+        help_text=_("Путь к файлу в хранилище")
+    )
+    refcount = models.PositiveIntegerField(
+        verbose_name=_("Ссылок"),
+        default=0,
+        help_text=_("Сколько записей ссылаются на файл; файлы без ссылок удаляет media_gc")
+    )
+    updated_at = models.DateTimeField(
+        verbose_name=_("Дата изменения"),
+        default=timezone.now,
+        help_text=_("Когда в последний раз менялось число ссылок")
+    )
+
+    class Meta:
+        verbose_name = _("Медиафайл")
+        verbose_name_plural = _("Медиафайлы")
+        indexes = [models.Index(fields=['refcount', 'updated_at'])]
+        db_table = 'catalog_mediafile'
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
+
+
+EXPORT_STATUS = (
+    ('pending', _('В очереди')),
+    ('running', _('Выполняется')),
+    ('done', _('Готово')),
+    ('failed', _('Ошибка')),
+)
+
+EXPORT_KIND = (
+    ('products_pdf', _('PDF-каталог товаров')),
+)
+
+
+class ExportJob(models.Model):
+    """Фоновая выгрузка, запущенная из админки"""
+
+    user = models.ForeignKey(
+        User,
+        verbose_name=_("Пользователь"),
+        on_delete=models.CASCADE,
+        related_name='export_jobs',
+        help_text=_("Кто запустил выгрузку")
+    )
+    kind = models.CharField(
+        verbose_name=_("Тип"),
+        max_length=30,
+        choices=EXPORT_KIND,
+        help_text=_("Что выгружается")
+    )
+    status = models.CharField(
+        verbose_name=_("Статус"),
+        max_length=20,
+        choices=EXPORT_STATUS,
+        default='pending',
+        help_text=_("Состояние выгрузки")
+    )
+    total = models.PositiveIntegerField(
+        verbose_name=_("Всего строк"),
+        default=0
+    )
+    processed = models.PositiveIntegerField(
+        verbose_name=_("Обработано строк"),
+        default=0
+    )
+    query = models.BinaryField(
+        verbose_name=_("Запрос"),
+        blank=True,
+        editable=False,
+        help_text=_("Что выгружать: сохранённый запрос выбранных строк")
+    )
+    file = models.FileField(
+        verbose_name=_("Файл"),
+        upload_to='exports/',
+        blank=True,
+        help_text=_("Готовый файл выгрузки")
+    )
+    error = models.TextField(
+        verbose_name=_("Ошибка"),
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("Дата создания"),
+        auto_now_add=True
+    )
+    finished_at = models.DateTimeField(
+        verbose_name=_("Дата завершения"),
+        blank=True,
+        null=True
+    )
+    notified_at = models.DateTimeField(
+        verbose_name=_("Пользователь уведомлён"),
+        blank=True,
+        null=True,
+        help_text=_("Когда пользователю показали ссылку на результат")
+    )
+
+    class Meta:
+        verbose_name = _("Выгрузка")
+        verbose_name_plural = _("Выгрузки")
+        ordering = ['-created_at']
+        db_table = 'catalog_exportjob'
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk}"
+
+    @property
+    def progress_percent(self):
+        """Возвращает процент выполнения"""
+        if self.status == 'done':
+            return 100
+        return int(self.processed * 100 / self.total) if self.total else 0
+
+    def report_progress(self, processed):
+        """Сохраняет прогресс, не трогая остальные поля"""
+        self.processed = processed
+        ExportJob.objects.filter(pk=self.pk).update(processed=processed)
@@ -0,0 +1,244 @@
+"""Keyset-пагинация (по курсору) для списков товаров.
+
+Вместо OFFSET/LIMIT следующая страница выбирается условием
+«после последней показанной строки» по полю сортировки и id,
+поэтому страница N стоит столько же, сколько первая.
+"""
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import F, Q
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+APPROX_COUNT_TIMEOUT = 5 * 60
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или выдан для другой сортировки"""
+
+
+class KeysetPage:
+    """Страница keyset-пагинации"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Пагинатор по ключу (поле сортировки, id).
+
+    ordering — имя поля (можно через связи, например
+    'sales_stats__units_sold') с необязательным '-' для убывания.
+    Пустые значения (NULL) всегда идут в конце списка.
+    """
+
+    value_alias = 'keyset_value'
+
+    def __init__(self, queryset, ordering, per_page):
+        self.descending = ordering.startswith('-')
+        self.field = ordering.lstrip('-')
+        self.ordering = ordering
+        self.per_page = per_page
+        self.queryset = queryset.annotate(**{self.value_alias: F(self.field)})
+
+    def page(self, cursor=None):
+        """Возвращает страницу, следующую за курсором (или первую)"""
+        value, pk, forward = self.decode_cursor(cursor) if cursor else (None, None, True)
+        rows = list(self._window(value, pk, forward))
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if forward:
+            has_next, has_previous = has_more, pk is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], forward=True) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], forward=False) if rows and has_previous else None,
+        )
+
+    def stream(self, cursor=None):
+        """Ленивая страница: строки читаются из БД по мере обхода.
+
+        Курсоры заполняются, когда страница обойдена до конца.
+        """
+        return KeysetStream(self, cursor)
+
+    def _window(self, value, pk, forward):
+        """Запрос на per_page + 1 строк от курсора (лишняя — признак продолжения)"""
+        if pk is None:
+            qs = self.queryset.order_by(*self._order_by(reverse=False))
+        elif forward:
+            qs = self.queryset.filter(self._after(value, pk)).order_by(*self._order_by(reverse=False))
+        else:
+            qs = self.queryset.filter(self._before(value, pk)).order_by(*self._order_by(reverse=True))
+        return qs[:self.per_page + 1]
+
+    def _order_by(self, reverse):
+        descending = self.descending != reverse
+        if reverse:
+            value = F(self.field).desc(nulls_first=True) if descending else F(self.field).asc(nulls_first=True)
+        else:
+            value = F(self.field).desc(nulls_last=True) if descending else F(self.field).asc(nulls_last=True)
+        return (value, '-id' if descending else 'id')
+
+    def _after(self, value, pk):
+        """Строки после курсора в прямом порядке"""
+        beyond, id_beyond = ('lt', 'lt') if self.descending else ('gt', 'gt')
+        if value is None:
+            return Q(**{f'{self.field}__isnull': True, f'id__{id_beyond}': pk})
+        return (
+            Q(**{f'{self.field}__{beyond}': value})
+            | Q(**{self.field: value, f'id__{id_beyond}': pk})
+            | Q(**{f'{self.field}__isnull': True})
+        )
+
+    def _before(self, value, pk):
+        """Строки перед курсором в прямом порядке"""
+        before, id_before = ('gt', 'gt') if self.descending else ('lt', 'lt')
+        if value is None:
+            return Q(**{f'{self.field}__isnull': False}) | Q(**{f'{self.field}__isnull': True, f'id__{id_before}': pk})
+        return Q(**{f'{self.field}__{before}': value}) | Q(**{self.field: value, f'id__{id_before}': pk})
+
+    def encode_cursor(self, obj, forward):
+        value = getattr(obj, self.value_alias)
+        payload = {
+            'o': self.ordering,
+            'v': None if value is None else str(value),
+            'id': obj.pk,
+            'f': forward,
+        }
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            if payload['o'] != self.ordering:
+                raise InvalidCursor(cursor)
+            output_field = self.queryset.query.annotations[self.value_alias].output_field
+            value = None if payload['v'] is None else output_field.to_python(payload['v'])
+            return value, int(payload['id']), bool(payload['f'])
+        except (ValueError, TypeError, KeyError) as exc:
+            raise InvalidCursor(cursor) from exc
+
+
+class KeysetStream:
+    """Страница keyset-пагинации, отдаваемая построчно (для потокового рендера)"""
+
+    chunk_size = 8
+
+    def __init__(self, paginator, cursor=None):
+        self.paginator = paginator
+        self.cursor = cursor
+        # Курсор разбирается сразу, чтобы ошибка возникла до начала ответа
+        self.position = paginator.decode_cursor(cursor) if cursor else (None, None, True)
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def __iter__(self):
+        value, pk, forward = self.position
+        if not forward:
+            # Назад читаем в обратном порядке — страницу всё равно нужно развернуть
+            page = self.paginator.page(self.cursor)
+            self.next_cursor, self.previous_cursor = page.next_cursor, page.previous_cursor
+            yield from page
+            return
+
+        paginator = self.paginator
+        last = None
+        rows = paginator._window(value, pk, forward).iterator(chunk_size=self.chunk_size)
+        for position, obj in enumerate(rows):
+            if position == paginator.per_page:
+                self.next_cursor = paginator.encode_cursor(last, forward=True)
+                break
+            if position == 0 and pk is not None:
+                self.previous_cursor = paginator.encode_cursor(obj, forward=False)
+            last = obj
+            yield obj
+
+
+def approximate_count(queryset):
+    """Количество строк, кэшируемое на несколько минут по тексту запроса"""
+    sql, params = queryset.query.sql_with_params()
+    key = 'approx_count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, APPROX_COUNT_TIMEOUT)
+    return count
+
+
+def get_count(queryset, mode):
+    """Возвращает количество по режиму ?count=: exact, approx или None (не считать)"""
+    if mode == 'exact':
+        return queryset.count()
+    if mode == 'approx':
+        return approximate_count(queryset)
+    return None
+
+
+class ProductPagination(PageNumberPagination):
+    """Постраничная пагинация с keyset-режимом (?cursor= или ?pagination=cursor).
+
+    В keyset-режиме общий счётчик не считается, если не запрошен
+    через ?count=exact или ?count=approx.
+    """
+
+    cursor_query_param = 'cursor'
+    default_ordering = '-created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        self.keyset = self.cursor_query_param in params or params.get('pagination') == 'cursor'
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.count = get_count(queryset, params.get('count'))
+        paginator = KeysetPaginator(queryset, self.get_ordering(request, view), self.get_page_size(request))
+        try:
+            self.keyset_page = paginator.page(params.get(self.cursor_query_param))
+        except InvalidCursor:
+            self.keyset_page = paginator.page()
+        return list(self.keyset_page)
+
+    def get_ordering(self, request, view):
+        ordering = request.query_params.get('ordering', '')
+        allowed = getattr(view, 'ordering_fields', None) or ()
+        if ordering.lstrip('-') in allowed:
+            return ordering
+        return self.default_ordering
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        body = {
+            'next': self._cursor_link(self.keyset_page.next_cursor),
+            'previous': self._cursor_link(self.keyset_page.previous_cursor),
+            'results': data,
+        }
+        if self.count is not None:
+            body = {'count': self.count, **body}
+        return Response(body)
+
+    def _cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), 'pagination')
+        return replace_query_param(url, self.cursor_query_param, cursor)
@@ -0,0 +1,164 @@
+"""PDF-каталог выбранных товаров, собираемый в фоне.
+
+Админка только создаёт ExportJob и ставит задачу в Celery. Выбранные
+товары передаются не списком id, а сохранённым запросом (pickle
+queryset.query в ExportJob.query): в сообщение очереди попадает только
+id выгрузки, а «выбрать все» по фильтру не загружает id в память.
+
+Задача читает товары пачками по id (keyset) одним запросом-проекцией
+(имя и текущая цена, без загрузки моделей) и пишет страницы в файл по
+мере готовности. reportlab держит все страницы документа в памяти до
+save(), поэтому документ пишет PdfWriter: в памяти только текущая
+страница и смещения объектов в файле. По ходу работы в ExportJob пишется
+прогресс, готовый файл сохраняется в хранилище, а ссылку на него админ
+видит при следующем открытии списка товаров.
+"""
+import os
+import pickle
+import tempfile
+import zlib
+from decimal import Decimal
+
+from django.core.files import File
+from django.db.models import Value
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+
+from .models import Product
+
+CHUNK_SIZE = 1000
+# Как часто сохранять прогресс, строк
+PROGRESS_EVERY = 500
+# A4 в пунктах
+PAGE_WIDTH, PAGE_HEIGHT = 595.28, 841.89
+PAGE_TOP = 800
+PAGE_BOTTOM = 60
+LINE_HEIGHT = 20
+LEFT_MARGIN = 40
+FONT_SIZE = 12
+
+
+def save_selection(queryset):
+    """Выбранные товары для ExportJob.query (без аннотаций списка админки)"""
+    return pickle.dumps(Product.objects.filter(pk__in=queryset.values('pk')).query)
+
+
+def load_selection(data):
+    """Queryset товаров по ExportJob.query"""
+    queryset = Product.objects.all()
+    queryset.query = pickle.loads(data)
+    return queryset
+
+
+def product_rows(queryset, chunk_size=CHUNK_SIZE):
+    """(название, текущая цена) по товарам queryset в порядке id"""
+    rows = queryset.order_by('pk').values_list(
+        'pk', 'name',
+        # Как Product.get_current_price(): нулевая цена со скидкой не считается
+        Coalesce(NullIf('sale_price', Value(Decimal('0'))), 'base_price'),
+    )
+    last = None
+    while True:
+        chunk = list((rows if last is None else rows.filter(pk__gt=last))[:chunk_size])
+        yield from ((name, price) for _, name, price in chunk)
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1][0]
+
+
+def _pdf_string(text):
+    """Строка PDF для Helvetica (WinAnsi): символы вне кодировки заменяются на ?"""
+    data = text.encode('cp1252', 'replace').replace(b'\r', b'').replace(b'\n', b' ')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+class PdfWriter:
+    """Текстовый PDF, который пишется в файл по странице.
+
+    Объекты 1–3 (каталог, дерево страниц, шрифт) записываются в close(),
+    страницы — сразу в add_page().
+    """
+
+    CATALOG, PAGES, FONT = 1, 2, 3
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.offsets = {}
+        self.pages = []
+        self.next_object = 4
+        fh.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write_object(self, number, body):
+        self.offsets[number] = self.fh.tell()
+        self.fh.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def add_page(self, lines):
+        """Пишет страницу; lines — [(x, y, текст)]"""
+        stream = zlib.compress(b''.join(
+            b'BT /F1 %d Tf %d %d Td (%s) Tj ET\n' % (FONT_SIZE, x, y, _pdf_string(text))
+            for x, y, text in lines
+        ))
+        content, page = self.next_object, self.next_object + 1
+        self.next_object += 2
+        self._write_object(
+            content, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(stream), stream)
+        )
+        self._write_object(page, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+        ) % (self.PAGES, PAGE_WIDTH, PAGE_HEIGHT, self.FONT, content))
+        self.pages.append(page)
+
+    def close(self):
+        """Дописывает общие объекты, таблицу смещений и трейлер"""
+        self._write_object(
+            self.FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>'
+        )
+        kids = b' '.join(b'%d 0 R' % page for page in self.pages)
+        self._write_object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        self._write_object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        xref = self.fh.tell()
+        self.fh.write(b'xref\n0 %d\n0000000000 65535 f \n' % self.next_object)
+        self.fh.write(b''.join(b'%010d 00000 n \n' % self.offsets[number] for number in range(1, self.next_object)))
+        self.fh.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            self.next_object, self.CATALOG, xref,
+        ))
+
+
+def write_products_pdf(fh, rows, progress=None):
+    """Пишет строки товаров в файл fh; progress(n) вызывается каждые PROGRESS_EVERY строк"""
+    pdf = PdfWriter(fh)
+    page, y, count = [], PAGE_TOP, 0
+    for name, price in rows:
+        page.append((LEFT_MARGIN, y, f'{name} — цена: {price}'))
+        y -= LINE_HEIGHT
+        if y < PAGE_BOTTOM:
+            pdf.add_page(page)
+            page, y = [], PAGE_TOP
+        count += 1
+        if progress and count % PROGRESS_EVERY == 0:
+            progress(count)
+    if page or not pdf.pages:
+        pdf.add_page(page)
+    pdf.close()
+    return count
+
+
+def build_products_pdf(job):
+    """Выполняет выгрузку: рисует PDF, сохраняет файл и завершает job"""
+    products = load_selection(job.query)
+    job.status, job.total, job.processed = 'running', products.count(), 0
+    job.save(update_fields=['status', 'total', 'processed'])
+
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'w+b') as fh:
+            count = write_products_pdf(fh, product_rows(products), job.report_progress)
+            fh.seek(0)
+            job.file.save(f'products-{job.pk}.pdf', File(fh), save=False)
+    finally:
+        os.unlink(path)
+
+    job.status, job.processed, job.finished_at = 'done', count, timezone.now()
+    job.save(update_fields=['status', 'processed', 'file', 'finished_at'])
+    return job
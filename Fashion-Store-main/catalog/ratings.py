@@ -0,0 +1,43 @@
+"""Денормализованные агрегаты оценок товара (Product.rating_*)"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Product, Review
+
+RATING_FIELDS = ('rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')
+
+
+def rating_values(histogram):
+    """Поля Product.rating_* по словарю {оценка: количество}"""
+    count = sum(histogram.values())
+    total = sum(stars * n for stars, n in histogram.items())
+    values = {f'rating_{stars}': histogram.get(stars, 0) for stars in range(1, 6)}
+    values['rating_count'] = count
+    values['rating_avg'] = (Decimal(total) / count).quantize(Decimal('0.01')) if count else Decimal('0')
+    return values
+
+
+def refresh_product_ratings(product_ids):
+    """Пересчитывает агрегаты оценок товаров по одобренным отзывам.
+
+    Выполняется в транзакции вызывающего кода (или в своей), строки
+    товаров блокируются, чтобы параллельные пересчёты не перетёрли друг друга.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    with transaction.atomic():
+        locked = list(Product.objects.select_for_update().filter(pk__in=product_ids).values_list('pk', flat=True))
+        histograms = {pk: {} for pk in locked}
+        rows = (
+            Review.objects.filter(product_id__in=locked, is_approved=True)
+            .values_list('product_id', 'rating')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        for product_id, rating, n in rows:
+            histograms[product_id][rating] = n
+        for pk, histogram in histograms.items():
+            Product.objects.filter(pk=pk).update(**rating_values(histogram))
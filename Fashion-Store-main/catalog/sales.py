@@ -0,0 +1,98 @@
+"""Поддержка витрины статистики продаж (ProductSalesStats)"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, Max, Q, Sum
+from django.utils import timezone
+
+from orders.models import OrderItem
+from .models import Product, ProductSalesStats
+
+# Сортировка «по популярности» для списков товаров (поле для KeysetPaginator:
+# товары без статистики идут в конце, при равенстве — более новые выше)
+BESTSELLER_ORDERING = '-sales_stats__units_sold'
+
+_BATCH_SIZE = 500
+
+
+def record_sales(order_items, sold_at=None):
+    """Инкрементально учитывает новые позиции заказа в статистике.
+
+    У позиций должен быть загружен вариант (select_related('variant'))
+    или хотя бы заполнен variant.product_id.
+    """
+    sold_at = sold_at or timezone.now()
+    totals = defaultdict(lambda: [0, Decimal('0.00')])
+    for item in order_items:
+        row = totals[item.variant.product_id]
+        row[0] += item.quantity
+        row[1] += item.price * item.quantity
+
+    for product_id, (quantity, revenue) in totals.items():
+        updated = ProductSalesStats.objects.filter(product_id=product_id).update(
+            units_sold=F('units_sold') + quantity,
+            units_sold_7d=F('units_sold_7d') + quantity,
+            units_sold_30d=F('units_sold_30d') + quantity,
+            revenue=F('revenue') + revenue,
+            last_sold_at=sold_at,
+            updated_at=sold_at,
+        )
+        if not updated:
+            ProductSalesStats.objects.create(
+                product_id=product_id,
+                units_sold=quantity,
+                units_sold_7d=quantity,
+                units_sold_30d=quantity,
+                revenue=revenue,
+                last_sold_at=sold_at,
+            )
+
+
+def reconcile_sales_stats(now=None):
+    """Пересчитывает статистику продаж по всей истории заказов.
+
+    Исправляет накопившиеся расхождения инкрементальных обновлений
+    и сдвигает окна 7/30 дней. Возвращает число обновлённых записей.
+    """
+    now = now or timezone.now()
+    aggregates = {
+        row['variant__product_id']: row
+        for row in OrderItem.objects.values('variant__product_id').annotate(
+            units=Sum('quantity'),
+            amount=Sum(F('quantity') * F('price')),
+            last=Max('created_at'),
+            units_7d=Sum('quantity', filter=Q(created_at__gte=now - timedelta(days=7))),
+            units_30d=Sum('quantity', filter=Q(created_at__gte=now - timedelta(days=30))),
+        )
+    }
+
+    batch = []
+    total = 0
+    for product_id in Product.objects.values_list('id', flat=True).iterator(chunk_size=_BATCH_SIZE):
+        row = aggregates.get(product_id, {})
+        batch.append(ProductSalesStats(
+            product_id=product_id,
+            units_sold=row.get('units') or 0,
+            revenue=row.get('amount') or Decimal('0.00'),
+            last_sold_at=row.get('last'),
+            units_sold_7d=row.get('units_7d') or 0,
+            units_sold_30d=row.get('units_30d') or 0,
+            updated_at=now,
+        ))
+        if len(batch) >= _BATCH_SIZE:
+            total += _flush(batch)
+            batch = []
+    if batch:
+        total += _flush(batch)
+    return total
+
+
+def _flush(batch):
+    ProductSalesStats.objects.bulk_create(
+        batch,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['units_sold', 'revenue', 'last_sold_at', 'units_sold_7d', 'units_sold_30d', 'updated_at'],
+    )
+    return len(batch)
@@ -0,0 +1,105 @@
+"""Полнотекстовый поиск по товарам на базе SQLite FTS5"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'catalog_product_fts'
+
+# Ограничение на число параметров в одном запросе SQLite
+_CHUNK_SIZE = 500
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_INSERT_SQL = (
+    f'INSERT INTO {FTS_TABLE} '
+    '(rowid, name, short_description, description, category, other_category) '
+    'SELECT p.id, p.name, p.short_description, p.description, '
+    "COALESCE(c.name, ''), COALESCE(o.name, '') "
+    'FROM catalog_product p '
+    'LEFT JOIN catalog_category c ON c.id = p.category_id '
+    'LEFT JOIN catalog_othercategory o ON o.id = p.other_category_id '
+)
+
+
+def is_enabled():
+    """Проверяет, доступен ли FTS-индекс для текущей БД"""
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(q):
+    """Преобразует пользовательский запрос в безопасное выражение MATCH.
+
+    Каждое слово экранируется как фраза и ищется по префиксу,
+    поэтому спецсимволы FTS5 в запросе не интерпретируются.
+    """
+    tokens = _TOKEN_RE.findall(q or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_products(queryset, q):
+    """Фильтрует queryset товаров по поисковому запросу"""
+    match = build_match_query(q)
+    if not match:
+        return queryset
+    if not is_enabled():
+        return queryset.filter(
+            Q(name__icontains=q) | Q(short_description__icontains=q) | Q(description__icontains=q)
+        )
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,)
+    ))
+
+
+def _reindex(where, params):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT p.id FROM catalog_product p WHERE {where})',
+            params,
+        )
+        cursor.execute(_INSERT_SQL + f'WHERE {where}', params)
+
+
+def index_products(product_ids):
+    """Обновляет записи индекса для указанных товаров"""
+    if not is_enabled():
+        return
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), _CHUNK_SIZE):
+        chunk = product_ids[start:start + _CHUNK_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        _reindex(f'p.id IN ({placeholders})', chunk)
+
+
+def index_category(category_id):
+    """Переиндексирует товары категории (например, после переименования)"""
+    if is_enabled():
+        _reindex('p.category_id = %s', [category_id])
+
+
+def index_other_category(other_category_id):
+    """Переиндексирует товары дополнительной категории"""
+    if is_enabled():
+        _reindex('p.other_category_id = %s', [other_category_id])
+
+
+def remove_products(product_ids):
+    """Удаляет товары из индекса"""
+    if not is_enabled():
+        return
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), _CHUNK_SIZE):
+            chunk = product_ids[start:start + _CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', chunk)
+
+
+def rebuild_index():
+    """Полностью перестраивает индекс по всему каталогу"""
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(_INSERT_SQL)
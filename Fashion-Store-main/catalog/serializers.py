@@ -1,25 +1,58 @@
 from rest_framework import serializers
+from fashion_store.dynamic_fields import DynamicFieldsMixin
+from .images import get_sources, srcset
 from .models import Category, Product, ProductVariant, Review
+from .ratings import RATING_FIELDS
 
-class CategorySerializer(serializers.ModelSerializer):
+
+class ImageSrcsetField(serializers.Field):
+    """Изображение с готовыми AVIF/WebP-копиями: {"src": ..., "sources": [{"type", "srcset"}]}"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get('request')
+        absolute = request.build_absolute_uri if request is not None else None
+        sources = [
+            {'type': mime, 'srcset': srcset(candidates, absolute)}
+            for mime, candidates in get_sources(value.name, value.storage)
+        ]
+        return {'src': absolute(value.url) if absolute else value.url, 'sources': sources}
+
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField(source='image')
     class Meta:
         model = Category
-        fields = ['id','name','slug']
+        fields = ['id','name','slug','image_srcset']
 
-class ProductVariantSerializer(serializers.ModelSerializer):
+class ProductVariantSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField(source='image')
     class Meta:
         model = ProductVariant
-        fields = ['id','size','color','price','stock']
+        fields = ['id','size','color','price','stock','image_srcset']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('category', 'variants')
+    method_field_sources = {'rating_histogram': ('rating_count',) + RATING_FIELDS}
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(source='category', queryset=Category.objects.all(), write_only=True)
     variants = ProductVariantSerializer(many=True, read_only=True)
+    rating_histogram = serializers.SerializerMethodField()
+    image_srcset = ImageSrcsetField(source='image')
     class Meta:
         model = Product
-        fields = ['id','name','description','base_price','image','category','category_id','variants','created_at']
+        fields = ['id','name','description','base_price','image','image_srcset','category','category_id','variants',
+                  'rating_avg','rating_count','rating_histogram','created_at']
+        read_only_fields = ['rating_avg','rating_count']
+
+    def get_rating_histogram(self, obj):
+        return {str(stars): count for stars, count, _ in obj.get_rating_histogram()}
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user_email = serializers.ReadOnlyField(source='user.email')
     class Meta:
         model = Review
@@ -0,0 +1,189 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import facets, fragments, media, search
+from .cache import catalog_changed, product_details_changed
+from .images import IMAGE_FIELDS
+from .models import (
+    Category, OtherCategory, Product, ProductCollection, ProductSalesStats, ProductVariant, Review,
+)
+from .ratings import refresh_product_ratings
+from .tasks import generate_image_derivatives
+from .variants import invalidate_variant_matrix
+
+
+def _facets_changed(product_ids=None):
+    transaction.on_commit(lambda: facets.products_changed(product_ids))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Обновляет поисковый индекс при сохранении товара"""
+    search.index_products([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def create_sales_stats(sender, instance, created, raw=False, **kwargs):
+    """Заводит пустую статистику продаж для нового товара"""
+    if created and not raw:
+        ProductSalesStats.objects.get_or_create(product=instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Удаляет товар из поискового индекса"""
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    """Название категории входит в индекс — переиндексируем её товары"""
+    if not created:
+        search.index_category(instance.pk)
+
+
+@receiver(post_save, sender=OtherCategory)
+def reindex_other_category_products(sender, instance, created, **kwargs):
+    """Название дополнительной категории входит в индекс"""
+    if not created:
+        search.index_other_category(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_facets_changed(sender, instance, **kwargs):
+    """Обновляет фасетный индекс при изменении товара"""
+    _facets_changed([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_facets_changed(sender, instance, **kwargs):
+    """Размеры, цвета и наличие берутся из вариантов товара"""
+    _facets_changed([instance.product_id])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_matrix_changed(sender, instance, **kwargs):
+    """Сбрасывает кэш матрицы вариантов товара"""
+    product_id = instance.product_id
+    transaction.on_commit(lambda: invalidate_variant_matrix(product_id))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=OtherCategory)
+def category_facets_changed(sender, instance, created, **kwargs):
+    """Slug и название категории — ключи и подписи фасетов"""
+    if not created:
+        _facets_changed()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_product(sender, instance, raw=False, **kwargs):
+    """Запоминает прежний товар отзыва, чтобы пересчитать и его"""
+    instance._previous_product_id = None
+    if instance.pk and not raw:
+        instance._previous_product_id = (
+            Review.objects.filter(pk=instance.pk).values_list('product_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, raw=False, **kwargs):
+    """Пересчитывает оценки товара при создании, одобрении или правке отзыва"""
+    if raw:
+        return
+    product_ids = {instance.product_id, getattr(instance, '_previous_product_id', None)} - {None}
+    refresh_product_ratings(product_ids)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, origin=None, **kwargs):
+    """Пересчитывает оценки товара при удалении отзыва"""
+    if isinstance(origin, Product) and origin.pk == instance.product_id:
+        return  # удаляется сам товар
+    refresh_product_ratings([instance.product_id])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_fragments_changed(sender, instance, **kwargs):
+    """Новая версия товара — кэшированные фрагменты больше не читаются"""
+    fragments.invalidate_products([instance.pk])
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=ProductCollection)
+@receiver(post_delete, sender=ProductCollection)
+def related_fragments_changed(sender, instance, **kwargs):
+    """Варианты, отзывы и подборки отображаются во фрагментах товара"""
+    fragments.invalidate_products([instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=OtherCategory)
+def category_fragments_changed(sender, instance, created, **kwargs):
+    """Названия категорий выводятся во фрагментах многих товаров"""
+    if not created:
+        fragments.invalidate_shared()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=OtherCategory)
+@receiver(post_delete, sender=OtherCategory)
+def catalog_responses_changed(sender, **kwargs):
+    """Сбрасывает кэш JSON-ответов каталога (catalog_list)"""
+    catalog_changed()
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def product_details_responses_changed(sender, **kwargs):
+    """Варианты и оценки входят в ответы API товаров"""
+    product_details_changed()
+
+
+def remember_image(sender, instance, raw=False, **kwargs):
+    """Запоминает прежнее изображение, чтобы не пересобирать копии без изменений"""
+    instance._previous_image = None
+    if instance.pk and not raw:
+        field = dict(IMAGE_FIELDS)[sender]
+        instance._previous_image = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def schedule_image_derivatives(sender, instance, raw=False, **kwargs):
+    """Ставит в очередь генерацию копий для нового изображения"""
+    name = getattr(instance, dict(IMAGE_FIELDS)[sender]).name
+    if raw or not name or name == getattr(instance, '_previous_image', None):
+        return
+    transaction.on_commit(lambda: generate_image_derivatives.delay(name))
+
+
+def image_references_saved(sender, instance, raw=False, **kwargs):
+    """Переносит ссылку с прежнего файла изображения на новый"""
+    if not raw:
+        name = getattr(instance, dict(IMAGE_FIELDS)[sender]).name
+        media.image_replaced(getattr(instance, '_previous_image', None) or None, name or None)
+
+
+def image_references_deleted(sender, instance, **kwargs):
+    """Объект удалён — его файл может остаться без ссылок"""
+    media.remove_references([getattr(instance, dict(IMAGE_FIELDS)[sender]).name])
+
+
+for _model, _ in IMAGE_FIELDS:
+    _label = _model._meta.label
+    pre_save.connect(remember_image, sender=_model, dispatch_uid=f'remember_image:{_label}')
+    post_save.connect(schedule_image_derivatives, sender=_model, dispatch_uid=f'image_derivatives:{_label}')
+    post_save.connect(image_references_saved, sender=_model, dispatch_uid=f'image_references:{_label}')
+    post_delete.connect(image_references_deleted, sender=_model, dispatch_uid=f'image_references_deleted:{_label}')
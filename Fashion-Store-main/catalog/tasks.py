@@ -2,6 +2,12 @@ from celery import shared_task
 from django.core.mail import send_mail
 from django.utils import timezone
 
+from .copurchase import compute_co_purchases
+from .images import generate_derivatives
+from .models import ExportJob
+from .pdf_export import build_products_pdf
+from .sales import reconcile_sales_stats
+
 @shared_task
 def send_daily_promotions():
     subject = "Ежедневные акции"
@@ -9,3 +15,34 @@ def send_daily_promotions():
     recipients = ["test@example.com"]  # TODO: заменить на реальные адреса/выборку из БД
     send_mail(subject, body, "no-reply@fashionstore.local", recipients)
     return "ok"
+
+
+@shared_task
+def reconcile_product_sales_stats():
+    """Ночная сверка статистики продаж с историей заказов"""
+    return reconcile_sales_stats()
+
+
+@shared_task
+def compute_product_co_purchases():
+    """Ночной пересчёт «часто покупают вместе»"""
+    return compute_co_purchases()
+
+
+@shared_task
+def generate_image_derivatives(name):
+    """Готовит AVIF/WebP-копии загруженного изображения"""
+    return len(generate_derivatives(name))
+
+
+@shared_task
+def export_products_pdf(job_id):
+    """Собирает PDF-каталог для выгрузки из админки"""
+    job = ExportJob.objects.get(pk=job_id)
+    try:
+        build_products_pdf(job)
+    except Exception as exc:
+        job.status, job.error, job.finished_at = 'failed', str(exc), timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        raise
+    return job.processed
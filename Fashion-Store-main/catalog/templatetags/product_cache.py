@@ -0,0 +1,79 @@
+from django import template
+
+from catalog import fragments
+from catalog.fragments import PREFETCHED, prefetch_fragments
+
+register = template.Library()
+
+
+class ProductCacheNode(template.Node):
+    def __init__(self, nodelist, name, product, vary):
+        self.nodelist = nodelist
+        self.name = name
+        self.product = product
+        self.vary = vary
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        product = self.product.resolve(context)
+        product_id = getattr(product, 'pk', product)
+        vary = [value.resolve(context) for value in self.vary]
+        prefetched = (context.get(PREFETCHED) or {}).get((name, tuple(str(value) for value in vary)), {})
+        if product_id in prefetched:
+            key, html = prefetched[product_id]
+            return fragments.fill_fragment(name, key, html, lambda: self.nodelist.render(context))
+        return fragments.get_fragment(name, product_id, lambda: self.nodelist.render(context), vary)
+
+
+class PrefetchProductCacheNode(template.Node):
+    def __init__(self, name, products, vary):
+        self.name = name
+        self.products = products
+        self.vary = vary
+
+    def render(self, context):
+        products = self.products.resolve(context)
+        if products:
+            context[PREFETCHED] = prefetch_fragments(
+                self.name.resolve(context),
+                products,
+                [value.resolve(context) for value in self.vary],
+                context.get(PREFETCHED),
+            )
+        return ''
+
+
+@register.tag('productcache')
+def do_productcache(parser, token):
+    """Кэширует фрагмент шаблона по товару и его версии.
+
+    {% productcache "card" product [доп. значения ключа ...] %} ... {% endproductcache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' принимает имя фрагмента и товар")
+    nodelist = parser.parse(('endproductcache',))
+    parser.delete_first_token()
+    return ProductCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
+
+
+@register.tag('prefetch_productcache')
+def do_prefetch_productcache(parser, token):
+    """Читает фрагменты списка товаров заранее, одним обращением к кэшу.
+
+    {% prefetch_productcache "card" products [доп. значения ключа ...] %} — дальше
+    {% productcache "card" p %} для этих товаров берёт готовый html.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' принимает имя фрагмента и список товаров")
+    return PrefetchProductCacheNode(
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
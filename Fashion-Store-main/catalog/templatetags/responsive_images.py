@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from catalog.images import get_sources, srcset
+
+register = template.Library()
+
+DEFAULT_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 100vw'
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes=DEFAULT_SIZES, loading='lazy', **attrs):
+    """<picture> с AVIF/WebP-копиями и исходным файлом как запасным вариантом.
+
+    {% responsive_image product.image alt=product.name class="card-img-top" %}
+    Пока копии не готовы, выводится обычный <img>.
+    """
+    if not image:
+        return ''
+    img = format_html(
+        '<img src="{}" alt="{}" loading="{}" decoding="async"{}>',
+        image.url, alt, loading,
+        format_html_join('', ' {}="{}"', sorted(attrs.items())),
+    )
+    sources = get_sources(image.name, image.storage)
+    if not sources:
+        return img
+    return format_html(
+        '<picture>{}{}</picture>',
+        format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+            (mime, srcset(candidates), sizes) for mime, candidates in sources
+        )),
+        img,
+    )
@@ -1,6 +1,50 @@
-from django.test import TestCase, Client
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import QueryDict
+from django.template import Context, Template
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from catalog.models import Product, Category
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import User
+from cart.models import Cart, CartItem
+from cart.summary import get_cart_summary, summarize_lines
+from catalog import cache as catalog_cache, facets, fragments, media
+from catalog.admin import ProductAdmin
+from catalog.copurchase import compute_co_purchases
+from catalog.images import derivative_name
+from catalog.models import (
+    Product, Category, ProductVariant, ProductSalesStats, ProductCoPurchase, Review, ImageDerivative, MediaFile, ExportJob,
+)
+from catalog.pagination import KeysetPaginator
+from catalog.pdf_export import PdfWriter, load_selection, product_rows, save_selection
+from catalog.sales import record_sales, reconcile_sales_stats
+from catalog.search import search_products
+from catalog.serializers import ProductSerializer
+from catalog.variants import get_variant_matrix
+from fashion_store import renderers
+from fashion_store.renderers import FastJSONParser, FastJSONRenderer
+from fashion_store.storage import StaticFilesStorage
+from fashion_store.testing import AdminChangelistQueriesMixin
+from orders.models import Order, OrderItem
 
 class CatalogViewsTest(TestCase):
     def setUp(self):
@@ -17,3 +61,912 @@ class CatalogViewsTest(TestCase):
         response = self.client.get(reverse("product_detail", args=[self.product.pk]))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context['product'], self.product)
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Платья", slug="dresses")
+        self.dress = Product.objects.create(
+            name="Red Summer Dress", category=self.category, base_price=100,
+            description="Лёгкое хлопковое платье",
+        )
+        self.jacket = Product.objects.create(name="Denim Jacket", category=self.category, base_price=200)
+
+    def search(self, q):
+        return set(search_products(Product.objects.all(), q))
+
+    def test_matches_name_prefix_and_description(self):
+        self.assertEqual(self.search("summ"), {self.dress})
+        self.assertEqual(self.search("ХЛОПКОВОЕ"), {self.dress})
+
+    def test_index_follows_updates_and_deletes(self):
+        self.jacket.name = "Denim Coat"
+        self.jacket.save()
+        self.assertEqual(self.search("coat"), {self.jacket})
+        self.jacket.delete()
+        self.assertEqual(self.search("denim"), set())
+
+    def test_category_rename_reindexes_products(self):
+        self.category.name = "Верхняя одежда"
+        self.category.save()
+        self.assertEqual(self.search("верхняя"), {self.dress, self.jacket})
+
+    def test_special_characters_are_escaped(self):
+        self.assertEqual(self.search('dress" (*'), {self.dress})
+        self.assertEqual(self.search("***"), {self.dress, self.jacket})
+
+    def test_api_search_uses_index(self):
+        response = self.client.get("/api/products/products/", {"search": "jacket"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p["id"] for p in response.json()["results"]], [self.jacket.id])
+
+
+class ProductSalesStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="buyer@example.com", password="pass12345")
+        self.category = Category.objects.create(name="Cat", slug="cat")
+        self.popular = Product.objects.create(name="Popular", category=self.category, base_price=100)
+        self.quiet = Product.objects.create(name="Quiet", category=self.category, base_price=100)
+        self.variant = ProductVariant.objects.create(product=self.popular, size="M", color="Red", price=50)
+
+    def place_order(self, quantity):
+        order = Order.objects.create(user=self.user)
+        item = OrderItem.objects.create(order=order, variant=self.variant, quantity=quantity, price=self.variant.price)
+        record_sales([item])
+        return item
+
+    def test_new_product_gets_empty_stats(self):
+        self.assertEqual(self.quiet.sales_stats.units_sold, 0)
+
+    def test_record_sales_increments_counters(self):
+        self.place_order(2)
+        self.place_order(3)
+        stats = ProductSalesStats.objects.get(product=self.popular)
+        self.assertEqual(stats.units_sold, 5)
+        self.assertEqual(stats.units_sold_7d, 5)
+        self.assertEqual(stats.revenue, Decimal("250.00"))
+        self.assertIsNotNone(stats.last_sold_at)
+
+    def test_reconcile_rebuilds_from_order_history(self):
+        item = self.place_order(4)
+        OrderItem.objects.filter(pk=item.pk).update(created_at=timezone.now() - timedelta(days=10))
+        ProductSalesStats.objects.all().delete()
+        self.assertEqual(reconcile_sales_stats(), 2)
+        stats = ProductSalesStats.objects.get(product=self.popular)
+        self.assertEqual((stats.units_sold, stats.units_sold_7d, stats.units_sold_30d), (4, 0, 4))
+        self.assertEqual(ProductSalesStats.objects.get(product=self.quiet).units_sold, 0)
+
+    def test_product_list_sorts_by_units_sold(self):
+        self.place_order(1)
+        response = self.client.get("/product_list/")
+        self.assertEqual(list(response.context["products"])[0], self.popular)
+
+
+class FacetCountsTest(TestCase):
+    def setUp(self):
+        self.men = Category.objects.create(name="Men", slug="men")
+        self.women = Category.objects.create(name="Women", slug="women")
+        self.shirt = Product.objects.create(name="Shirt", category=self.men, base_price=900)
+        self.dress = Product.objects.create(name="Dress", category=self.women, base_price=3000)
+        self.coat = Product.objects.create(name="Coat", category=self.women, base_price=12000)
+        ProductVariant.objects.create(product=self.shirt, size="M", color="Blue", price=900, stock=3)
+        ProductVariant.objects.create(product=self.dress, size="S", color="Red", price=3000, stock=0)
+        ProductVariant.objects.create(product=self.dress, size="M", color="Red", price=3000, stock=1)
+        facets.products_changed()
+
+    def counts(self, **params):
+        query = QueryDict(mutable=True)
+        for key, values in params.items():
+            query.setlist(key, values if isinstance(values, list) else [values])
+        result = facets.facet_counts(query)
+        return result["total"], {
+            facet: {v["value"]: v["count"] for v in values} for facet, values in result["facets"].items()
+        }
+
+    def test_counts_without_filters(self):
+        total, counts = self.counts()
+        self.assertEqual(total, 3)
+        self.assertEqual(counts["category"], {"men": 1, "women": 2})
+        self.assertEqual(counts["size"], {"M": 2, "S": 1})
+        self.assertEqual(counts["in_stock"], {"1": 2, "0": 1})
+        self.assertEqual(counts["price"]["10000+"], 1)
+
+    def test_facet_ignores_its_own_selection(self):
+        total, counts = self.counts(category="women", size="M")
+        self.assertEqual(total, 1)
+        self.assertEqual(counts["category"], {"men": 1, "women": 1})
+        self.assertEqual(counts["size"], {"M": 1, "S": 1})
+
+    def test_price_range_and_search_restrict_counts(self):
+        total, counts = self.counts(min_price="1000", q="dress")
+        self.assertEqual(total, 1)
+        self.assertEqual(counts["category"], {"men": 0, "women": 1})
+
+    def test_index_follows_committed_changes(self):
+        self.counts()
+        published = facets.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.create(product=self.coat, size="L", color="Black", price=12000, stock=2)
+            self.shirt.delete()
+        total, counts = self.counts()
+        self.assertEqual(total, 2)
+        self.assertEqual(counts["size"], {"L": 1, "M": 1, "S": 1})
+        self.assertEqual(counts["category"], {"women": 2})
+        # Индекс, который могут читать другие запросы, не меняется
+        self.assertIsNot(facets.get_index(), published)
+        self.assertEqual(published.count({})["total"], 3)
+        self.assertNotIn("L", published.postings["size"])
+
+    def test_product_list_and_json_endpoint(self):
+        response = self.client.get("/product_list/", {"size": "M"})
+        self.assertEqual({p.id for p in response.context["products"]}, {self.shirt.id, self.dress.id})
+        self.assertEqual(response.context["facets"]["total"], 2)
+        data = self.client.get(reverse("catalog_facets"), {"category": "women"}).json()
+        self.assertEqual(data["total"], 2)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Cat", slug="cat")
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i:02d}", category=category, base_price=100 + (i % 3) * 10,
+                sale_price=None if i % 4 == 0 else 50 + i % 2,
+            )
+            for i in range(11)
+        ]
+
+    def walk(self, ordering):
+        paginator = KeysetPaginator(Product.objects.all(), ordering, per_page=3)
+        pages, page = [], paginator.page()
+        while True:
+            pages.append([p.pk for p in page])
+            if not page.next_cursor:
+                break
+            page = paginator.page(page.next_cursor)
+        backwards = []
+        while page.previous_cursor:
+            page = paginator.page(page.previous_cursor)
+            backwards.append([p.pk for p in page])
+        return pages, backwards
+
+    def test_matches_offset_ordering_in_both_directions(self):
+        for ordering in ["name", "-created_at", "base_price", "-base_price", "sale_price", "-sale_price"]:
+            with self.subTest(ordering=ordering):
+                pages, backwards = self.walk(ordering)
+                field = ordering.lstrip("-")
+                expr = F(field).desc(nulls_last=True) if ordering.startswith("-") else F(field).asc(nulls_last=True)
+                expected = list(Product.objects.order_by(expr, "-id" if ordering.startswith("-") else "id")
+                                .values_list("pk", flat=True))
+                self.assertEqual(sum(pages, []), expected)
+                self.assertEqual(list(reversed(backwards)), pages[:-1])
+
+    def test_catalog_list_cursor_mode(self):
+        url = reverse("catalog_list")
+        first = self.client.get(url, {"pagination": "cursor", "per_page": 5, "ordering": "base_price"}).json()
+        self.assertNotIn("count", first)
+        self.assertIsNone(first["previous"])
+        second = self.client.get(url, {"cursor": first["next"], "per_page": 5, "ordering": "base_price",
+                                       "count": "exact"}).json()
+        self.assertEqual(second["count"], 11)
+        self.assertEqual(len(second["results"]), 5)
+        self.assertFalse({p["id"] for p in first["results"]} & {p["id"] for p in second["results"]})
+
+    def test_api_cursor_mode(self):
+        response = self.client.get("/api/products/products/", {"pagination": "cursor", "ordering": "-sale_price"})
+        data = response.json()
+        self.assertEqual(len(data["results"]), 11)
+        self.assertIsNone(data["next"])
+        response = self.client.get("/api/products/products/", {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 200)
+
+
+class ProductListPaginationTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Cat", slug="cat")
+        self.products = [
+            Product.objects.create(name=f"Product {i:02d}", category=category, base_price=100 + i)
+            for i in range(30)
+        ]
+        facets.products_changed()
+
+    def test_first_page_and_more_endpoint(self):
+        response = self.client.get("/product_list/", {"sort": "low-high"})
+        first = [p.pk for p in response.context["products"]]
+        self.assertEqual(first, [p.pk for p in self.products[:24]])
+        self.assertEqual(response.context["facets"]["total"], 30)
+        self.assertIn("cursor=", response.context["next_query"])
+
+        data = self.client.get(reverse("product_list_more") + "?" + response.context["next_query"]).json()
+        self.assertIsNone(data["next"])
+        self.assertEqual(data["html"].count('class="product-card'), 6)
+        self.assertNotIn("product-list-next", data["html"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("product_list_more"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/product_list/", {"cursor": "garbage"})
+        self.assertEqual(len(response.context["products"]), 24)
+
+    def test_streaming_mode(self):
+        response = self.client.get("/product_list/", {"sort": "high-low", "stream": "1"})
+        self.assertTrue(response.streaming)
+        html = b"".join(response.streaming_content).decode()
+        self.assertEqual(html.count('class="product-card'), 24)
+        self.assertLess(html.index("Product 29"), html.index("Product 06"))
+        self.assertNotIn("Product 05", html)
+        self.assertIn("product-list-next", html)
+        self.assertIn("</html>", html)
+
+
+class ProductRatingTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Cat", slug="cat")
+        self.product = Product.objects.create(name="Prod", category=category, base_price=100)
+        self.users = [User.objects.create_user(email=f"u{i}@example.com", password="pass") for i in range(3)]
+
+    def review(self, user, rating, approved=True):
+        return Review.objects.create(product=self.product, user=user, rating=rating, is_approved=approved)
+
+    def test_aggregates_follow_approved_reviews(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 4)
+        pending = self.review(self.users[2], 1, approved=False)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_avg), (2, Decimal("4.50")))
+
+        pending.is_approved = True
+        pending.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 3)
+        self.assertEqual(self.product.rating_1, 1)
+        self.assertEqual(self.product.get_rating_histogram()[0], (5, 1, 33))
+
+        pending.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_1), (2, 0))
+
+    def test_product_list_shows_ratings_without_extra_queries(self):
+        self.review(self.users[0], 4)
+
+        def list_queries():
+            facets.products_changed()
+            self.client.get("/product_list/")  # прогрев фасетного индекса
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get("/product_list/")
+            return len(ctx.captured_queries), response
+
+        before, response = list_queries()
+        self.assertContains(response, '<span class="rating">4.0</span>')
+        for i, user in enumerate(self.users[1:]):
+            other = Product.objects.create(name=f"Other {i}", category=self.product.category, base_price=50)
+            Review.objects.create(product=other, user=user, rating=3, is_approved=True)
+        after, response = list_queries()
+        self.assertEqual(before, after)
+        self.assertContains(response, '<span class="rating">3.0</span>', count=2)
+
+
+class VariantMatrixTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Cat", slug="cat")
+        self.product = Product.objects.create(name="Tee", category=category, base_price=500)
+        self.red_l = ProductVariant.objects.create(product=self.product, size="L", color="Red", price=500, stock=0)
+        self.blue_s = ProductVariant.objects.create(product=self.product, size="S", color="Blue", price=450, stock=4)
+        ProductVariant.objects.create(product=self.product, size="XL", color="Red", price=550, stock=2)
+        cache.clear()
+
+    def test_build_from_one_query(self):
+        with self.assertNumQueries(1):
+            matrix = get_variant_matrix(self.product.pk)
+        self.assertEqual(matrix.sizes, ["S", "L", "XL"])
+        self.assertEqual(matrix.colors, ["Blue", "Red"])
+        self.assertEqual(matrix.get("S", "Blue").id, self.blue_s.id)
+        self.assertIsNone(matrix.get("S", "Red"))
+        self.assertEqual(matrix.size_options(), [("S", True), ("L", False), ("XL", True)])
+        with self.assertNumQueries(0):
+            get_variant_matrix(self.product.pk)
+
+    def test_cache_invalidated_on_variant_change(self):
+        get_variant_matrix(self.product.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.red_l.stock = 7
+            self.red_l.save()
+        self.assertEqual(get_variant_matrix(self.product.pk).get("L", "Red").stock, 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blue_s.delete()
+        self.assertEqual(get_variant_matrix(self.product.pk).colors, ["Red"])
+
+    def test_add_to_cart_resolves_selection(self):
+        user = User.objects.create_user(email="shopper@example.com", password="pass12345")
+        self.client.force_login(user)
+        self.client.post(f"/cart/add/{self.product.pk}/", {"size": "S", "color": "Blue", "qty": 1})
+        self.assertEqual(list(user.cart.items.values_list("variant_id", flat=True)), [self.blue_s.id])
+        response = self.client.post(f"/cart/add/{self.product.pk}/", {"size": "S", "color": "Red", "qty": 1})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(user.cart.items.count(), 1)
+
+
+class CoPurchaseTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="buyer@example.com", password="pass12345")
+        category = Category.objects.create(name="Cat", slug="cat")
+        self.jeans, self.belt, self.shirt, self.hat = [
+            Product.objects.create(name=name, category=category, base_price=100)
+            for name in ("Jeans", "Belt", "Shirt", "Hat")
+        ]
+        self.variants = {
+            p.pk: [ProductVariant.objects.create(product=p, size=size, color="Black", price=100) for size in ("M", "L")]
+            for p in (self.jeans, self.belt, self.shirt, self.hat)
+        }
+
+    def order(self, *products, status="placed"):
+        order = Order.objects.create(user=self.user, status=status)
+        for p in products:
+            for variant in self.variants[p.pk]:  # оба размера — один и тот же товар
+                OrderItem.objects.create(order=order, variant=variant, quantity=1, price=variant.price)
+
+    def test_top_k_across_chunks(self):
+        self.order(self.jeans, self.belt)
+        self.order(self.jeans, self.belt, self.shirt)
+        self.order(self.jeans, self.shirt, self.hat)
+        self.order(self.jeans, self.hat, status="cancelled")
+        # Маленькая порция: заказы переносятся между порциями, а не разрываются
+        self.assertEqual(compute_co_purchases(k=2, chunk_size=3), 4)
+        rows = list(ProductCoPurchase.objects.filter(product=self.jeans).values_list("related_id", "score"))
+        self.assertEqual(rows, [(self.belt.pk, 2), (self.shirt.pk, 2)])
+        self.assertEqual(
+            list(ProductCoPurchase.objects.filter(product=self.hat).values_list("related_id", "score")),
+            [(self.jeans.pk, 1), (self.shirt.pk, 1)],
+        )
+
+    def test_product_detail_reads_suggestions(self):
+        self.order(self.jeans, self.hat)
+        self.hat.is_active = False
+        self.hat.save()
+        self.order(self.jeans, self.shirt)
+        compute_co_purchases()
+        response = self.client.get(reverse("product_detail", args=[self.jeans.pk]))
+        self.assertEqual(list(response.context["suggestions"]), [self.shirt])
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Cat", slug="cat")
+        self.product = Product.objects.create(name="Tee", category=category, base_price=500)
+        fragments.stats.reset()
+        self.renders = 0
+
+    def render(self):
+        self.renders += 1
+        return f"<p>{self.renders}</p>"
+
+    def test_versioned_entries_and_counters(self):
+        self.assertEqual(fragments.get_fragment("card", self.product.pk, self.render), "<p>1</p>")
+        self.assertEqual(fragments.get_fragment("card", self.product.pk, self.render), "<p>1</p>")
+        ProductVariant.objects.create(product=self.product, size="M", color="Red", price=500)
+        self.assertEqual(fragments.get_fragment("card", self.product.pk, self.render), "<p>2</p>")
+        self.assertEqual(fragments.stats.summary()["card"], {"hits": 1, "misses": 2, "hit_rate": 1 / 3})
+
+    def test_template_tag_follows_product_changes(self):
+        facets.products_changed()
+        self.assertContains(self.client.get("/product_list/"), "Tee")
+        self.client.get("/product_list/")
+        self.assertEqual(fragments.stats.summary()["card"]["hits"], 1)
+        self.product.name = "Tank top"
+        self.product.save()
+        facets.products_changed()
+        response = self.client.get("/product_list/")
+        self.assertContains(response, "Tank top")
+        self.assertNotContains(response, "Tee")
+
+    def test_list_reads_card_fragments_in_one_batch(self):
+        for i in range(4):
+            Product.objects.create(name=f"Shirt {i}", category=self.product.category, base_price=500)
+        facets.products_changed()
+        self.client.get("/product_list/")
+        for params in ({}, {"stream": "1"}):
+            with patch.object(fragments, "fetch_fragments", wraps=fragments.fetch_fragments) as fetch:
+                response = self.client.get("/product_list/", params)
+                html = b"".join(response.streaming_content) if response.streaming else response.content
+            self.assertEqual(fetch.call_count, 1)
+            self.assertEqual(len(fetch.call_args.args[1]), 5)
+            self.assertIn(b"Shirt 3", html)
+        self.assertEqual(fragments.stats.summary()["card"], {"hits": 10, "misses": 5, "hit_rate": 10 / 15})
+
+
+class CatalogListCacheTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Cat", slug="cat")
+        self.product = Product.objects.create(name="Tee", category=self.category, base_price=500)
+
+    def test_equivalent_queries_share_an_entry(self):
+        url = reverse("catalog_list")
+        first = self.client.get(url, {"category": "cat", "ordering": "name", "utm_source": "mail"}).json()
+        with self.assertNumQueries(0):
+            again = self.client.get(url + "?ordering=bogus&ordering=name&category=cat&fbclid=x").json()
+        self.assertEqual(first, again)
+        self.assertEqual(
+            catalog_cache.normalize_list_params(QueryDict("per_page=500&page=-3&q=  Blue   TEE ")),
+            catalog_cache.normalize_list_params(QueryDict("q=blue tee&per_page=100")),
+        )
+
+    def test_writes_invalidate_entries(self):
+        url = reverse("catalog_list")
+        self.assertEqual(self.client.get(url).json()["results"][0]["price"], 500.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.base_price = 450
+            self.product.save()
+        self.assertEqual(self.client.get(url).json()["results"][0]["price"], 450.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "Tops"
+            self.category.save()
+        self.assertEqual(self.client.get(url).json()["results"][0]["category"], "Tops")
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Cat", slug="cat")
+        self.product = Product.objects.create(name="Tee", category=self.category, base_price=500)
+
+    def assertRevalidates(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached["ETag"], first["ETag"])
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(since.status_code, 304)
+        return first["ETag"]
+
+    def test_catalog_list(self):
+        url = reverse("catalog_list")
+        etag = self.assertRevalidates(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.base_price = 450
+            self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_api_list_and_detail(self):
+        detail = f"/api/products/products/{self.product.pk}/"
+        list_etag = self.assertRevalidates("/api/products/products/")
+        detail_etag = self.assertRevalidates(detail)
+        Product.objects.create(name="Other", category=self.category, base_price=50)
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=detail_etag).status_code, 304)
+        ProductVariant.objects.create(product=self.product, size="M", color="Red", price=500)
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+        self.assertEqual(self.client.get("/api/products/products/", HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.assertRevalidates(f"/api/products/categories/{self.category.pk}/")
+
+
+class SparseFieldsTest(TestCase):
+    url = "/api/products/products/"
+
+    def setUp(self):
+        category = Category.objects.create(name="Cat", slug="cat")
+        for i in range(3):
+            product = Product.objects.create(name=f"P{i}", category=category, base_price=100 + i)
+            ProductVariant.objects.create(product=product, size="M", color="Red", price=100)
+
+    def test_default_shape_unchanged(self):
+        item = self.client.get(self.url).json()["results"][0]
+        self.assertEqual(item["category"]["slug"], "cat")
+        self.assertEqual(item["variants"][0]["size"], "M")
+        self.assertIn("rating_histogram", item)
+
+    def test_fields_and_expand(self):
+        with self.assertNumQueries(2):  # COUNT + одна выборка без join и prefetch
+            data = self.client.get(self.url, {"fields": "id,name,base_price,image"}).json()
+        self.assertEqual(set(data["results"][0]), {"id", "name", "base_price", "image"})
+
+        item = self.client.get(self.url, {"fields": "id,category,variants"}).json()["results"][0]
+        self.assertIsInstance(item["category"], int)
+        self.assertIsInstance(item["variants"][0], int)
+
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url, {"fields": "id,category.name,variants.size"}).json()
+        item = data["results"][0]
+        self.assertEqual(item["category"], {"name": "Cat"})
+        self.assertEqual(item["variants"], [{"size": "M"}])
+
+        item = self.client.get(self.url, {"expand": "category"}).json()["results"][0]
+        self.assertEqual(item["category"]["name"], "Cat")
+        self.assertIsInstance(item["variants"][0], int)
+        self.assertEqual(set(item["rating_histogram"]), {"1", "2", "3", "4", "5"})
+
+
+class FastJSONRendererTest(TestCase):
+    def test_matches_drf_renderer(self):
+        category = Category.objects.create(name="Одежда", slug="cat")
+        product = Product.objects.create(name="Футболка", category=category, base_price=Decimal("1999.90"))
+        ProductVariant.objects.create(product=product, size="M", color="Red", price=Decimal("1999.90"))
+        data = ProductSerializer(Product.objects.all(), many=True).data
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+        data = {"name": "Платье\u2028новинка\u2029"}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), data)
+
+    def test_plain_types(self):
+        moment = timezone.make_aware(datetime(2024, 5, 1, 12, 30), timezone.get_fixed_timezone(0))
+        body = renderers.dumps({"price": Decimal("10.50"), "at": moment, "label": gettext_lazy("Товар"), "ids": {3}})
+        self.assertEqual(json.loads(body), {"price": "10.50", "at": "2024-05-01T12:30:00Z", "label": "Товар", "ids": [3]})
+        parsed = FastJSONParser().parse(io.BytesIO('{"q": "платье"}'.encode()))
+        self.assertEqual(parsed, {"q": "платье"})
+
+    def test_api_uses_fast_renderer(self):
+        response = self.client.get("/api/products/products/")
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+
+
+class ImageDerivativeTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.category = Category.objects.create(name="Одежда", slug="cat")
+
+    def upload(self, name, size):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, "red").save(buffer, "JPEG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def test_upload_generates_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name="Футболка", category=self.category, base_price=100, image=self.upload("shirt.jpg", (1000, 500)),
+            )
+        widths = sorted(ImageDerivative.objects.filter(source=product.image.name, format="webp").values_list("width", flat=True))
+        self.assertEqual(widths, [320, 640, 960, 1000])
+        self.assertTrue(product.image.storage.exists(derivative_name(product.image.name, 320, "webp")))
+
+        html = Template("{% load responsive_images %}{% responsive_image p.image alt=p.name %}").render(Context({"p": product}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f"/media/{derivative_name(product.image.name, 640, 'webp')} 640w", html)
+
+        data = ProductSerializer(product).data["image_srcset"]
+        self.assertEqual(data["src"], product.image.url)
+        self.assertIn(f"{derivative_name(product.image.name, 960, 'webp')} 960w", data["sources"][-1]["srcset"])
+
+    def test_backfill_command(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            product = Product.objects.create(
+                name="Футболка", category=self.category, base_price=100, image=self.upload("old.jpg", (400, 300)),
+            )
+        self.assertFalse(ImageDerivative.objects.exists())
+        self.assertIn("<img", Template("{% load responsive_images %}{% responsive_image p.image %}").render(Context({"p": product})))
+
+        call_command("generate_image_derivatives", workers=2, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(ImageDerivative.objects.filter(source=product.image.name, format="avif").values_list("width", flat=True)),
+            [320, 400],
+        )
+
+
+class ContentAddressedMediaTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.category = Category.objects.create(name="Одежда", slug="cat")
+
+    def upload(self, name, color="red"):
+        buffer = io.BytesIO()
+        Image.new("RGB", (40, 40), color).save(buffer, "JPEG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def product(self, image):
+        return Product.objects.create(name="Футболка", category=self.category, base_price=100, image=image)
+
+    def refcount(self, name):
+        return MediaFile.objects.get(name=name).refcount
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.product(self.upload("a.jpg"))
+        second = self.product(self.upload("copy of a.jpg"))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^products/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))), 1)
+        self.assertEqual(self.refcount(first.image.name), 2)
+
+    def test_garbage_collection_keeps_referenced_files(self):
+        kept = self.product(self.upload("a.jpg"))
+        replaced = self.product(self.upload("a.jpg"))
+        old_name = replaced.image.name
+        replaced.image = self.upload("b.jpg", color="blue")
+        replaced.save()
+        self.assertEqual(self.refcount(old_name), 1)
+
+        kept.delete()
+        self.assertEqual(self.refcount(old_name), 0)
+        self.assertEqual(media.collect_garbage(), [])  # ещё не истёк срок ожидания
+
+        MediaFile.objects.filter(name=old_name).update(updated_at=timezone.now() - timedelta(days=2))
+        os.utime(replaced.image.storage.path(old_name), (0, 0))
+        self.assertEqual(media.collect_garbage(), [old_name])
+        self.assertFalse(replaced.image.storage.exists(old_name))
+        self.assertTrue(replaced.image.storage.exists(replaced.image.name))
+
+    def test_rehash_merges_legacy_duplicates(self):
+        content = self.upload("x.jpg").read()
+        os.makedirs(default_storage.path("products"))
+        for name in ("products/legacy.jpg", "products/legacy_GGuA0a3.jpg"):
+            with open(default_storage.path(name), "wb") as fh:
+                fh.write(content)
+        first = self.product("products/legacy.jpg")
+        second = self.product("products/legacy_GGuA0a3.jpg")
+
+        renamed = media.rehash_legacy_files()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(len(set(renamed.values())), 1)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(self.refcount(first.image.name), 2)
+        self.assertEqual(self.refcount("products/legacy.jpg"), 0)
+
+
+class StaticFilesStorageTest(TestCase):
+    def test_hashes_and_precompresses(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        storage = StaticFilesStorage(location=root.name, base_url="/static/")
+        storage.save("images/bg.png", ContentFile(b"png"))
+        css = "body { background: url(../images/bg.png); } .old { background: url(../images/missing.gif); }" * 20
+        storage.save("css/site.css", ContentFile(css.encode()))
+
+        paths = {name: (storage, name) for name in ("images/bg.png", "css/site.css")}
+        list(storage.post_process(paths))
+
+        hashed = storage.stored_name("css/site.css")
+        self.assertNotEqual(hashed, "css/site.css")
+        self.assertTrue(storage.exists(hashed + ".gz"))
+        self.assertTrue(storage.exists(hashed + ".br"))
+        with storage.open(hashed) as fh:
+            content = fh.read().decode()
+        self.assertIn(storage.stored_name("images/bg.png").split("/")[-1], content)
+        self.assertIn("url(../images/missing.gif)", content)
+
+
+class CatalogImportTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Одежда", slug="clothes")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(content)
+        return path
+
+    def test_csv_upsert_and_delta_sync(self):
+        header = "external_id,name,category,base_price,size,color,price,stock,sku\n"
+        path = self.write("feed.csv", header + (
+            "A-1,Футболка,clothes,999,M,Red,999,5,A-1-M\n"
+            "A-1,Футболка,clothes,999,L,Red,999,0,A-1-L\n"
+            "B-2,Платье,clothes,2500,,,,,\n"
+            "C-3,Куртка,unknown,100,,,,,\n"
+        ))
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_catalog", path, batch_size=2, stdout=out, stderr=err)
+        self.assertIn("строк/с", out.getvalue())
+        self.assertIn("неизвестная категория", err.getvalue())
+
+        shirt = Product.objects.get(external_id="A-1")
+        self.assertEqual(shirt.variants.count(), 2)
+        self.assertTrue(Product.objects.filter(external_id="B-2").exists())
+        self.assertTrue(ProductSalesStats.objects.filter(product=shirt).exists())
+        self.assertIn(shirt, search_products(Product.objects.all(), "футболка"))
+
+        delta = self.write("delta.csv", header + "A-1,Футболка oversize,clothes,899,M,Red,899,7,A-1-M\n")
+        call_command("import_catalog", delta, stdout=io.StringIO())
+        shirt.refresh_from_db()
+        self.assertEqual((shirt.name, shirt.base_price), ("Футболка oversize", Decimal("899")))
+        self.assertEqual(shirt.variants.get(size="M").stock, 7)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(ProductVariant.objects.count(), 2)
+
+    def test_jsonl(self):
+        path = self.write("feed.jsonl", "\n".join([
+            json.dumps({"external_id": "J-1", "name": "Шорты", "category": "clothes", "base_price": "500",
+                        "variants": [{"size": "S", "color": "Blue", "price": "500", "stock": 3}]}),
+            "{broken",
+        ]))
+        err = io.StringIO()
+        call_command("import_catalog", path, stdout=io.StringIO(), stderr=err)
+        self.assertIn("строка 2", err.getvalue())
+        self.assertEqual(Product.objects.get(external_id="J-1").variants.get().stock, 3)
+
+    def test_import_resets_cached_cart_totals(self):
+        header = "external_id,name,category,base_price,size,color,price,stock\n"
+        call_command("import_catalog", self.write("feed.csv", header + "A-1,Футболка,clothes,999,M,Red,999,5\n"),
+                     stdout=io.StringIO())
+        user = User.objects.create_user(email="buyer@example.com", password="pass")
+        variant = ProductVariant.objects.get()
+        CartItem.objects.create(cart=Cart.objects.create(user=user), variant=variant, quantity=2)
+        self.assertEqual(get_cart_summary(user.pk).subtotal, Decimal("1998.00"))
+        self.assertEqual(summarize_lines({variant.pk: 1}).subtotal, Decimal("999.00"))
+
+        call_command("import_catalog", self.write("delta.csv", header + "A-1,Футболка,clothes,999,M,Red,799,5\n"),
+                     stdout=io.StringIO())
+        self.assertEqual(get_cart_summary(user.pk).subtotal, Decimal("1598.00"))
+        self.assertEqual(summarize_lines({variant.pk: 1}).subtotal, Decimal("799.00"))
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        ProductVariant.objects.create(
+            product=Product.objects.create(name="Старый", category=self.category, base_price=Decimal("1.00")),
+            size="M", color="Red", price=Decimal("1.00"), sku="TAKEN",
+        )
+        header = "external_id,name,category,base_price,size,color,price,stock,sku\n"
+        path = self.write("feed.csv", header + (
+            "A-1,Футболка,clothes,999,M,Red,999,-1,A-1-M\n"
+            "A-2,Футболка,clothes,NaN,,,,,\n"
+            "A-3,Футболка,clothes,Infinity,,,,,\n"
+            "A-4,Футболка,clothes,100000000,,,,,\n"
+            "A-5,Футболка,clothes,999,M,Red,999.999,1,DUP\n"
+            "A-6,Футболка,clothes,999,M,Red,999,1,DUP\n"
+            "A-7,Футболка,clothes,999,M,Red,999,1,TAKEN\n"
+        ))
+        err = io.StringIO()
+        call_command("import_catalog", path, stdout=io.StringIO(), stderr=err)
+        for line in (2, 3, 4, 5, 7, 8):
+            self.assertIn(f"строка {line}", err.getvalue())
+        self.assertNotIn("строка 6:", err.getvalue())
+        self.assertEqual(ProductVariant.objects.get(sku="DUP").price, Decimal("1000.00"))
+        self.assertEqual(ProductVariant.objects.get(sku="TAKEN").product.name, "Старый")
+        self.assertEqual(
+            set(Product.objects.exclude(external_id=None).values_list("external_id", flat=True)),
+            {"A-5", "A-7"},
+        )
+
+    def test_variants_can_swap_skus_in_one_batch(self):
+        header = "external_id,name,category,base_price,size,color,price,stock,sku\n"
+        path = self.write("feed.csv", header + (
+            "A-1,Футболка,clothes,999,M,Red,999,1,SKU-M\n"
+            "A-1,Футболка,clothes,999,L,Red,999,1,SKU-L\n"
+        ))
+        call_command("import_catalog", path, stdout=io.StringIO(), stderr=io.StringIO())
+        path = self.write("swap.csv", header + (
+            "A-1,Футболка,clothes,999,M,Red,999,1,SKU-L\n"
+            "A-1,Футболка,clothes,999,L,Red,999,1,SKU-M\n"
+        ))
+        err = io.StringIO()
+        call_command("import_catalog", path, stdout=io.StringIO(), stderr=err)
+        self.assertNotIn("sku", err.getvalue())
+        self.assertEqual(dict(ProductVariant.objects.values_list("size", "sku")), {"M": "SKU-L", "L": "SKU-M"})
+
+
+class ProductExportTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Одежда", slug="clothes")
+        self.shirt = Product.objects.create(name="Футболка", category=category, base_price=Decimal("999.00"), external_id="A-1")
+        ProductVariant.objects.create(product=self.shirt, size="M", color="Red", price=Decimal("999.00"), stock=5)
+        ProductVariant.objects.create(product=self.shirt, size="L", color="Red", price=Decimal("999.00"), stock=0)
+        Product.objects.create(name="Платье", category=category, base_price=Decimal("2500.00"))
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="pass")
+
+    def test_api_csv_export_round_trips_through_import(self):
+        self.client.force_login(self.admin)
+        response = self.client.get("/api/products/products/export/", {"output": "csv"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode("utf-8-sig"))))
+        self.assertEqual([(r["name"], r["size"]) for r in rows], [("Футболка", "M"), ("Футболка", "L"), ("Платье", "")])
+        self.assertEqual(rows[0]["category"], "clothes")
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "products.csv")
+        with open(path, "w", encoding="utf-8") as fh:
+            writer = csv.DictWriter(fh, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(r for r in rows if r["external_id"])
+        call_command("import_catalog", path, stdout=io.StringIO())
+        self.assertEqual(ProductVariant.objects.count(), 2)
+
+    def test_admin_action_jsonl_and_permissions(self):
+        self.assertIn(self.client.get("/api/products/products/export/").status_code, (401, 403))
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse("admin:catalog_product_changelist"), {
+            "action": "export_products_jsonl", "_selected_action": [self.shirt.pk],
+        })
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])["base_price"], "999.00")
+
+
+class ProductPdfExportTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        category = Category.objects.create(name="Одежда", slug="clothes")
+        Product.objects.bulk_create(
+            Product(name=f"Товар {i}", category=category, base_price=Decimal("100.00"))
+            for i in range(60)
+        )
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="pass")
+        self.client.force_login(self.admin)
+
+    def test_action_runs_job_and_offers_download(self):
+        changelist = reverse("admin:catalog_product_changelist")
+        ids = list(Product.objects.values_list("pk", flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(changelist, {"action": "export_products_pdf", "_selected_action": ids})
+        self.assertEqual(response.status_code, 302)
+
+        job = ExportJob.objects.get()
+        self.assertEqual((job.status, job.total, job.processed, job.progress_percent), ("done", 60, 60, 100))
+        self.assertIsNotNone(job.finished_at)
+
+        download = reverse("admin:catalog_exportjob_download", args=[job.pk])
+        response = self.client.get(changelist)
+        self.assertContains(response, download)
+        self.assertNotContains(self.client.get(changelist), download)
+
+        response = self.client.get(download)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+        other = User.objects.create_user(email="staff@example.com", password="pass", is_staff=True)
+        self.client.force_login(other)
+        self.assertNotEqual(self.client.get(download).status_code, 200)
+
+    def test_rows_use_current_price(self):
+        first, second = Product.objects.order_by("pk")[:2]
+        Product.objects.filter(pk=first.pk).update(sale_price=Decimal("80.00"))
+        Product.objects.filter(pk=second.pk).update(sale_price=Decimal("0"))
+        rows = list(product_rows(Product.objects.filter(pk__in=[first.pk, second.pk])))
+        self.assertEqual([price for _, price in rows], [Decimal("80.00"), Decimal("100.00")])
+
+    def test_selection_is_stored_and_pages_are_written_as_they_fill(self):
+        selection = save_selection(Product.objects.filter(name__endswith="1"))
+        rows = list(product_rows(load_selection(selection), chunk_size=2))
+        self.assertEqual([name for name, _ in rows], [f"Товар {i}" for i in (1, 11, 21, 31, 41, 51)])
+
+        fh = io.BytesIO()
+        pdf = PdfWriter(fh)
+        pdf.add_page([(40, 800, "Shirt (M)")])
+        written = fh.tell()
+        self.assertGreater(written, 20)  # страница уже в файле, до close()
+        pdf.add_page([])
+        pdf.close()
+        data = fh.getvalue()
+        self.assertIn(b"/Count 2", data)
+        # Таблица смещений указывает на начала объектов
+        xref = int(data.rsplit(b"startxref\n", 1)[1].split(b"\n")[0])
+        entries = data[xref:].split(b"\n")[3:3 + pdf.next_object - 1]
+        for number, entry in enumerate(entries, 1):
+            self.assertTrue(data[int(entry[:10]):].startswith(b"%d 0 obj" % number))
+
+
+class AdminChangelistQueriesTest(AdminChangelistQueriesMixin, TestCase):
+    def add_products(self, count):
+        category = Category.objects.create(name=f"Категория {Category.objects.count()}", slug=f"cat-{Category.objects.count()}")
+        for i in range(count):
+            product = Product.objects.create(name=f"Товар {i}", category=category, base_price=Decimal("100.00"))
+            ProductVariant.objects.create(product=product, size="M", color="Red", price=Decimal("100.00"), stock=3)
+            ProductVariant.objects.create(product=product, size="L", color="Red", price=Decimal("100.00"), stock=4)
+
+    def add_categories(self, count):
+        for _ in range(count):
+            self.add_products(2)
+
+    def test_product_changelist_query_count_does_not_grow_with_rows(self):
+        response = self.assert_queries_do_not_grow(reverse("admin:catalog_product_changelist"), self.add_products)
+        product = response.context["cl"].result_list[0]
+        self.assertEqual((product.variants_total, product.stock_total), (2, 7))
+
+    def test_category_changelist_query_count_does_not_grow_with_rows(self):
+        response = self.assert_queries_do_not_grow(
+            reverse("admin:catalog_category_changelist"), self.add_categories, few=1, more=5
+        )
+        self.assertEqual({c.products_total for c in response.context["cl"].result_list}, {2})
+
+    def test_annotated_column_is_sortable(self):
+        self.add_products(1)
+        Product.objects.create(name="Без вариантов", category=Category.objects.get(), base_price=Decimal("1.00"))
+        index = ProductAdmin.list_display.index("get_variants_count")
+        response = self.client.get(reverse("admin:catalog_product_changelist"), {"o": str(index + 1)})
+        self.assertEqual([p.variants_total for p in response.context["cl"].result_list], [0, 2])
@@ -0,0 +1,116 @@
+"""Матрица вариантов товара «размер × цвет».
+
+Строится одним запросом к ProductVariant и кэшируется на товар;
+сигналы вариантов сбрасывают кэш после коммита.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from .models import ProductVariant
+
+CACHE_KEY = 'variant_matrix:{}'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+# Привычный порядок размеров; остальные идут после них по алфавиту
+SIZE_ORDER = ('XXS', 'XS', 'S', 'M', 'L', 'XL', 'XXL', 'XXXL')
+
+
+class VariantCell(namedtuple('VariantCell', 'id size color price stock image')):
+    """Ячейка матрицы — один вариант товара"""
+
+    __slots__ = ()
+
+    @property
+    def image_url(self):
+        return default_storage.url(self.image) if self.image else ''
+
+    @property
+    def in_stock(self):
+        return self.stock > 0
+
+
+def _size_key(size):
+    upper = size.upper()
+    if upper in SIZE_ORDER:
+        return (0, SIZE_ORDER.index(upper), '')
+    try:
+        return (1, float(size.replace(',', '.')), '')
+    except ValueError:
+        return (2, 0, upper)
+
+
+class VariantMatrix:
+    """Доступность вариантов товара по размеру и цвету"""
+
+    def __init__(self, product_id, cells):
+        self.product_id = product_id
+        self.cells = {(cell.size, cell.color): cell for cell in cells}
+        self.sizes = sorted({cell.size for cell in cells}, key=_size_key)
+        self.colors = sorted({cell.color for cell in cells}, key=str.lower)
+
+    @classmethod
+    def build(cls, product_id):
+        """Строит матрицу по активным вариантам товара одним запросом"""
+        rows = (
+            ProductVariant.objects.filter(product_id=product_id, is_active=True)
+            .order_by('id')
+            .values_list('id', 'size', 'color', 'price', 'stock', 'image')
+        )
+        return cls(product_id, [VariantCell(*row) for row in rows])
+
+    def __bool__(self):
+        return bool(self.cells)
+
+    def get(self, size, color):
+        """Вариант по выбранным размеру и цвету или None"""
+        return self.cells.get((size, color))
+
+    def size_options(self):
+        """[(размер, есть ли в наличии хотя бы в одном цвете)]"""
+        return [
+            (size, any(self.cells.get((size, color), _EMPTY).in_stock for color in self.colors))
+            for size in self.sizes
+        ]
+
+    def color_options(self):
+        """[(цвет, картинка первого варианта с изображением, есть ли в наличии)]"""
+        options = []
+        for color in self.colors:
+            cells = [self.cells[(size, color)] for size in self.sizes if (size, color) in self.cells]
+            image = next((cell.image_url for cell in sorted(cells) if cell.image), '')
+            options.append((color, image, any(cell.in_stock for cell in cells)))
+        return options
+
+    def as_dict(self):
+        """Представление для клиента: {"размер|цвет": {id, price, stock}}"""
+        return {
+            'sizes': self.sizes,
+            'colors': self.colors,
+            'cells': {
+                f'{cell.size}|{cell.color}': {'id': cell.id, 'price': str(cell.price), 'stock': cell.stock}
+                for cell in self.cells.values()
+            },
+        }
+
+
+_EMPTY = VariantCell(None, '', '', None, 0, '')
+
+
+def get_variant_matrix(product_id):
+    """Возвращает матрицу вариантов товара из кэша, при промахе строит её"""
+    key = CACHE_KEY.format(product_id)
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = VariantMatrix.build(product_id)
+        cache.set(key, matrix, CACHE_TIMEOUT)
+    return matrix
+
+
+def invalidate_variant_matrix(product_id):
+    cache.delete(CACHE_KEY.format(product_id))
+
+
+def invalidate_variant_matrices(product_ids):
+    cache.delete_many([CACHE_KEY.format(product_id) for product_id in product_ids])
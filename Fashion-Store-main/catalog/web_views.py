@@ -1,20 +1,26 @@
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Q
-from .models import Product, Category, ProductVariant, Review, OtherCategory, ReviewImage
-from django.db.models import Sum, F, Value
-from django.db.models.functions import Coalesce
-from django.db.models import OuterRef, Subquery
+from .models import Product, Category, Review, OtherCategory, ReviewImage
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404, redirect
 from orders.models import OrderItem
 from django.http import HttpResponseForbidden
+from itertools import islice
 
-from django.views.decorators.cache import cache_page
-from django.http import JsonResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
 from django.core.paginator import Paginator
-from django.db.models import Q
 from catalog.models import Product
+from .search import search_products
+from .sales import BESTSELLER_ORDERING
+from .facets import facet_counts, filter_by_variant_facets
+from .pagination import InvalidCursor, KeysetPage, KeysetPaginator, KeysetStream, get_count
+from .fragments import PREFETCHED, prefetch_fragments
+from .variants import get_variant_matrix
+from .copurchase import frequently_bought_together
+from . import cache as catalog_cache
+from fashion_store import conditional, renderers
+from fashion_store.renderers import FastJsonResponse
 
 
 def home(request):
@@ -31,7 +37,7 @@ def home(request):
     if other_category_slug:
         qs = qs.filter(other_category__slug=other_category_slug)
     if q:
-        qs = qs.filter(Q(name__icontains=q) | Q(description__icontains=q))
+        qs = search_products(qs, q)
     if min_price:
         qs = qs.filter(base_price__gte=min_price)
     if max_price:
@@ -39,44 +45,71 @@ def home(request):
     categories = Category.objects.all()
     return render(request, 'catalog/home.html', {'products': qs, 'categories': categories,})
 
-def product_list(request):
-    qs =  (Product.objects
-    .select_related("category")  # only FK
-    .annotate(
-        total_quantity=Coalesce(Sum("variants__order_items__quantity"), Value(0))
-    )
-    .order_by("-total_quantity"))
-    category_slug = request.GET.getlist('category')
-    print(f"testing the sug {category_slug}")
-    sort = request.GET.get('sort')
-    other_category_slug = request.GET.getlist('other_category')
-    print(f"testing the othersug {other_category_slug}")
-    q = request.GET.get('q')
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if sort == "low-high":
-        qs = qs.order_by('base_price')
-    if sort == "high-low":
-        qs = qs.order_by('-base_price')
-    if sort == "newest":
-        qs = qs.order_by('-created_at')
-    if sort == "recommended":
-        qs = qs.annotate(
-        total_quantity=Coalesce(Sum("variants__order_items__quantity"), Value(0))
-    ).order_by("-total_quantity")
+PRODUCT_LIST_PAGE_SIZE = 24
+# Сортировки витрины → поле keyset-пагинации
+PRODUCT_LIST_SORTS = {
+    "recommended": BESTSELLER_ORDERING,
+    "low-high": "base_price",
+    "high-low": "-base_price",
+    "newest": "-created_at",
+}
+PRODUCT_STREAM_MARKER = "<!--product-stream-->"
+
+
+def _product_list_paginator(params):
+    """Пагинатор товаров витрины с фильтрами из GET-параметров"""
+    qs = Product.objects.select_related("category")
+    category_slug = params.getlist('category')
+    other_category_slug = params.getlist('other_category')
+    q = params.get('q')
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
 
     if category_slug:
         qs = qs.filter(category__slug__in=category_slug)
     if other_category_slug:
         qs = qs.filter(other_category__slug__in=other_category_slug)
     if q:
-        qs = qs.filter(Q(name__icontains=q) | Q(description__icontains=q))
+        qs = search_products(qs, q)
     if min_price:
         qs = qs.filter(base_price__gte=min_price)
     if max_price:
         qs = qs.filter(base_price__lte=max_price)
-    categories = Category.objects.all()
-    other_categories = OtherCategory.objects.all()
+    qs = filter_by_variant_facets(qs, params)
+    ordering = PRODUCT_LIST_SORTS.get(params.get('sort'), BESTSELLER_ORDERING)
+    return KeysetPaginator(qs, ordering, PRODUCT_LIST_PAGE_SIZE)
+
+
+def _next_query(params, cursor):
+    """GET-параметры ссылки на следующую страницу"""
+    if not cursor:
+        return ""
+    params = params.copy()
+    params.pop("stream", None)
+    params["cursor"] = cursor
+    return params.urlencode()
+
+
+def product_list(request):
+    paginator = _product_list_paginator(request.GET)
+    category_slug = request.GET.getlist('category')
+    other_category_slug = request.GET.getlist('other_category')
+    cursor = request.GET.get('cursor')
+    streaming = request.GET.get('stream') == '1'
+    try:
+        page = paginator.stream(cursor) if streaming else paginator.page(cursor)
+    except InvalidCursor:
+        page = paginator.stream() if streaming else paginator.page()
+
+    # Количества для боковой панели фильтров — из фасетного индекса, без COUNT-запросов
+    facets = facet_counts(request.GET)
+    counts = {facet: {v['value']: v['count'] for v in values} for facet, values in facets['facets'].items()}
+    categories = list(Category.objects.all())
+    for cat in categories:
+        cat.facet_count = counts['category'].get(cat.slug, 0)
+    other_categories = list(OtherCategory.objects.all())
+    for cat in other_categories:
+        cat.facet_count = counts['other_category'].get(cat.slug, 0)
     heading = "Outfit For Men & Women"
     other_heading=""
     if category_slug:
@@ -87,29 +120,57 @@ def product_list(request):
         cats = OtherCategory.objects.filter(slug__in=other_category_slug).values_list("name", flat=True)
         other_heading = ", ".join(cats)
         heading = f"{heading} - {other_heading}"
-    return render(request, 'catalog/product_list.html', {'products': qs, 'categories': categories,'other_categories':other_categories,'heading':heading})
+    context = {'products': page, 'categories': categories,'other_categories':other_categories,'heading':heading,'facets':facets}
+    if streaming:
+        return _stream_product_list(request, context, page)
+    context['next_query'] = _next_query(request.GET, page.next_cursor)
+    return render(request, 'catalog/product_list.html', context)
 
-def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    variants = product.variants.all()
-    # Subquery to get first variant per unique size
-    size_subquery = product.variants.filter(size=OuterRef("size")).order_by("id")
 
-    unique_size_variants = (
-        product.variants.filter(id=Subquery(size_subquery.values("id")[:1]))
-    )
+def _stream_product_list(request, context, page):
+    """Отдаёт страницу частями: шапку и фильтры сразу, карточки — по мере чтения из БД"""
+    html = render_to_string('catalog/product_list.html', {**context, 'streaming': True}, request=request)
+    head, tail = html.split(PRODUCT_STREAM_MARKER, 1)
+    card = get_template('catalog/includes/product_card.html')
+    page_end = get_template('catalog/includes/product_page.html')
 
-    # Same for color
-    color_subquery = product.variants.filter(color=OuterRef("color")).order_by("id")
+    def chunks():
+        yield head
+        products = iter(page)
+        # Фрагменты карточек читаются из кэша пачками по мере чтения строк из БД
+        while batch := list(islice(products, KeysetStream.chunk_size)):
+            prefetched = prefetch_fragments('card', batch)
+            for p in batch:
+                yield card.render({'p': p, PREFETCHED: prefetched}, request)
+        yield page_end.render({'products': (), 'next_query': _next_query(request.GET, page.next_cursor)}, request)
+        yield tail
 
-    unique_color_variants = (
-        product.variants.filter(id=Subquery(color_subquery.values("id")[:1]))
-    )
-    # simple outfit suggestion: same category, different product
-    suggestions = Product.objects.filter(category=product.category).exclude(id=product.id)[:5]
+    return StreamingHttpResponse(chunks(), content_type='text/html; charset=utf-8')
+
+
+def product_list_more(request):
+    """Следующая страница карточек для бесконечной прокрутки (JSON с HTML-фрагментом)"""
+    paginator = _product_list_paginator(request.GET)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return FastJsonResponse({"error": "invalid cursor"}, status=400)
+    next_query = _next_query(request.GET, page.next_cursor)
+    html = render_to_string('catalog/includes/product_page.html', {'products': page, 'next_query': next_query}, request=request)
+    return FastJsonResponse({"html": html, "next": page.next_cursor})
+
+def product_detail(request, pk):
+    product = get_object_or_404(Product, pk=pk)
+    # Размеры, цвета и наличие — из кэшируемой матрицы вариантов (один запрос при промахе)
+    matrix = get_variant_matrix(product.pk)
+    # «часто покупают вместе»; пока статистики нет — товары той же категории
+    suggestions = frequently_bought_together(product, limit=5)
+    if not suggestions:
+        suggestions = Product.objects.filter(category=product.category, is_active=True).exclude(id=product.id)[:5]
     reviews = product.reviews.select_related('user').prefetch_related('reviews_image').all()
     return render(request, 'catalog/product_detail.html', {
-        'product': product, 'variants': variants, 'suggestions': suggestions, 'reviews': reviews,'unique_sizes':unique_size_variants,'unique_colors':unique_color_variants
+        'product': product, 'matrix': matrix, 'suggestions': suggestions, 'reviews': reviews,
+        'unique_sizes': matrix.size_options(), 'unique_colors': matrix.color_options(),
     })
 
 
@@ -155,26 +216,36 @@ def create_review(request, pk):
     return redirect('product_detail', pk=product.pk)
 
 
-@cache_page(60)  # кэш на 60 секунд
 def catalog_list(request):
-    # Параметры фильтрации/сортировки/пагинации
-    q = request.GET.get("q")  # поиск по имени/описанию
-    category = request.GET.get("category")  # slug категории
-    other_category = request.GET.get("other_category")  # slug доп.категории
-    only_active = request.GET.get("active", "1")  # фильтр активных
-    is_featured = request.GET.get("featured")  # рекомендуемые
-    ordering = request.GET.get("ordering", "-created_at")  # например "-created_at" или "name"
+    # Кэш по нормализованным параметрам, сбрасывается при записи в каталог
+    params = catalog_cache.normalize_list_params(request.GET)
+    # Условный GET: ETag по поколению каталога и параметрам, без запроса к БД
+    etag, last_modified = conditional.validators(
+        (catalog_cache.CATALOG_GENERATION,), f"catalog_list|{sorted(params.items())}"
+    )
+    response = conditional.not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    content = catalog_cache.get_or_set("catalog_list", params, lambda: _catalog_list_content(params))
+    return conditional.set_validators(HttpResponse(content, content_type="application/json"), etag, last_modified)
+
 
-    page = int(request.GET.get("page", 1))
-    per_page = int(request.GET.get("per_page", 12))
+def _catalog_list_content(params):
+    # Параметры фильтрации/сортировки/пагинации (уже нормализованы)
+    q = params["q"]  # поиск по имени/описанию
+    category = params["category"]  # slug категории
+    other_category = params["other_category"]  # slug доп.категории
+    is_featured = params["featured"]  # рекомендуемые
+    ordering = params["ordering"]  # например "-created_at" или "name" (белый список)
+    per_page = params["per_page"]
 
     qs = Product.objects.select_related("category", "other_category").all()
 
     # Фильтры
-    if only_active == "1":
+    if params["active"]:
         qs = qs.filter(is_active=True)
     if q:
-        qs = qs.filter(Q(name__icontains=q) | Q(description__icontains=q) | Q(short_description__icontains=q))
+        qs = search_products(qs, q)
     if category:
         qs = qs.filter(category__slug=category, category__is_active=True)
     if other_category:
@@ -182,15 +253,17 @@ def catalog_list(request):
     if is_featured in ("0", "1"):
         qs = qs.filter(is_featured=(is_featured == "1"))
 
-    # Сортировка (белый список полей, чтобы не дать инъекцию)
-    allowed_order = {"name", "-name", "created_at", "-created_at", "base_price", "-base_price", "sale_price", "-sale_price"}
-    if ordering not in allowed_order:
-        ordering = "-created_at"
-    qs = qs.order_by(ordering)
-
-    # Пагинация
-    paginator = Paginator(qs, per_page)
-    page_obj = paginator.get_page(page)
+    # Пагинация: keyset-режим по ?cursor= или ?pagination=cursor, иначе постраничная
+    if params["keyset"]:
+        paginator = KeysetPaginator(qs, ordering, per_page)
+        try:
+            page_obj = paginator.page(params["cursor"])
+        except InvalidCursor:
+            page_obj = paginator.page()
+    else:
+        qs = qs.order_by(ordering)
+        paginator = Paginator(qs, per_page)
+        page_obj = paginator.get_page(params["page"])
 
     # Сериализация
     def price(p):
@@ -211,13 +284,27 @@ def catalog_list(request):
         for p in page_obj.object_list
     ]
 
-    data = {
-        "count": paginator.count,
-        "num_pages": paginator.num_pages,
-        "page": page_obj.number,
-        "results": items,
-    }
-    return JsonResponse(data, json_dumps_params={"ensure_ascii": False})
+    if isinstance(page_obj, KeysetPage):
+        data = {
+            "next": page_obj.next_cursor,
+            "previous": page_obj.previous_cursor,
+            "results": items,
+        }
+        count = get_count(qs, params["count"])
+        if count is not None:
+            data["count"] = count
+    else:
+        data = {
+            "count": paginator.count,
+            "num_pages": paginator.num_pages,
+            "page": page_obj.number,
+            "results": items,
+        }
+    return renderers.dumps(data)
+
+def catalog_facets(request):
+    """Фасетные счётчики для текущего набора фильтров (JSON)"""
+    return FastJsonResponse(facet_counts(request.GET))
 
 @login_required
 def delete_review(request, review_id):
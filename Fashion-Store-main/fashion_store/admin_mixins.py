@@ -0,0 +1,75 @@
+"""Аннотации для списков админки вместо запросов на каждую строку.
+
+Колонки вида «количество вариантов» или «заказов пользователя» раньше
+считались методом модели для каждой строки — страница из 100 строк
+давала сотни запросов. AnnotatedAdminMixin добавляет эти значения в
+запрос списка, а annotated_display передаёт их методу отображения:
+
+    class ProductAdmin(AnnotatedAdminMixin, admin.ModelAdmin):
+        list_annotations = {
+            'variants_total': subquery_count(ProductVariant.objects.filter(product=OuterRef('pk'))),
+        }
+
+        @annotated_display('variants_total', fallback='get_variants_count', description=_('Варианты'))
+        def get_variants_count(self, obj, count):
+            return count
+
+Счётчики считаются коррелированными подзапросами, а не Count() по
+JOIN: несколько агрегатов по разным связям не перемножают строки.
+"""
+import functools
+
+from django.contrib import admin
+from django.db.models import F, Func, IntegerField, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def subquery_count(queryset):
+    """Количество строк queryset, связанного с внешним запросом через OuterRef"""
+    # Func, а не Count: агрегат добавил бы GROUP BY и вернул строку на группу
+    counted = queryset.order_by().annotate(
+        _count=Func(F('pk'), function='COUNT', output_field=IntegerField())
+    ).values('_count')
+    return Coalesce(Subquery(counted), Value(0))
+
+
+def subquery_sum(queryset, field):
+    """Сумма поля по строкам queryset, связанного с внешним запросом через OuterRef"""
+    output_field = queryset.model._meta.get_field(field)
+    summed = queryset.order_by().annotate(
+        _sum=Func(F(field), function='SUM', output_field=output_field)
+    ).values('_sum')
+    return Coalesce(Subquery(summed), Value(0), output_field=output_field)
+
+
+class AnnotatedAdminMixin:
+    """Добавляет list_annotations к queryset админки (список и форма объекта)"""
+
+    list_annotations = {}
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.list_annotations:
+            queryset = queryset.annotate(**self.list_annotations)
+        return queryset
+
+
+def annotated_display(annotation, fallback=None, **kwargs):
+    """admin.display для колонки из аннотации.
+
+    Метод получает вторым аргументом значение аннотации; если объект
+    загружен не через get_queryset админки, значение вычисляется методом
+    модели fallback. Колонка сортируется по аннотации.
+    """
+    kwargs.setdefault('ordering', annotation)
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, obj):
+            if hasattr(obj, annotation):
+                value = getattr(obj, annotation)
+            else:
+                value = getattr(obj, fallback)() if fallback else None
+            return method(self, obj, value)
+        return admin.display(**kwargs)(wrapper)
+    return decorator
@@ -0,0 +1,58 @@
+"""Счётчики поколений для инвалидации кэшей.
+
+Ключи кэша включают номер поколения, поэтому записи могут жить долго:
+при изменении данных достаточно увеличить поколение, и старые записи
+перестают читаться, а затем вытесняются самим кэшем.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _key(namespace):
+    return f"generation:{namespace}"
+
+
+def _seed():
+    # Стартовое значение зависит от времени: если счётчик вытеснен из кэша,
+    # новое поколение не совпадёт ни с одним из уже использованных
+    return int(time.time() * 1000)
+
+
+def get_generation(namespace):
+    """Возвращает текущее поколение пространства имён"""
+    value = cache.get(_key(namespace))
+    if value is None:
+        cache.add(_key(namespace), _seed(), timeout=None)
+        value = cache.get(_key(namespace))
+    return value
+
+
+def get_generations(*namespaces):
+    """Возвращает поколения нескольких пространств имён одним запросом к кэшу"""
+    values = cache.get_many([_key(ns) for ns in namespaces])
+    return tuple(
+        values.get(_key(ns)) or get_generation(ns)
+        for ns in namespaces
+    )
+
+
+def bump_generation(namespace):
+    """Увеличивает поколение и возвращает новое значение"""
+    try:
+        return cache.incr(_key(namespace))
+    except ValueError:
+        value = _seed()
+        cache.set(_key(namespace), value, timeout=None)
+        return value
+
+
+def invalidate(namespace):
+    """Увеличивает поколение сразу и ещё раз после коммита транзакции.
+
+    Запись, собранная параллельным запросом по данным до коммита,
+    остаётся под промежуточным поколением и больше не читается.
+    """
+    bump_generation(namespace)
+    transaction.on_commit(lambda: bump_generation(namespace))
@@ -11,5 +11,21 @@ app.conf.beat_schedule = {
     "send-promotions-every-morning": {
         "task": "catalog.tasks.send_daily_promotions",
         "schedule": crontab(minute="*/1"),  # каждый день в 07:00 UTC
-    }
-}
\ No newline at end of file
+    },
+    "reconcile-product-sales-stats-nightly": {
+        "task": "catalog.tasks.reconcile_product_sales_stats",
+        "schedule": crontab(hour=2, minute=30),
+    },
+    "compute-product-co-purchases-nightly": {
+        "task": "catalog.tasks.compute_product_co_purchases",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "release-expired-stock-reservations": {
+        "task": "cart.tasks.release_expired_reservations",
+        "schedule": crontab(minute="*/1"),
+    },
+    "flush-carts-to-database": {
+        "task": "cart.tasks.flush_carts",
+        "schedule": 30.0,  # каждые 30 секунд
+    },
+}
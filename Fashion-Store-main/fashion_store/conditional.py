@@ -0,0 +1,80 @@
+"""Условные GET-запросы (ETag / Last-Modified) без обращения к БД.
+
+Валидаторы строятся из поколений кэша (fashion_store.cache): ETag —
+хэш поколений и области ответа (путь, параметры, формат).
+Last-Modified — момент, когда текущая версия впервые была замечена;
+updated_at для этого не годится — он не меняется при удалении строк,
+правке вариантов и пересчёте оценок.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import get_generations
+
+LAST_MODIFIED_TIMEOUT = 30 * 24 * 60 * 60
+
+
+def validators(namespaces, scope):
+    """Возвращает (etag, last_modified) для области ответа и её поколений"""
+    token = ':'.join(str(g) for g in get_generations(*namespaces)) if namespaces else ''
+    etag = '"%s"' % hashlib.md5(f'{scope}|{token}'.encode()).hexdigest()
+    key = f'last_modified:{etag}'
+    last_modified = cache.get(key)
+    if last_modified is None:
+        cache.add(key, int(time.time()), LAST_MODIFIED_TIMEOUT)
+        last_modified = cache.get(key) or int(time.time())
+    return etag, last_modified
+
+
+def request_scope(request):
+    """Область ответа: путь с упорядоченными параметрами и формат"""
+    query = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    return f'{request.path}?{query}|{request.META.get("HTTP_ACCEPT", "")}'
+
+
+def not_modified(request, etag, last_modified):
+    """Ответ 304, если у клиента актуальная версия, иначе None"""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """ETag/Last-Modified для list и retrieve во ViewSet.
+
+    conditional_namespaces — поколения, от которых зависит список;
+    get_object_namespaces(lookup) — поколения одного объекта.
+    """
+
+    conditional_namespaces = ()
+
+    def get_object_namespaces(self, lookup):
+        return self.conditional_namespaces
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, self.conditional_namespaces, super().list, args, kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self._conditional(request, self.get_object_namespaces(lookup), super().retrieve, args, kwargs)
+
+    def _conditional(self, request, namespaces, handler, args, kwargs):
+        etag, last_modified = validators(namespaces, request_scope(request))
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
@@ -0,0 +1,167 @@
+"""Разреженные наборы полей для API: ?fields= и ?expand=.
+
+fields=id,name,category.name — оставить только перечисленные поля
+(через точку — поля вложенных объектов).
+expand=category,items.variant — какие связи отдавать вложенными
+объектами; остальные связи из expandable_fields отдаются как id.
+Без обоих параметров ответ не меняется: все связи вложены, как раньше.
+
+ShapedQuerysetMixin подстраивает only()/select_related/prefetch_related
+viewset'а под запрошенную форму ответа.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_tree(value):
+    """'a,b.c,b.d' → {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in filter(None, (p.strip() for p in path.split('.'))):
+            node = node.setdefault(part, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """Сериализатор с поддержкой ?fields= и ?expand=.
+
+    expandable_fields — вложенные связи, которые можно свернуть до id.
+    method_field_sources — поля модели, нужные SerializerMethodField
+    (для only() во viewset).
+    """
+
+    expandable_fields = ()
+    method_field_sources = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shape = None
+        if fields is not None or expand is not None:
+            self._shape = (
+                parse_tree(fields) if fields is not None else None,
+                parse_tree(expand) if expand is not None else None,
+            )
+
+    def _requested_shape(self):
+        if self._shape is not None:
+            return self._shape
+        is_root = self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+        )
+        request = self.context.get('request')
+        if not is_root or request is None or request.method not in SAFE_METHODS:
+            return None, None
+        params = request.query_params
+        return (
+            parse_tree(params['fields']) if 'fields' in params else None,
+            parse_tree(params['expand']) if 'expand' in params else None,
+        )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested, expand = self._requested_shape()
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        for name in self.expandable_fields:
+            field = fields.get(name)
+            if field is None:
+                continue
+            subfields = (requested or {}).get(name) or None
+            if (requested is None and expand is None) or (expand and name in expand) or subfields:
+                nested = field.child if isinstance(field, serializers.ListSerializer) else field
+                if isinstance(nested, DynamicFieldsMixin):
+                    nested._shape = (subfields, expand.get(name, {}) if expand is not None else None)
+            else:
+                many = isinstance(field, serializers.ListSerializer)
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, many=many, source=field.source)
+        return fields
+
+
+def _concrete_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def plan_queryset(model, serializer):
+    """План загрузки для сериализатора: (only, select_related, prefetch) или None.
+
+    None — форму ответа не удалось свести к полям модели
+    (свойства, методы), queryset лучше не трогать.
+    """
+    only, select, prefetch = {model._meta.pk.name}, set(), []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            sources = getattr(serializer, 'method_field_sources', {}).get(name)
+            if sources is None:
+                return None
+            only.update(sources)
+            continue
+        parts = field.source.split('.')
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        model_field = _concrete_field(model, parts[0])
+        if model_field is None:
+            return None
+
+        if (model_field.many_to_one or model_field.one_to_one) and model_field.concrete:
+            if len(parts) == 1 and not isinstance(nested, serializers.BaseSerializer):
+                only.add(model_field.attname)
+                continue
+            only.add(model_field.name)
+            select.add(model_field.name)
+            related = model_field.related_model
+            if len(parts) > 1:
+                if _concrete_field(related, parts[1]) is None or len(parts) > 2:
+                    return None
+                only.add(f'{model_field.name}__{parts[1]}')
+                continue
+            inner = plan_queryset(related, nested)
+            if inner is None:
+                return None
+            inner_only, inner_select, inner_prefetch = inner
+            if inner_select or inner_prefetch:
+                return None
+            only.update(f'{model_field.name}__{f}' for f in inner_only)
+        elif model_field.one_to_many or model_field.many_to_many:
+            # Обратному FK для раскладки по родителям нужен id родителя
+            parent_key = (model_field.field.attname,) if model_field.one_to_many else ()
+            queryset = model_field.related_model._default_manager.all()
+            if isinstance(nested, serializers.BaseSerializer):
+                queryset = shape_queryset(queryset, nested, extra_only=parent_key)
+            elif parent_key:
+                queryset = queryset.only(queryset.model._meta.pk.name, *parent_key)
+            prefetch.append(Prefetch(model_field.name, queryset=queryset))
+        else:
+            only.add(model_field.attname)
+    return only, select, prefetch
+
+
+def shape_queryset(queryset, serializer, extra_only=()):
+    """Применяет план загрузки сериализатора к queryset"""
+    plan = plan_queryset(queryset.model, serializer)
+    if plan is None:
+        return queryset
+    only, select, prefetch = plan
+    only.update(extra_only)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*only)
+
+
+class ShapedQuerysetMixin:
+    """ViewSet, загружающий только то, что попадёт в ответ list/retrieve"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        return shape_queryset(queryset, self.get_serializer())
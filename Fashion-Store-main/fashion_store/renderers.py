@@ -0,0 +1,87 @@
+"""Быстрый JSON для DRF и обычных Django-представлений.
+
+Если установлен orjson, сериализация идёт через него, иначе — через
+стандартные JSONRenderer/JSONParser DRF. Типы, которых orjson не знает,
+приводятся так же, как в DjangoJSONEncoder: Decimal — строкой, ленивые
+переводы — строкой; datetime в UTC выводится с суффиксом «Z».
+Разделители строк U+2028/U+2029 экранируются, как в JSONRenderer DRF:
+без этого JSON нельзя встроить в <script>.
+"""
+import datetime
+import decimal
+import json
+
+from django.http import HttpResponse
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson необязателен
+    orjson = None
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+LINE_SEPARATOR, PARAGRAPH_SEPARATOR = '\u2028'.encode(), '\u2029'.encode()
+
+
+def _default(obj):
+    """Типы, которые orjson не сериализует сам (как в JSONEncoder DRF)"""
+    if isinstance(obj, (decimal.Decimal, Promise)):
+        return str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):  # numpy
+        return obj.tolist()
+    if hasattr(obj, '__iter__'):  # set, QuerySet, генераторы
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(data, indent=False):
+    """Сериализует данные в JSON (bytes, UTF-8)"""
+    if orjson is None:
+        body = json.dumps(
+            data, cls=JSONEncoder, ensure_ascii=False, indent=2 if indent else None,
+        ).encode()
+    else:
+        body = orjson.dumps(data, default=_default, option=OPTIONS | (orjson.OPT_INDENT_2 if indent else 0))
+    if LINE_SEPARATOR in body or PARAGRAPH_SEPARATOR in body:
+        body = body.replace(LINE_SEPARATOR, b'\\u2028').replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+    return body
+
+
+class FastJsonResponse(HttpResponse):
+    """Аналог JsonResponse на быстром сериализаторе"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer DRF на orjson (с откатом на стандартный при его отсутствии)"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type or '', renderer_context or {})
+        return dumps(data, indent=bool(indent))
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser DRF на orjson"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -1,4 +1,5 @@
 import os
+import sys
 from datetime import timedelta
 from pathlib import Path
 
@@ -13,6 +14,8 @@ DEBUG = os.getenv("DEBUG", "True") == "True"
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "*").split(",")
 
 INSTALLED_APPS = [
+    # runserver тоже отдаёт статику через WhiteNoise, как в продакшене
+    "whitenoise.runserver_nostatic",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -35,7 +38,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    # 'whitenoise.middleware.WhiteNoiseMiddleware',
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -58,6 +61,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "cart.context_processors.cart_summary",
             ],
         },
     },
@@ -128,6 +132,19 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Медиафайлы именуются по хэшу содержимого: одинаковые загрузки не дублируются.
+# Статика при collectstatic получает хэш в имени и сжатые .gz/.br копии;
+# WhiteNoise отдаёт такие файлы с Cache-Control: max-age=315360000, immutable
+STORAGES = {
+    "default": {"BACKEND": "fashion_store.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "fashion_store.storage.StaticFilesStorage"},
+}
+# Не сжимать форматы, которые уже сжаты
+WHITENOISE_SKIP_COMPRESS_EXTENSIONS = (
+    "jpg", "jpeg", "png", "gif", "webp", "avif", "zip", "gz", "tgz", "bz2", "tbz", "xz", "br",
+    "swf", "flv", "woff", "woff2",
+)
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Sessions + CSRF
@@ -162,6 +179,15 @@ REST_FRAMEWORK = {
         "rest_framework.filters.OrderingFilter",
         "rest_framework.filters.SearchFilter",
     ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "fashion_store.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "fashion_store.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 12,
 }
@@ -228,6 +254,27 @@ CACHES = {
     }
 }
 
+# Хранилище корзин (cart.store): DatabaseCartStore — таблицы корзин,
+# RedisCartStore — хэши Redis с отложенной записью в таблицы и гостевыми
+# корзинами, LocalCartStore — то же в памяти процесса
+CART_STORE = {
+    "BACKEND": os.getenv("CART_STORE_BACKEND", "cart.store.DatabaseCartStore"),
+    "LOCATION": os.getenv("CART_REDIS_URL", "redis://redis:6379/2"),
+}
+
+# В тестах Redis недоступен — используем локальный кэш процесса
+if "test" in sys.argv:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+    # Брокера тоже нет — задачи выполняются сразу в процессе теста
+    CELERY_TASK_ALWAYS_EAGER = True
+    # Манифест статики появляется только после collectstatic
+    STORAGES["staticfiles"] = {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}
+    WHITENOISE_AUTOREFRESH = True
+
 
 # В MIDDLEWARE добавить после "django.contrib.auth.middleware.AuthenticationMiddleware"
 MIDDLEWARE += [
@@ -0,0 +1,91 @@
+"""Хранилище медиафайлов с адресацией по содержимому.
+
+Файл сохраняется под именем, равным sha256 его содержимого:
+products/3e/3e7253c4….jpg. Повторная загрузка тех же байтов не пишет
+второй копии, а возвращает уже существующее имя, поэтому у одинаковых
+изображений один URL (и одна запись в кэше CDN), а сам файл под этим
+именем никогда не меняется.
+
+Удалять такие файлы при удалении объекта нельзя — на них могут
+ссылаться другие записи. Ссылки считает catalog.media, неиспользуемые
+файлы удаляет команда media_gc.
+
+StaticFilesStorage — хранилище статики для collectstatic: хэш в имени
+файла и сжатые копии, которые WhiteNoise отдаёт с заголовком immutable.
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+HASH_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{2}/([0-9a-f]{64})(?:\.[A-Za-z0-9]+)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который именует файлы по хэшу содержимого"""
+
+    def __init__(self, **kwargs):
+        # Одинаковое имя означает одинаковое содержимое, перезапись безопасна
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Такой файл уже есть: обновляем время изменения, чтобы media_gc
+            # не удалил его, пока новая ссылка ещё не записана в БД
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+    def save_derived(self, name, content):
+        """Сохраняет файл под заданным именем (копии, производные от другого файла).
+
+        Имя таких файлов определяется исходным файлом, а он неизменяем,
+        поэтому хэш содержимого для них не нужен.
+        """
+        return super().save(name, content)
+
+    @staticmethod
+    def content_name(name, content):
+        """Имя по содержимому: каталог загрузки / 2 первых символа хэша / хэш.расширение"""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        value = digest.hexdigest()
+        directory = posixpath.dirname(str(name).replace('\\', '/'))
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, value[:2], value + extension)
+
+    @staticmethod
+    def is_content_name(name):
+        """True, если имя уже получено из хэша содержимого"""
+        return bool(HASH_NAME_RE.search(name or ''))
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """Статика с хэшем в имени и заранее сжатыми .gz/.br копиями (WhiteNoise).
+
+    Ссылки из CSS на отсутствующие файлы (в vendor.css остались ссылки на
+    картинки colorbox) оставляются как есть, а не прерывают collectstatic.
+    """
+
+    def url_converter(self, name, hashed_files, template=None):
+        convert = super().url_converter(name, hashed_files, template)
+
+        def converter(matchobj):
+            try:
+                return convert(matchobj)
+            except ValueError:
+                return matchobj.group(0)
+
+        return converter
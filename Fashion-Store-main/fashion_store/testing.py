@@ -0,0 +1,34 @@
+"""Общие помощники для тестов приложений."""
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class AdminChangelistQueriesMixin:
+    """Проверка, что changelist админки делает одинаковое число запросов
+    при любом числе строк на странице (см. fashion_store.admin_mixins).
+
+    Входит суперпользователь; тест передаёт url и add_rows(count) —
+    функцию, добавляющую count строк changelist'а.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.admin = get_user_model().objects.create_superuser(email='admin@example.com', password='pass')
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, url, params=None):
+        """(число запросов, ответ) для страницы changelist"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def assert_queries_do_not_grow(self, url, add_rows, few=2, more=10):
+        """Сравнивает число запросов для few и few + more строк; возвращает второй ответ"""
+        add_rows(few)
+        before, _ = self.changelist_queries(url)
+        add_rows(more)
+        after, response = self.changelist_queries(url)
+        self.assertEqual(before, after)
+        return response
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, OuterRef
+from fashion_store.admin_mixins import AnnotatedAdminMixin, annotated_display, subquery_count
+from .exports import export_order_lines
 from .models import Order, OrderItem, Coupon
 
 class OrderItemInline(admin.TabularInline):
@@ -66,8 +68,12 @@ class CouponAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related()
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(AnnotatedAdminMixin, admin.ModelAdmin):
     """Административная панель для заказов"""
+
+    list_annotations = {
+        'items_total': subquery_count(OrderItem.objects.filter(order=OuterRef('pk'))),
+    }
     
     list_display = (
         'order_number', 'user', 'get_status_display_ru', 'get_payment_status_display_ru',
@@ -124,7 +130,10 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['mark_as_processing', 'mark_as_shipped', 'mark_as_delivered', 'mark_as_cancelled']
+    actions = [
+        'mark_as_processing', 'mark_as_shipped', 'mark_as_delivered', 'mark_as_cancelled',
+        'export_order_lines_csv', 'export_order_lines_jsonl',
+    ]
     
     @admin.display(description=_('Статус'))
     def get_status_display_ru(self, obj):
@@ -156,10 +165,9 @@ class OrderAdmin(admin.ModelAdmin):
             obj.total_amount
         )
     
-    @admin.display(description=_('Количество товаров'))
-    def get_items_count(self, obj):
+    @annotated_display('items_total', fallback='get_items_count', description=_('Количество товаров'))
+    def get_items_count(self, obj, count):
         """Возвращает количество товаров в заказе"""
-        count = obj.get_items_count()
         if count > 0:
             return format_html(
                 '<a href="{}?order__id__exact={}">{}</a>',
@@ -214,6 +222,16 @@ class OrderAdmin(admin.ModelAdmin):
         updated = queryset.update(status='cancelled')
         self.message_user(request, f'{updated} заказов отмечено как "Отменен"')
 
+    @admin.action(description=_('Выгрузить позиции в CSV'))
+    def export_order_lines_csv(self, request, queryset):
+        """Выгружает позиции выбранных заказов с данными товаров"""
+        return export_order_lines(queryset, 'csv')
+
+    @admin.action(description=_('Выгрузить позиции в JSONL'))
+    def export_order_lines_jsonl(self, request, queryset):
+        """Выгружает позиции выбранных заказов в JSON Lines"""
+        return export_order_lines(queryset, 'jsonl')
+
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     """Административная панель для товаров в заказах"""
@@ -1,10 +1,13 @@
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from decimal import Decimal
-from .models import Order, OrderItem, Coupon
-from cart.models import Cart
+from django.utils.dateparse import parse_date
+from .models import Order, Coupon
+from .services import CouponUnavailableError, EmptyCartError, OutOfStockError, place_order
+from .exports import export_order_lines
 from .serializers import OrderSerializer, CouponSerializer
+from fashion_store.dynamic_fields import ShapedQuerysetMixin
+from fashion_store.exports import FORMATS as EXPORT_FORMATS
 
 class IsAdminOrOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -12,7 +15,7 @@ class IsAdminOrOwner(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_authenticated
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ShapedQuerysetMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAdminOrOwner]
 
@@ -21,31 +24,40 @@ class OrderViewSet(viewsets.ModelViewSet):
             return Order.objects.all().order_by('-created_at')
         return Order.objects.filter(user=self.request.user).order_by('-created_at')
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """Потоковая выгрузка позиций заказов (?output=csv|jsonl&created_from=&created_to=)"""
+        params = request.query_params
+        output = params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'detail': f'output: {", ".join(EXPORT_FORMATS)}'}, status=400)
+        orders = self.get_queryset()
+        for param, lookup in (('created_from', 'created_at__date__gte'), ('created_to', 'created_at__date__lte')):
+            if params.get(param):
+                try:
+                    value = parse_date(params[param])
+                except ValueError:
+                    value = None
+                if value is None:
+                    return Response({'detail': f'{param}: ожидается дата ГГГГ-ММ-ДД'}, status=400)
+                orders = orders.filter(**{lookup: value})
+        return export_order_lines(orders, output)
+
     @action(detail=False, methods=['post'])
     def create_from_cart(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        items = cart.items.select_related('variant').all()
-        if not items:
+        try:
+            order = place_order(request.user, status='placed', payment_status='paid')
+        except EmptyCartError:
             return Response({'detail':'Cart empty'}, status=400)
-        subtotal = sum([i.subtotal for i in items], Decimal('0.00'))
-        coupon = None
-        discount = Decimal('0.00')
-        if cart.coupon_code:
-            coupon = Coupon.objects.filter(code__iexact=cart.coupon_code, active=True).first()
-            if coupon:
-                discount = coupon.apply(subtotal)
-        total = max(Decimal('0.00'), subtotal - discount)
-        order = Order.objects.create(user=request.user, coupon=coupon, total_amount=total, status='paid', tracking_number=f"TRK{self.request.user.id}{order.id if hasattr(order,'id') else ''}")
-        for it in items:
-            OrderItem.objects.create(order=order, variant=it.variant, quantity=it.quantity, price=it.variant.price)
-            it.variant.stock = max(0, it.variant.stock - it.quantity)
-            it.variant.save()
-        cart.items.all().delete()
-        cart.coupon_code = ''
-        cart.save()
+        except OutOfStockError as exc:
+            return Response({'detail': str(exc), 'variants': [variant.pk for variant, *_ in exc.variants]}, status=409)
+        except CouponUnavailableError as exc:
+            return Response({'detail': str(exc), 'coupon': exc.code}, status=409)
+        order.tracking_number = f"TRK{request.user.id}{order.id}"
+        order.save(update_fields=['tracking_number', 'updated_at'])
         return Response(OrderSerializer(order).data, status=201)
 
-class CouponViewSet(viewsets.ModelViewSet):
+class CouponViewSet(ShapedQuerysetMixin, viewsets.ModelViewSet):
     queryset = Coupon.objects.all()
     serializer_class = CouponSerializer
     permission_classes = [permissions.IsAdminUser]
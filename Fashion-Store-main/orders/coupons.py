@@ -0,0 +1,110 @@
+"""Поиск купонов по коду и учёт их использования.
+
+Код купона сравнивается без учёта регистра по UPPER(code) — для этого в
+таблице есть функциональный индекс. Найденные купоны (и ненайденные
+коды) хранятся в памяти процесса: корзина и оформление заказа читают их
+на каждом запросе. Записи привязаны к поколению 'coupons' в общем кэше,
+которое увеличивают сигналы купонов, поэтому правка купона в админке
+видна всем процессам. Срок действия и лимит проверяются при каждом
+обращении, а не при загрузке.
+
+Использование купона учитывается одним условным UPDATE
+(used_count = used_count + 1 WHERE used_count < max_uses и купон
+действует) без чтения строки и без select_for_update: СУБД проверяет
+условие при записи, и лимит не будет превышен при одновременных
+заказах. place_order выполняет его последним запросом транзакции заказа,
+так что строка купона заблокирована только до коммита и заказы по
+популярному купону не выстраиваются в очередь на всё время оформления.
+"""
+import threading
+
+from django.db.models import F, Q
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+from fashion_store.cache import get_generation, invalidate
+from .models import Coupon
+
+COUPONS_GENERATION = 'coupons'
+# Неизвестные коды тоже запоминаются — не даём перебором раздуть память
+MAX_CACHED_CODES = 1000
+
+_cache = {'generation': None, 'coupons': {}}
+_lock = threading.Lock()
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+def _cached(generation):
+    with _lock:
+        if _cache['generation'] != generation or len(_cache['coupons']) > MAX_CACHED_CODES:
+            _cache['generation'] = generation
+            _cache['coupons'] = {}
+        return _cache['coupons']
+
+
+def resolve_coupons(codes, now=None):
+    """{нормализованный код: купон} для действующих сейчас купонов"""
+    codes = {normalize_code(code) for code in codes} - {''}
+    if not codes:
+        return {}
+    generation = get_generation(COUPONS_GENERATION)
+    cached = _cached(generation)
+    missing = codes - cached.keys()
+    if missing:
+        found = {
+            coupon.normalized_code: coupon
+            for coupon in Coupon.objects.annotate(normalized_code=Upper('code')).filter(normalized_code__in=missing)
+        }
+        loaded = {code: found.get(code) for code in missing}
+        with _lock:
+            if _cache['generation'] == generation:
+                cached.update(loaded)
+        cached = {**cached, **loaded}
+    now = now or timezone.now()
+    return {
+        code: cached[code]
+        for code in codes
+        if cached.get(code) is not None and cached[code].can_use(now)
+    }
+
+
+def resolve_coupon(code, now=None):
+    """Действующий купон по коду или None"""
+    return resolve_coupons([code], now).get(normalize_code(code))
+
+
+def redeemable(now=None):
+    """Условие на строку купона: купон действует и лимит не исчерпан"""
+    now = now or timezone.now()
+    return (
+        Q(active=True)
+        & (Q(valid_from__isnull=True) | Q(valid_from__lte=now))
+        & (Q(valid_until__isnull=True) | Q(valid_until__gte=now))
+        & (Q(max_uses__isnull=True) | Q(max_uses=0) | Q(used_count__lt=F('max_uses')))
+    )
+
+
+def redeem(coupon, deactivate=False, now=None):
+    """Учитывает использование купона; False — купон больше не действует.
+
+    deactivate — одноразовый купон: отключается тем же UPDATE, поэтому
+    его не смогут использовать два заказа одновременно.
+    """
+    now = now or timezone.now()
+    changes = {'used_count': F('used_count') + 1, 'updated_at': now}
+    if deactivate:
+        changes['active'] = False
+    redeemed = Coupon.objects.filter(redeemable(now), pk=coupon.pk).update(**changes) == 1
+    if deactivate or not redeemed:
+        # UPDATE не вызывает сигналы: отключённый или исчерпанный купон
+        # не должен дальше находиться из памяти процессов
+        coupons_changed()
+    return redeemed
+
+
+def coupons_changed():
+    """Сбрасывает купоны в памяти всех процессов"""
+    invalidate(COUPONS_GENERATION)
@@ -0,0 +1,37 @@
+"""Выгрузка заказов: строка на позицию заказа с данными заказа, варианта и товара"""
+from django.db.models import F
+
+from fashion_store.exports import export_response
+from .models import OrderItem
+
+ORDER_LINE_EXPORT_COLUMNS = (
+    ('order_id', 'order_id'),
+    ('order_number', 'order__order_number'),
+    ('created_at', 'order__created_at'),
+    ('status', 'order__status'),
+    ('payment_status', 'order__payment_status'),
+    ('user_email', 'order__user__email'),
+    ('coupon', 'order__coupon__code'),
+    ('order_subtotal', 'order__subtotal'),
+    ('order_discount', 'order__discount_amount'),
+    ('order_shipping', 'order__shipping_cost'),
+    ('order_total', 'order__total_amount'),
+    ('item_id', 'id'),
+    ('product_id', 'variant__product_id'),
+    ('product_external_id', 'variant__product__external_id'),
+    ('product_name', 'variant__product__name'),
+    ('category', 'variant__product__category__slug'),
+    ('variant_id', 'variant_id'),
+    ('sku', 'variant__sku'),
+    ('size', 'variant__size'),
+    ('color', 'variant__color'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+    ('line_total', F('price') * F('quantity')),
+)
+
+
+def export_order_lines(orders, fmt):
+    """Потоковая выгрузка позиций заказов из queryset заказов"""
+    queryset = OrderItem.objects.filter(order__in=orders.values('pk')).order_by('order_id', 'id')
+    return export_response(queryset, ORDER_LINE_EXPORT_COLUMNS, fmt, 'order_lines')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:25
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_alter_coupon_options_alter_order_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(django.db.models.functions.text.Upper('code'), name='orders_coupon_code_upper_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
 from accounts.models import User
@@ -109,6 +111,10 @@ class Coupon(models.Model):
         verbose_name_plural = _("Купоны")
         ordering = ['-created_at']
         db_table = 'orders_coupon'
+        indexes = [
+            # Код ищется без учёта регистра (orders.coupons)
+            models.Index(Upper('code'), name='orders_coupon_code_upper_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.code})"
@@ -128,20 +134,26 @@ class Coupon(models.Model):
         
         return Decimal('0.00')
 
-    def can_use(self):
+    def can_use(self, now=None):
         """Проверяет, можно ли использовать купон"""
         if not self.active:
             return False
         
+        now = now or timezone.now()
+        if self.valid_from and now < self.valid_from:
+            return False
+        if self.valid_until and now > self.valid_until:
+            return False
+        
         if self.max_uses and self.used_count >= self.max_uses:
             return False
         
         return True
 
     def increment_usage(self):
-        """Увеличивает счетчик использований"""
-        self.used_count += 1
-        self.save()
+        """Увеличивает счетчик использований, если лимит ещё не исчерпан"""
+        from .coupons import redeem
+        return redeem(self)
 
 class Order(models.Model):
     """Модель заказа"""
@@ -1,19 +1,22 @@
 from rest_framework import serializers
 from .models import Order, OrderItem, Coupon
 from catalog.serializers import ProductVariantSerializer
+from fashion_store.dynamic_fields import DynamicFieldsMixin
 
-class CouponSerializer(serializers.ModelSerializer):
+class CouponSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Coupon
         fields = ['id','code','discount_percent','active']
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('variant',)
     variant = ProductVariantSerializer(read_only=True)
     class Meta:
         model = OrderItem
         fields = ['id','variant','quantity','price']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = ('items',)
     items = OrderItemSerializer(many=True, read_only=True)
     class Meta:
         model = Order
@@ -0,0 +1,212 @@
+"""Оформление заказа из корзины.
+
+place_order() выполняет оформление одной транзакцией и фиксированным
+числом запросов, сколько бы строк ни было в корзине:
+
+* остатки проверяются и списываются одним UPDATE с условием
+  stock >= количество (CASE по id варианта). Условие проверяется СУБД
+  при записи строки, поэтому два покупателя не могут купить одну и ту
+  же последнюю единицу: второй UPDATE не найдёт подходящей строки;
+* позиции заказа создаются одним bulk_create;
+* корзина очищается одним DELETE.
+
+Если на какой-то вариант остатка не хватило, транзакция откатывается
+целиком и выбрасывается OutOfStockError со списком таких вариантов.
+
+Купон ищется через orders.coupons (без обращения к БД, если он уже в
+памяти процесса), а его использование учитывается последним запросом
+транзакции — см. orders.coupons.redeem.
+
+Резервы корзины (cart.reservations) при оформлении переходят в продажу:
+строки, покрытые своим резервом, списываются без учёта чужих резервов,
+остальные — только если остаток покрывает и их.
+
+UPDATE и bulk_create не вызывают сигналы моделей, поэтому кэши
+вариантов, фасеты и фрагменты сбрасываются явно после коммита.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from catalog import facets, fragments
+from catalog.cache import product_details_changed
+from catalog.models import ProductVariant
+from catalog.sales import record_sales
+from catalog.variants import invalidate_variant_matrices
+from cart import reservations
+from cart.models import Cart
+from cart.store import get_store, user_owner
+from cart.summary import cart_changed
+from .coupons import redeem, resolve_coupon
+from .models import Order, OrderItem
+
+
+class CheckoutError(Exception):
+    """Заказ не может быть оформлен"""
+
+
+class EmptyCartError(CheckoutError):
+    """В корзине нет товаров"""
+
+    def __str__(self):
+        return 'Cart is empty'
+
+
+class OutOfStockError(CheckoutError):
+    """Остатка не хватает; variants — [(вариант, запрошено, доступно)]"""
+
+    def __init__(self, variants):
+        super().__init__(variants)
+        self.variants = variants
+
+    def __str__(self):
+        return 'Недостаточно товара на складе: ' + ', '.join(
+            f'{variant.product.name} ({variant.get_display_name()}) — доступно {available}, в корзине {quantity}'
+            for variant, quantity, available in self.variants
+        )
+
+
+class CouponUnavailableError(CheckoutError):
+    """Купон закончился или перестал действовать во время оформления"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+    def __str__(self):
+        return f'Купон {self.code} больше не действует'
+
+
+def _by_variant(quantities):
+    """CASE id WHEN … THEN количество END для UPDATE по нескольким вариантам"""
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def decrement_stock(quantities, required=None):
+    """Списывает остатки {id варианта: количество}, если их хватает на все строки.
+
+    required — {id варианта: минимальный остаток для списания}, по
+    умолчанию равен количеству. Возвращает True, если списано всё; иначе
+    вызывающий должен откатить транзакцию.
+    """
+    needed = _by_variant(quantities)
+    updated = ProductVariant.objects.filter(pk__in=quantities, stock__gte=_by_variant(required or quantities)).update(
+        stock=F('stock') - needed,
+        updated_at=timezone.now(),
+    )
+    return updated == len(quantities)
+
+
+def _short_variants(quantities, required):
+    """Строки, на которые не хватило остатка: [(вариант, запрошено, доступно)].
+
+    required — те же минимальные остатки, что и при списании: доступно
+    остаток за вычетом резервов других корзин.
+    """
+    variants = ProductVariant.objects.filter(pk__in=quantities).select_related('product')
+    return [
+        (variant, quantities[variant.pk], max(0, variant.stock - (required[variant.pk] - quantities[variant.pk])))
+        for variant in variants
+        if variant.stock < required[variant.pk]
+    ]
+
+
+def stock_changed(product_ids):
+    """Сбрасывает кэши, зависящие от остатков (после коммита)"""
+    product_ids = list(product_ids)
+
+    def invalidate():
+        invalidate_variant_matrices(product_ids)
+        fragments.invalidate_products(product_ids)
+        facets.products_changed(product_ids)
+        product_details_changed()
+
+    transaction.on_commit(invalidate)
+
+
+class _StockConflict(Exception):
+    pass
+
+
+def _required_stock(cart, quantities):
+    """Минимальный остаток для списания каждой строки с учётом резервов.
+
+    Строку, покрытую резервом корзины, можно списать из остатка целиком;
+    для остальных остаток должен покрыть ещё и резервы других корзин.
+    """
+    held = reservations.claim(cart.pk)
+    uncovered = [pk for pk, quantity in quantities.items() if held.get(pk, 0) < quantity]
+    held_by_all = reservations.held_quantities(uncovered)
+    return {
+        pk: quantity if pk not in held_by_all else quantity + max(0, held_by_all[pk] - held.get(pk, 0))
+        for pk, quantity in quantities.items()
+    }
+
+
+def place_order(user, cart=None, *, address=None, tracking_number='', status='placed',
+                payment_status='pending', deactivate_coupon=False):
+    """Оформляет заказ из корзины пользователя и возвращает его.
+
+    deactivate_coupon — купон одноразовый и отключается после заказа.
+    Использование купона учитывается условным UPDATE (orders.coupons.redeem);
+    если лимит исчерпан, заказ откатывается с CouponUnavailableError.
+    """
+    # Корзина читается из таблиц — сначала записываем изменения из хранилища корзин;
+    # до forget() отложенная запись (flush_carts) эту корзину не трогает
+    store, owner = get_store(), user_owner(user.pk)
+    with store.locked(owner):
+        persisted = store.persist(owner)
+        cart = cart or Cart.objects.get_or_create(user=user)[0]
+        quantities = required = {}
+        try:
+            with transaction.atomic():
+                items = list(cart.items.select_related('variant'))
+                if not items:
+                    raise EmptyCartError()
+                quantities = {item.variant_id: item.quantity for item in items}
+                required = _required_stock(cart, quantities)
+                if not decrement_stock(quantities, required):
+                    raise _StockConflict()
+
+                subtotal = sum((item.variant.price * item.quantity for item in items), Decimal('0.00'))
+                coupon = resolve_coupon(cart.coupon_code) if cart.coupon_code else None
+                discount = coupon.apply(subtotal) if coupon else Decimal('0.00')
+                if not discount:
+                    coupon = None
+
+                order = Order.objects.create(
+                    user=user,
+                    coupon=coupon,
+                    subtotal=subtotal,
+                    discount_amount=discount,
+                    total_amount=max(Decimal('0.00'), subtotal - discount),
+                    status=status,
+                    payment_status=payment_status,
+                    tracking_number=tracking_number,
+                    address=address,
+                )
+                order_items = OrderItem.objects.bulk_create([
+                    OrderItem(order=order, variant=item.variant, quantity=item.quantity, price=item.variant.price)
+                    for item in items
+                ])
+                record_sales(order_items)
+
+                # Строки, добавленные в корзину во время оформления, остаются в ней
+                cart.items.filter(pk__in=[item.pk for item in items]).delete()
+                Cart.objects.filter(pk=cart.pk).update(coupon_code='')
+                cart.coupon_code = ''
+                cart_changed(cart.user_id)
+                stock_changed({item.variant.product_id for item in items})
+
+                # Последним запросом: строка купона заблокирована только до коммита
+                if coupon and not redeem(coupon, deactivate=deactivate_coupon):
+                    raise CouponUnavailableError(coupon.code)
+        except _StockConflict:
+            raise OutOfStockError(_short_variants(quantities, required)) from None
+        store.forget(owner, persisted)
+    return order
@@ -0,0 +1,211 @@
+import csv
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User, UserAddress
+from cart.models import Cart, CartItem
+from catalog.models import Category, Product, ProductVariant
+from fashion_store.testing import AdminChangelistQueriesMixin
+from .coupons import redeem, resolve_coupon
+from .models import Coupon, Order, OrderItem
+from .services import CouponUnavailableError, OutOfStockError, place_order
+
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Одежда", slug="clothes")
+        product = Product.objects.create(name="Футболка", category=category, base_price=Decimal("999.00"))
+        variant = ProductVariant.objects.create(product=product, size="M", color="Red", price=Decimal("999.00"), sku="A-1-M")
+        self.customer = User.objects.create_user(email="buyer@example.com", password="pass")
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="pass")
+        self.order = Order.objects.create(user=self.customer, total_amount=Decimal("1998.00"))
+        OrderItem.objects.create(order=self.order, variant=variant, quantity=2, price=Decimal("999.00"))
+
+    def test_api_csv_export(self):
+        self.client.force_login(self.admin)
+        response = self.client.get("/api/orders/export/", {"output": "csv"})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode("utf-8-sig"))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["order_number"], self.order.order_number)
+        self.assertEqual(rows[0]["user_email"], "buyer@example.com")
+        self.assertEqual((rows[0]["sku"], rows[0]["product_name"]), ("A-1-M", "Футболка"))
+        self.assertEqual(Decimal(rows[0]["line_total"]), Decimal("1998.00"))
+
+    def test_export_filters_and_permissions(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get("/api/orders/export/").status_code, 403)
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get("/api/orders/export/", {"created_to": "2000-01-01"}).status_code, 200)
+        self.assertEqual(self.client.get("/api/orders/export/", {"created_to": "2000-02-30"}).status_code, 400)
+        response = self.client.get("/api/orders/export/", {"created_to": "2000-01-01", "output": "jsonl"})
+        self.assertEqual(b"".join(response.streaming_content), b"")
+
+    def test_admin_action(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse("admin:orders_order_changelist"), {
+            "action": "export_order_lines_jsonl", "_selected_action": [self.order.pk],
+        })
+        line = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(line["quantity"], 2)
+
+
+class OrderAdminChangelistTest(AdminChangelistQueriesMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(name="Одежда", slug="clothes")
+        product = Product.objects.create(name="Футболка", category=category, base_price=Decimal("999.00"))
+        self.variant = ProductVariant.objects.create(product=product, size="M", color="Red", price=Decimal("999.00"))
+
+    def add_orders(self, count):
+        for i in range(count):
+            customer = User.objects.create_user(email=f"buyer{User.objects.count()}@example.com", password="pass")
+            order = Order.objects.create(user=customer, total_amount=Decimal("1998.00"))
+            OrderItem.objects.create(order=order, variant=self.variant, quantity=1, price=Decimal("999.00"))
+            OrderItem.objects.create(order=order, variant=self.variant, quantity=1, price=Decimal("999.00"))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        response = self.assert_queries_do_not_grow(reverse("admin:orders_order_changelist"), self.add_orders)
+        self.assertEqual({order.items_total for order in response.context["cl"].result_list}, {2})
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Одежда", slug="clothes")
+        self.customer = User.objects.create_user(email="buyer@example.com", password="pass")
+        self.cart = Cart.objects.create(user=self.customer)
+
+    def add_lines(self, count, stock=5, quantity=2):
+        variants = []
+        for i in range(count):
+            product = Product.objects.create(name=f"Товар {i}", category=self.category, base_price=Decimal("100.00"))
+            variant = ProductVariant.objects.create(
+                product=product, size="M", color="Red", price=Decimal("100.00"), stock=stock
+            )
+            CartItem.objects.create(cart=self.cart, variant=variant, quantity=quantity)
+            variants.append(variant)
+        return variants
+
+    def checkout_queries(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            order = place_order(self.customer)
+        return len(queries), order
+
+    def test_order_is_placed_with_constant_queries(self):
+        self.add_lines(1)
+        few, _ = self.checkout_queries()
+        variants = self.add_lines(6)
+        many, order = self.checkout_queries()
+        self.assertEqual(few + 5, many)  # record_sales обновляет статистику по товару
+        self.assertEqual(order.items.count(), 6)
+        self.assertEqual(order.total_amount, Decimal("1200.00"))
+        self.assertEqual({v.stock for v in ProductVariant.objects.filter(pk__in=[v.pk for v in variants])}, {3})
+        self.assertFalse(self.cart.items.exists())
+
+    def test_insufficient_stock_rolls_back_everything(self):
+        enough, short = self.add_lines(2, stock=2, quantity=2)
+        ProductVariant.objects.filter(pk=short.pk).update(stock=1)
+        with self.assertRaises(OutOfStockError) as error:
+            place_order(self.customer)
+        self.assertEqual([(v.pk, q, a) for v, q, a in error.exception.variants], [(short.pk, 2, 1)])
+        enough.refresh_from_db()
+        self.assertEqual(enough.stock, 2)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_last_unit_is_sold_once(self):
+        variant, = self.add_lines(1, stock=1, quantity=1)
+        other = User.objects.create_user(email="other@example.com", password="pass")
+        CartItem.objects.create(cart=Cart.objects.create(user=other), variant=variant, quantity=1)
+        place_order(self.customer)
+        with self.assertRaises(OutOfStockError):
+            place_order(other)
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock, 0)
+
+    def test_api_and_web_checkout(self):
+        self.add_lines(1, stock=4, quantity=2)
+        self.client.force_login(self.customer)
+        response = self.client.post("/api/orders/create_from_cart/")
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.tracking_number, f"TRK{self.customer.id}{order.id}")
+        self.assertEqual(self.client.post("/api/orders/create_from_cart/").status_code, 400)
+
+        Coupon.objects.create(code="ONCE", name="Разовый", discount_percent=10)
+        self.add_lines(1, stock=4, quantity=3)
+        Cart.objects.filter(pk=self.cart.pk).update(coupon_code="once")
+        address = UserAddress.objects.create(user=self.customer, address_line="ул. Ленина, 1", city="Москва")
+        response = self.client.post(reverse("checkout"), {"address_id": address.pk})
+        order = Order.objects.latest("id")
+        self.assertRedirects(response, f"/orders/{order.id}/", fetch_redirect_response=False)
+        self.assertEqual(order.total_amount, Decimal("270.00"))
+        self.assertFalse(Coupon.objects.get().active)
+
+
+class CouponTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.coupon = Coupon.objects.create(code="Sale10", name="Скидка", discount_percent=10)
+
+    def test_lookup_is_case_insensitive_and_cached(self):
+        self.assertEqual(resolve_coupon(" sale10 "), self.coupon)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_coupon("SALE10"), self.coupon)
+            self.assertIsNone(resolve_coupon(""))
+        self.coupon.active = False
+        self.coupon.save()
+        self.assertIsNone(resolve_coupon("sale10"))
+
+    def test_validity_window_is_enforced(self):
+        now = timezone.now()
+        Coupon.objects.filter(pk=self.coupon.pk).update(valid_until=now - timedelta(days=1))
+        self.assertFalse(redeem(self.coupon, now=now))
+        self.coupon.valid_from = now + timedelta(days=1)
+        self.coupon.valid_until = None
+        self.coupon.save()
+        self.assertIsNone(resolve_coupon("sale10", now=now))
+        self.assertEqual(resolve_coupon("sale10", now=now + timedelta(days=2)), self.coupon)
+
+    def test_redemption_respects_max_uses(self):
+        self.coupon.max_uses = 2
+        self.coupon.save()
+        self.assertEqual([redeem(self.coupon) for _ in range(3)], [True, True, False])
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 2)
+        self.assertFalse(self.coupon.can_use())
+
+    def test_exhausted_coupon_rolls_back_order(self):
+        customer = User.objects.create_user(email="buyer@example.com", password="pass")
+        product = Product.objects.create(
+            name="Футболка", category=Category.objects.create(name="Одежда", slug="clothes"),
+            base_price=Decimal("100.00"),
+        )
+        variant = ProductVariant.objects.create(product=product, size="M", color="Red", price=Decimal("100.00"), stock=5)
+        cart = Cart.objects.create(user=customer, coupon_code="sale10")
+        CartItem.objects.create(cart=cart, variant=variant, quantity=1)
+        self.coupon.max_uses = 1
+        self.coupon.save()
+        resolve_coupon("sale10")
+        # Последнее использование забрал другой заказ: купон в памяти ещё выглядит действующим
+        Coupon.objects.filter(pk=self.coupon.pk).update(used_count=1)
+        with self.assertRaises(CouponUnavailableError):
+            place_order(customer)
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+        Coupon.objects.filter(pk=self.coupon.pk).update(max_uses=2)
+        order = place_order(customer)
+        self.assertEqual((order.coupon, order.discount_amount), (self.coupon, Decimal("10.00")))
+        self.assertEqual(Coupon.objects.get().used_count, 2)